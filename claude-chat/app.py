@@ -5,42 +5,148 @@ Now supports manual configuration commands for optimal performance
 Phase 1: Added local LLM (Qwen2.5 14B + Coder) with manual toggle
 """
 
-from flask import Flask, request, render_template, jsonify, session, send_file
+from flask import (
+    Flask, request, render_template, jsonify, session,
+    Response, stream_with_context, g
+)
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SecureCookieSessionInterface
 from anthropic import Anthropic
 import os
+import json
 import logging
 from datetime import datetime, timedelta
+import functools
 from functools import wraps
-import tempfile
 from dotenv import load_dotenv
 import re
+import threading
+import time
+import hmac
+import random
+
+# Taken early in the import so worker cold starts can be reported
+PROCESS_STARTED = time.time()
 
 # Import local LLM components
-from llm.local_client import LocalLLMClient
+from llm.local_client import NUM_CTX, get_local_client
 from llm.router import ModelRouter
+from llm.latency_tracker import LatencyTracker
+from llm.context_manager import ContextWindowManager
+from llm.prompt_cache import apply_cache_breakpoints, cache_usage
+from llm.health_prober import HealthProber
+from llm.circuit_breaker import CircuitBreaker
+from llm.single_flight import SingleFlight
+from llm.admission import AdmissionQueue, QueueFullError
+from llm.residency import ModelResidency
+from llm.race import RaceFailedError, race
+from llm.cancellation import Cancelled, CancellationRegistry
+from llm.discovery import BackendDiscovery
+from llm.backend_pool import OllamaPool, parse_endpoints
+from llm.batch import parse_batch, run_batch, summarize
+from llm.commands import CommandDispatcher, advice_intent
+from llm import timing
+from storage.conversation_store import ConversationStore
+from storage.response_cache import ResponseCache, make_cache_key
+from storage.rate_limiter import TokenBucketLimiter
+from storage.metrics_store import MetricsStore
+from storage.cancel_store import CancelStore
+from storage.export import EXPORT_FORMATS
+from log_pipeline import configure_logging
 
 # Load environment variables
 load_dotenv()
 
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions whose serialization shows up in Server-Timing"""
+    
+    def save_session(self, app, session, response):
+        with timing.span('session'):
+            super().save_session(app, session, response)
+        # The header is written before Flask saves the session; redo it
+        timings = timing.current()
+        if timings and 'Server-Timing' in response.headers:
+            response.headers['Server-Timing'] = timings.header()
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON responses whose encoding shows up in Server-Timing"""
+    
+    def response(self, *args, **kwargs):
+        with timing.span('json'):
+            return super().response(*args, **kwargs)
+
+
 # Initialize Flask with secret key for sessions
 app = Flask(__name__)
+app.session_interface = TimedSessionInterface()
+app.json = TimedJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
 app.config['SESSION_COOKIE_SECURE'] = True  # HTTPS only
 app.config['SESSION_COOKIE_HTTPONLY'] = True  # No JavaScript access
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # CSRF protection
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=2)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/chat_app.log'),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging: JSON lines written by a background thread
+# (LOG_PIPELINE=sync restores the old blocking handlers)
+log_writer = configure_logging('logs/chat_app.log')
 logger = logging.getLogger(__name__)
 
+# Opt-in profiling of slow requests in production: a request sending
+# X-Profile: <PROFILE_TOKEN> is profiled (PROFILE_SAMPLE_RATE of them) and
+# the dump is written under PROFILE_DIR; PROFILER=pyinstrument if installed
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '1.0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'logs/profiles')
+PROFILER = os.getenv('PROFILER', 'cprofile')
+
+
+def dump_profile(profiler):
+    """Write a finished request profile; returns its path, or None on failure"""
+    try:
+        return profiler.stop_and_dump(PROFILE_DIR, request.endpoint or 'unknown')
+    except Exception as e:
+        logger.error(f"Failed to write request profile: {e}")
+        return None
+
+
+@app.before_request
+def start_request_timing():
+    """Collect Server-Timing spans, and profile the request if it asked to be"""
+    timing.start_request()
+    token = request.headers.get('X-Profile')
+    if (PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN)
+            and random.random() < PROFILE_SAMPLE_RATE):
+        profiler = timing.RequestProfiler(PROFILER)
+        try:
+            profiler.start()
+            g.profiler = profiler
+        except ValueError as e:
+            # cProfile allows one active profiler per thread
+            logger.warning(f"Request not profiled: {e}")
+
+
+@app.after_request
+def add_server_timing(response):
+    timings = timing.current()
+    if timings:
+        response.headers['Server-Timing'] = timings.header()
+    
+    # Streams are still generating here; their profile is written at teardown
+    if 'profiler' in g and not response.is_streamed:
+        path = dump_profile(g.pop('profiler'))
+        if path:
+            response.headers['X-Profile-Dump'] = os.path.basename(path)
+    return response
+
+
+@app.teardown_request
+def finish_request_timing(exc):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        dump_profile(profiler)
+    timing.end_request()
+
 # Initialize Anthropic client
 try:
     client = Anthropic(api_key=os.environ.get('ANTHROPIC_API_KEY'))
@@ -49,42 +155,254 @@ except Exception as e:
     logger.error(f"Failed to initialize Claude API client: {e}")
     client = None
 
-# Initialize Local LLM client
+# Milliseconds from import to each startup stage, for /health
+startup_ms = {}
+
+# Several Ollama servers ("host:port,host:port") share local traffic;
+# without the list, one server is found at OLLAMA_HOST or the bridge IP
+OLLAMA_ENDPOINTS = parse_endpoints(
+    os.getenv('OLLAMA_ENDPOINTS', ''), int(os.getenv("OLLAMA_PORT", "11434"))
+)
+
+# Local LLM client and node pool, published by the background discovery
+# below once Ollama answers; until then requests routed locally fall back to Claude
 local_client = None
-try:
-    # Allow override via env; default to host.docker.internal (if mapped)
-    ollama_host = os.getenv("OLLAMA_HOST", "host.docker.internal")
-    ollama_port = int(os.getenv("OLLAMA_PORT", "11434"))
-
-    # First attempt
-    local_client = LocalLLMClient(
-        host=ollama_host,
-        port=ollama_port,
-        model="qwen2.5:14b"
+local_pool = None
+local_discovery = BackendDiscovery(
+    candidates=OLLAMA_ENDPOINTS or [
+        # Allow override via env; default to host.docker.internal (if mapped)
+        (os.getenv("OLLAMA_HOST", "host.docker.internal"), int(os.getenv("OLLAMA_PORT", "11434"))),
+        # Docker bridge gateway on Linux
+        ("172.17.0.1", int(os.getenv("OLLAMA_PORT", "11434")))
+    ],
+    model="qwen2.5:14b",
+    retry_max_seconds=float(os.getenv('OLLAMA_DISCOVERY_RETRY_MAX', '60')),
+    on_discovered=lambda discovered: attach_local_backend(discovered)
+)
+
+
+# Which Ollama models are loaded, so routing can avoid waiting on a model swap
+residency = ModelResidency()
+LOCAL_SWAP_BUDGET_MS = int(os.getenv('LOCAL_SWAP_BUDGET_MS', '15000'))
+
+# Observed latencies per model, used by the "auto" preference
+latency_tracker = LatencyTracker()
+ROUTING_LATENCY_SLO_MS = int(os.getenv('ROUTING_LATENCY_SLO_MS', '20000'))
+DEFAULT_MODEL_PREFERENCE = os.getenv('DEFAULT_MODEL_PREFERENCE', 'local-general')
+
+# Per-model admission queues, filled in once the local models are known
+admission_queues = {}
+
+
+
+def routable_models(local_ready):
+    """Models auto routing may choose, given which backends are up"""
+    if client and local_ready:
+        return None
+    if client:
+        return {ModelRouter.CLAUDE_MODEL}
+    return {ModelRouter.LOCAL_GENERAL, ModelRouter.LOCAL_CODER}
+
+
+# Initialize router (local models are added once discovery finds Ollama)
+router = ModelRouter(
+    max_swap_ms=LOCAL_SWAP_BUDGET_MS if client else None,  # Nowhere to divert without Claude
+    latency=latency_tracker,
+    queues=admission_queues,
+    latency_slo_ms=ROUTING_LATENCY_SLO_MS,
+    models=routable_models(local_ready=False),
+    on_cold_skip=lambda model_id: divert_cold_model(model_id)
+)
+
+# Models loaded at startup and kept resident via keep_alive
+OLLAMA_PRELOAD_MODELS = [
+    m.strip() for m in os.getenv('OLLAMA_PRELOAD_MODELS', 'qwen2.5:14b').split(',') if m.strip()
+]
+_preloading = set()
+_preload_lock = threading.Lock()
+
+
+def preload_local_model(model_name, all_nodes=False):
+    """
+    Load a local model in a background thread (no-op if already loading)
+    Loads it on the node the next request would get, or on every node
+    """
+    if not local_client:
+        return
+    
+    with _preload_lock:
+        if model_name in _preloading:
+            return
+        _preloading.add(model_name)
+    
+    def run():
+        try:
+            if all_nodes:
+                for host, port in local_pool.endpoints_with(model_name):
+                    stats = get_local_client(host=host, port=port, model=model_name).preload()
+                    residency.record_load(model_name, stats['load_ms'], stats['cold_start'])
+            else:
+                with local_pool.lease(model_name) as model_client:
+                    stats = model_client.preload()
+                residency.record_load(model_name, stats['load_ms'], stats['cold_start'])
+        except Exception as e:
+            logger.warning(f"Preload of {model_name} failed: {e}")
+        finally:
+            with _preload_lock:
+                _preloading.discard(model_name)
+    
+    threading.Thread(target=run, name=f"preload-{model_name}", daemon=True).start()
+
+# Server-side conversation history; the session cookie only holds the ID
+conversation_store = ConversationStore(
+    os.getenv('CONVERSATION_DB', 'data/conversations.db')
+)
+
+# Conversations idle longer than a session lasts are purged on this interval
+CONVERSATION_PURGE_INTERVAL = int(os.getenv('CONVERSATION_PURGE_INTERVAL', '3600'))
+
+
+def purge_conversations():
+    """Purge idle conversations now, then every CONVERSATION_PURGE_INTERVAL seconds"""
+    while True:
+        try:
+            conversation_store.purge_inactive(
+                app.config['PERMANENT_SESSION_LIFETIME'].total_seconds()
+            )
+        except Exception as e:
+            logger.error(f"Conversation purge failed: {e}")
+        time.sleep(CONVERSATION_PURGE_INTERVAL)
+
+
+threading.Thread(target=purge_conversations, name="conversation-purge", daemon=True).start()
+
+# Opt-in exact-match cache for deterministic requests, shared by all workers
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+response_cache = None
+if RESPONSE_CACHE_ENABLED:
+    response_cache = ResponseCache(
+        os.getenv('RESPONSE_CACHE_DB', 'data/response_cache.db'),
+        max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+        ttl_seconds=int(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+    )
+
+# Configuration advice per normalized intent, shared by all workers
+advice_cache = ResponseCache(
+    os.getenv('ADVICE_CACHE_DB', 'data/advice_cache.db'),
+    max_entries=int(os.getenv('ADVICE_CACHE_MAX_ENTRIES', '500')),
+    ttl_seconds=int(os.getenv('ADVICE_CACHE_TTL', '86400'))
+)
+
+# Background health checks; /health reports the cached results
+CLAUDE_PROBE_INTERVAL = int(os.getenv('CLAUDE_PROBE_INTERVAL', '300'))
+OLLAMA_PROBE_INTERVAL = int(os.getenv('OLLAMA_PROBE_INTERVAL', '30'))
+health_prober = HealthProber()
+
+if client:
+    # Listing models is free, unlike a test completion
+    health_prober.register(
+        'claude',
+        lambda: bool(client.models.list(limit=1).data),
+        CLAUDE_PROBE_INTERVAL
+    )
+
+# Per-model circuit breakers so an unhealthy Ollama fails over to Claude at once
+circuit_breakers = {}
+
+# When a local admission queue is full, requests go to Claude ("claude") or get 503 ("reject")
+QUEUE_OVERFLOW_ACTION = os.getenv('OLLAMA_QUEUE_OVERFLOW', 'claude')
+
+
+def queue_depth_to_metrics(model_name):
+    """Admission queue callback keeping the shared queue-depth gauge current"""
+    def on_depth_change(delta):
+        metrics.gauge_add('chat_queue_depth', delta, {'model': model_name})
+    return on_depth_change
+
+
+def probe_to_breaker(breaker):
+    """
+    Health probe callback feeding failures into a circuit breaker
+    A passing probe only means the pool lists the model, not that it can
+    generate, so it is not a success; only real generations close a circuit
+    """
+    def on_result(healthy, latency_ms, error):
+        if not healthy:
+            breaker.record_failure(error or "health probe failed")
+    return on_result
+
+
+def attach_local_backend(discovered):
+    """
+    Wire up Ollama once a server answers (called from the discovery thread)
+    Breakers, queues and probes exist before local_client is set, so a
+    request that sees the client also sees everything that guards it
+    """
+    global local_client, local_pool
+    
+    local_pool = OllamaPool(
+        OLLAMA_ENDPOINTS or [(discovered.host, discovered.port)],
+        strategy=os.getenv('OLLAMA_POOL_STRATEGY', 'least_outstanding'),
+        sticky_slack=int(os.getenv('OLLAMA_STICKY_SLACK', '2'))
     )
-    if not local_client.test_connection():
-        logger.warning(f"Local LLM not reachable at {ollama_host}:{ollama_port}; trying bridge IP 172.17.0.1")
-        # Second attempt: Docker bridge gateway on Linux
-        local_client = LocalLLMClient(
-            host="172.17.0.1",
-            port=ollama_port,
-            model="qwen2.5:14b"
+    
+    def refresh_pool():
+        healthy = local_pool.refresh()
+        residency.update(local_pool.loaded_models())
+        return healthy
+    
+    refresh_pool()
+    health_prober.register('ollama-pool', refresh_pool, OLLAMA_PROBE_INTERVAL)
+    
+    for local_model_id in [router.LOCAL_GENERAL, router.LOCAL_CODER]:
+        ollama_name = router.get_model_name_for_ollama(local_model_id)
+        circuit_breakers[ollama_name] = CircuitBreaker(
+            ollama_name,
+            failure_rate_threshold=float(os.getenv('CIRCUIT_FAILURE_RATE', '0.5')),
+            latency_threshold_ms=int(os.getenv('CIRCUIT_LATENCY_THRESHOLD_MS', '30000')),
+            open_seconds=float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+        )
+        admission_queues[ollama_name] = AdmissionQueue(
+            ollama_name,
+            # Concurrency is per node
+            max_concurrency=int(os.getenv('OLLAMA_MAX_CONCURRENCY', '2')) * len(local_pool.nodes),
+            max_queue=int(os.getenv('OLLAMA_MAX_QUEUE', '8')),
+            max_wait_seconds=float(os.getenv('OLLAMA_QUEUE_TIMEOUT', '30')),
+            on_depth_change=queue_depth_to_metrics(local_model_id)
+        )
+        # Answered from the pool's last refresh
+        health_prober.register(
+            ollama_name,
+            functools.partial(local_pool.has_model, ollama_name),
+            OLLAMA_PROBE_INTERVAL,
+            on_result=probe_to_breaker(circuit_breakers[ollama_name])
         )
+    
+    router.residency = residency
+    router.models = routable_models(local_ready=True)
+    local_client = discovered
+    
+    record_startup('local_discovered')
+    for preload_model in OLLAMA_PRELOAD_MODELS:
+        preload_local_model(preload_model, all_nodes=True)
 
-    if local_client.test_connection():
-        logger.info("Local LLM (Qwen2.5 14B) initialized successfully")
-    else:
-        logger.warning("Local LLM not available after both attempts; continuing Claude-only")
-        local_client = None
 
-except Exception as e:
-    logger.error(f"Failed to initialize local LLM: {e}")
-    logger.info("Continuing in Claude-only mode")
-    local_client = None
+health_prober.start()
+
+# Identical concurrent deterministic requests share one upstream call
+single_flight = SingleFlight()
 
+# Generation settings for local models
+LOCAL_MAX_TOKENS = 1024
+# At or below the router's CACHEABLE_MAX_TEMPERATURE, local answers are also
+# cached and coalesced; at the default they are always sampled fresh
+LOCAL_TEMPERATURE = float(os.getenv('LOCAL_TEMPERATURE', '0.7'))
 
-# Initialize router
-router = ModelRouter()
+# Prompt budget for local conversation history (context window less the reply)
+LOCAL_CONTEXT_TOKENS = int(os.getenv('LOCAL_CONTEXT_TOKENS', str(NUM_CTX - LOCAL_MAX_TOKENS)))
+
+# Longest a race-mode request waits for either backend to answer
+RACE_TIMEOUT = float(os.getenv('RACE_TIMEOUT', '60'))
 
 # Global default settings for Claude
 DEFAULT_SETTINGS = {
@@ -134,37 +452,219 @@ CONFIGURATION_PRESETS = {
     }
 }
 
-# Simple rate limiting
-from collections import defaultdict
-import time
+# Settings and configuration commands, matched in one pass per message
+command_dispatcher = CommandDispatcher(CONFIGURATION_PRESETS)
+
+# Prompt token budgets per Claude model (system prompt + history + new message)
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '32000'))
+CONTEXT_TOKEN_BUDGETS = {
+    'claude-haiku-3-5-20241022': CONTEXT_TOKEN_BUDGET,
+    'claude-sonnet-4-5-20250929': CONTEXT_TOKEN_BUDGET,
+    'claude-opus-4-20250514': CONTEXT_TOKEN_BUDGET // 2,  # Highest per-token cost
+}
+
+# Fast model used to fold older turns into the rolling summary
+SUMMARY_MODEL = 'claude-haiku-3-5-20241022'
+
+# Request metrics for /metrics, aggregated across workers
+metrics = MetricsStore(os.getenv('METRICS_DB', 'data/metrics.db'))
+
+# In-flight requests that /chat/cancel or "new chat" can abort from any worker
+cancellations = CancellationRegistry(CancelStore(os.getenv('CANCEL_DB', 'data/cancellations.db')))
+
+# Endpoints counted by the in-flight gauge
+IN_FLIGHT_ENDPOINTS = {'chat', 'chat_stream', 'chat_batch'}
+
+# Bulk prompt jobs on /chat/batch
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '4'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '16'))
+# Batch prompts per minute per client, in buckets of their own so a batch never
+# uses up the interactive limits; 0 leaves a tier bounded by concurrency alone
+BATCH_RATE_LIMIT = int(os.getenv('BATCH_RATE_LIMIT', '120'))  # Claude
+BATCH_LOCAL_RATE_LIMIT = int(os.getenv('BATCH_LOCAL_RATE_LIMIT', '0'))
+
+
+def record_chat_metrics(
+    endpoint, model, routing_reason, status,
+    duration_ms=None, first_token_ms=None, tokens=0, generation_ms=None, queue_wait_ms=0
+):
+    """Record one chat response; a metrics failure never fails the request"""
+    if status == 'success':
+        # Queue wait is predicted separately when routing, so leave it out here
+        latency_tracker.record(
+            model if model in (router.LOCAL_GENERAL, router.LOCAL_CODER) else router.CLAUDE_MODEL,
+            duration_ms=duration_ms - queue_wait_ms if duration_ms is not None else None,
+            first_token_ms=first_token_ms - queue_wait_ms if first_token_ms is not None else None,
+            ms_per_token=generation_ms / tokens if tokens and generation_ms else None
+        )
+    
+    try:
+        # Auto routing appends per-request detail after ';', which would explode label cardinality
+        reason_label = routing_reason.split(';')[0] if routing_reason else routing_reason
+        labels = {'endpoint': endpoint, 'model': model, 'routing_reason': reason_label}
+        metrics.inc('chat_requests_total', {**labels, 'status': status})
+        if status == 'error':
+            return
+        
+        metrics.observe('chat_request_duration_seconds', duration_ms / 1000, labels)
+        if first_token_ms is not None:
+            metrics.observe('chat_time_to_first_token_seconds', first_token_ms / 1000, labels)
+        
+        # Cached and coalesced responses generate nothing themselves
+        if tokens and status == 'success':
+            metrics.inc('chat_tokens_generated_total', {'model': model}, tokens)
+            if generation_ms:
+                metrics.observe(
+                    'chat_tokens_per_second', tokens / (generation_ms / 1000), {'model': model}
+                )
+    except Exception as e:
+        logger.error(f"Failed to record metrics: {e}")
+
+
+def record_cancellation(endpoint, reason):
+    """Count a request aborted before it finished ('cancelled' or 'disconnect')"""
+    try:
+        metrics.inc('chat_cancellations_total', {'endpoint': endpoint, 'reason': reason})
+    except Exception as e:
+        logger.error(f"Failed to record metrics: {e}")
+
+
+def record_fallback(from_model, reason):
+    """Count a request escalated away from the model it was routed to"""
+    try:
+        metrics.inc('chat_fallbacks_total', {'from_model': from_model, 'reason': reason})
+    except Exception as e:
+        logger.error(f"Failed to record metrics: {e}")
+
+
+def record_startup(stage):
+    """Record how long after import this worker reached a startup stage"""
+    elapsed = time.time() - PROCESS_STARTED
+    startup_ms[stage] = int(elapsed * 1000)
+    logger.info(f"Startup stage {stage} reached after {startup_ms[stage]}ms")
+    try:
+        metrics.observe('startup_seconds', elapsed, {'stage': stage})
+    except Exception as e:
+        logger.error(f"Failed to record metrics: {e}")
+
+
+def local_unavailable_reason():
+    """Routing reason for a local request sent to Claude because Ollama is not up"""
+    if local_discovery.status()['state'] == 'starting':
+        return "Local LLM still starting"
+    return "Local LLM unavailable"
+
+
+@app.before_request
+def track_in_flight_start():
+    """Count chat requests in flight (streams stay counted until they finish)"""
+    if request.endpoint in IN_FLIGHT_ENDPOINTS:
+        try:
+            metrics.gauge_add('chat_requests_in_flight', 1, {'endpoint': request.endpoint})
+            g.in_flight_endpoint = request.endpoint
+        except Exception as e:
+            logger.error(f"Failed to record metrics: {e}")
+
+
+@app.teardown_request
+def track_in_flight_end(exc):
+    endpoint = g.pop('in_flight_endpoint', None)
+    if endpoint:
+        try:
+            metrics.gauge_add('chat_requests_in_flight', -1, {'endpoint': endpoint})
+        except Exception as e:
+            logger.error(f"Failed to record metrics: {e}")
 
-request_counts = defaultdict(list)
-RATE_LIMIT = 10  # requests
+
+@app.before_request
+def open_cancel_token():
+    """Give each chat request a token that /chat/cancel can set (streams keep it until they finish)"""
+    if request.endpoint in IN_FLIGHT_ENDPOINTS:
+        g.cancel_token = cancellations.register(get_conversation_id(session))
+
+
+@app.teardown_request
+def close_cancel_token(exc):
+    token = g.pop('cancel_token', None)
+    if token:
+        cancellations.unregister(token)
+
+
+# Rate limiting: token buckets shared across workers, one per client and model tier
+import math
+
+RATE_LIMIT = int(os.getenv("RATE_LIMIT", "10"))  # Claude requests per window
+LOCAL_RATE_LIMIT = int(os.getenv("LOCAL_RATE_LIMIT", str(RATE_LIMIT * 3)))  # Local requests per window
 RATE_WINDOW = 60  # seconds
 
+rate_limiter = TokenBucketLimiter(os.getenv('RATE_LIMIT_DB', 'data/rate_limits.db'))
+
+
+def plan_request_route(model_preference, user_message):
+    """router.plan_route, computed once per request (the rate limiter needs it first)"""
+    planned = g.get('planned_route')
+    if planned and planned[0] == (model_preference, user_message):
+        return planned[1]
+    plan = router.plan_route(model_preference, user_message)
+    g.planned_route = ((model_preference, user_message), plan)
+    return plan
+
+
+def route_request(model_preference, user_message):
+    """Route a request that got past the rate limit; only now are cold models preloaded"""
+    return router.apply_route(plan_request_route(model_preference, user_message))
+
+
 def rate_limit(f):
-    """Simple rate limiting decorator"""
+    """Token-bucket rate limiting decorator (bucket chosen by the routed model)"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
         client_id = request.remote_addr
-        now = time.time()
-        request_counts[client_id] = [
-            req_time for req_time in request_counts[client_id]
-            if now - req_time < RATE_WINDOW
-        ]
-        
-        if len(request_counts[client_id]) >= RATE_LIMIT:
-            logger.warning(f"Rate limit exceeded for {client_id}")
-            return jsonify({
+        payload = request.get_json(silent=True) or {}
+        model_preference = payload.get('model_preference') or DEFAULT_MODEL_PREFERENCE
+        
+        # Claude calls cost real money; local calls only cost GPU time. Race
+        # always calls Claude, and auto is charged for where it actually routes
+        # Planning has no side effects, so a rejected request preloads nothing
+        model_to_use = plan_request_route(model_preference, str(payload.get('message', '')).strip())[0]
+        if model_preference == router.RACE or model_to_use == 'claude' or not local_client:
+            tier, limit = 'claude', RATE_LIMIT
+        else:
+            tier, limit = 'local', LOCAL_RATE_LIMIT
+        
+        allowed, retry_after = rate_limiter.acquire(
+            f"{client_id}:{tier}",
+            capacity=limit,
+            refill_per_second=limit / RATE_WINDOW
+        )
+        
+        if not allowed:
+            logger.warning(f"Rate limit exceeded for {client_id} ({tier})")
+            try:
+                metrics.inc('rate_limit_rejections_total', {'tier': tier})
+            except Exception as e:
+                logger.error(f"Failed to record metrics: {e}")
+            response = jsonify({
                 'error': 'Rate limit exceeded. Please wait a moment.',
                 'success': False
-            }), 429
+            })
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+            return response, 429
         
-        request_counts[client_id].append(now)
         return f(*args, **kwargs)
     return decorated_function
 
 
+def get_conversation_id(session):
+    """Get the opaque conversation ID from session, creating one if needed"""
+    if 'conversation_id' not in session:
+        session['conversation_id'] = ConversationStore.new_conversation_id()
+        session.modified = True
+    return session['conversation_id']
+
+
+@timing.timed('settings')
 def get_current_settings(session):
     """Get current Claude settings from session or defaults"""
     if 'claude_settings' not in session:
@@ -173,47 +673,6 @@ def get_current_settings(session):
     return session['claude_settings']
 
 
-def is_configuration_request(message):
-    """
-    Detect if user is asking for configuration advice
-    Returns: (is_config_request, config_type)
-    """
-    message_lower = message.lower()
-    
-    # Configuration command patterns
-    config_patterns = [
-        (r'\bconfigure\s+(yourself|settings|claude)\b', 'general'),
-        (r'\bwhat\s+settings\s+(should|would|do)\b', 'advice'),
-        (r'\bhow\s+should\s+(you|claude)\s+be\s+configured\b', 'advice'),
-        (r'\boptimize\s+(yourself|settings)\s+for\b', 'optimize'),
-        (r'\bset\s+up\s+for\b', 'optimize'),
-        (r'\bbest\s+settings\s+for\b', 'advice'),
-    ]
-    
-    for pattern, config_type in config_patterns:
-        if re.search(pattern, message_lower):
-            return True, config_type
-    
-    # Check for preset keywords
-    for preset_name in CONFIGURATION_PRESETS.keys():
-        if preset_name.replace('_', ' ') in message_lower:
-            return True, preset_name
-    
-    return False, None
-
-
-def is_settings_command(message):
-    """Check if user wants to view current settings"""
-    message_lower = message.lower().strip()
-    return message_lower in [
-        'show settings',
-        'current settings',
-        'what are your settings',
-        'display settings',
-        'settings'
-    ]
-
-
 def format_settings_display(settings):
     """Format settings for display to user"""
     return f"""
@@ -242,8 +701,18 @@ Type "configure for [preset]" to use:
 def generate_configuration_advice(message, current_settings):
     """
     Use Claude to generate configuration advice based on user's needs
-    This uses a meta-call to Claude to get recommendations
+    This uses a meta-call to Claude to get recommendations; advice is cached
+    per intent, so rephrasings of the same request cost no further calls
     """
+    cache_key = f"advice:{advice_intent(message)}"
+    try:
+        cached = advice_cache.get(cache_key)
+        if cached:
+            metrics.inc('config_advice_total', {'source': 'cache'})
+            return cached['advice']
+    except Exception as e:
+        logger.error(f"Advice cache lookup failed: {e}")
+    
     try:
         # Make a special call to Claude asking for configuration advice
         advice_prompt = f"""The user said: "{message}"
@@ -261,15 +730,30 @@ TEMPERATURE: [number]
 SYSTEM_PROMPT: [prompt text]
 EXPLANATION: [brief explanation of why these settings]"""
 
-        advice_response = client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=1024,
-            temperature=0.3,
-            messages=[{"role": "user", "content": advice_prompt}]
+        # Concurrent requests with the same intent share one call
+        advice_response, coalesced = single_flight.run(
+            cache_key,
+            lambda: client.messages.create(
+                model="claude-sonnet-4-5-20250929",
+                max_tokens=1024,
+                temperature=0.3,
+                messages=[{"role": "user", "content": advice_prompt}]
+            )
         )
+        advice = advice_response.content[0].text
         
-        return advice_response.content[0].text
-        
+        if not coalesced:
+            # Advice already fetched is returned even if caching it fails
+            try:
+                advice_cache.put(cache_key, {'advice': advice})
+            except Exception as e:
+                logger.error(f"Failed to cache configuration advice: {e}")
+            try:
+                metrics.inc('config_advice_total', {'source': 'claude'})
+            except Exception as e:
+                logger.error(f"Failed to record metrics: {e}")
+        return advice
+    
     except Exception as e:
         logger.error(f"Error generating configuration advice: {e}")
         return None
@@ -306,239 +790,900 @@ def parse_configuration_advice(advice_text):
         return None
 
 
-@app.route('/')
-def index():
-    """Main chat interface"""
-    if 'conversation_history' not in session:
-        session['conversation_history'] = []
+def handle_settings_command(user_message, current_settings):
+    """
+    Handle settings, preset and configuration commands
+    Returns: response payload dict if the message was a command, else None
+    """
+    command = command_dispatcher.match(user_message)
+    if command is None:
+        return None
+    kind, arg = command
+    
+    # Check for settings display command
+    if kind == 'show':
+        settings_display = format_settings_display(current_settings)
+        return {
+            'user_message': user_message,
+            'assistant_message': settings_display,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'model_used': 'system',
+            'routing_reason': 'Settings command',
+            'auto_switched': False,
+            'success': True,
+            'is_system_message': True
+        }
+    
+    # Check for reset command
+    if kind == 'reset':
         session['claude_settings'] = DEFAULT_SETTINGS.copy()
         session.modified = True
+        return {
+            'user_message': user_message,
+            'assistant_message': '✅ Settings reset to defaults.\n\n' + format_settings_display(DEFAULT_SETTINGS),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'model_used': 'system',
+            'routing_reason': 'Settings command',
+            'auto_switched': False,
+            'success': True,
+            'is_system_message': True
+        }
     
-    logger.info(f"User accessed main page from {request.remote_addr}")
-    return render_template('index.html')
-
-
-@app.route('/chat', methods=['POST'])
-@rate_limit
-def chat():
-    """
-    Handle chat messages with intelligent routing between models
-    Supports: Local General, Local Coder, and Claude
-    """
-    try:
-        user_message = request.json.get('message', '').strip()
-        model_preference = request.json.get('model_preference', 'local-general')  # Three options now
-        
-        if not user_message:
-            return jsonify({
-                'error': 'Message cannot be empty',
-                'success': False
-            }), 400
-        
-        if len(user_message) > 4000:
-            return jsonify({
-                'error': 'Message too long. Please limit to 4000 characters.',
-                'success': False
-            }), 400
-        
-        # Route the query
-        model_to_use, routing_reason, auto_switched = router.route_query(
-            model_preference, 
-            user_message
-        )
-        
-        # Initialize response variables
-        assistant_message = None
-        model_used = None
-        response_time_ms = 0
-        tokens_used = 0
-        
-        # Try local LLM if routed there (general or coder)
-        if model_to_use in ["local-general", "local-coder"] and local_client:
-            try:
-                # Get the correct Ollama model name
-                ollama_model = router.get_model_name_for_ollama(model_to_use)
-                
-                logger.info(f"Using {ollama_model}: {routing_reason}")
-                
-                # Create client with specific model and host
-                temp_client = LocalLLMClient(
-                    host="host.docker.internal",
-                    port=11434,
-                    model=ollama_model
-                )
-                result = temp_client.get_response(user_message)
-                
-                assistant_message = result['response']
-                model_used = ollama_model
-                response_time_ms = result['duration_ms']
-                tokens_used = result['tokens']
-                
-            except Exception as e:
-                logger.warning(f"Local LLM failed: {e}, escalating to Claude")
-                model_to_use = "claude"  # Fall back to Claude
-                auto_switched = True
-                routing_reason = "Local LLM error"
+    # Check for preset configuration
+    if kind == 'preset':
+        preset_settings = CONFIGURATION_PRESETS[arg]
+        session['claude_settings'] = preset_settings.copy()
+        session.modified = True
+        return {
+            'user_message': user_message,
+            'assistant_message': f'✅ Configured for **{arg.replace("_", " ").title()}**\n\n' + format_settings_display(preset_settings),
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'model_used': 'system',
+            'routing_reason': 'Settings command',
+            'auto_switched': False,
+            'success': True,
+            'is_system_message': True
+        }
+    
+    # Check if this is a configuration request
+    if kind == 'advice':
+        # Generate configuration advice
+        advice = generate_configuration_advice(user_message, current_settings)
         
-        # Use Claude if routed there or local failed
-        if model_to_use == "claude":
-            if not client:
-                return jsonify({
-                    'error': 'Claude API not available and local LLM failed',
-                    'success': False
-                }), 500
-            
-            logger.info(f"Using Claude: {routing_reason}")
+        if advice:
+            # Try to parse the advice into settings
+            suggested_settings = parse_configuration_advice(advice)
             
-            # Get current settings
-            current_settings = get_current_settings(session)
-        
-            # Check for settings display command
-            if is_settings_command(user_message):
-                settings_display = format_settings_display(current_settings)
-                return jsonify({
-                    'user_message': user_message,
-                    'assistant_message': settings_display,
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'model_used': 'system',
-                    'routing_reason': 'Settings command',
-                    'auto_switched': False,
-                    'success': True,
-                    'is_system_message': True
-                })
+            response_text = f"Based on your request, here are my recommendations:\n\n{advice}\n\n"
             
-            # Check for reset command
-            if user_message.lower().strip() in ['reset settings', 'default settings']:
-                session['claude_settings'] = DEFAULT_SETTINGS.copy()
+            if suggested_settings:
+                response_text += "\n**To apply these settings, type:** `apply suggested settings`"
+                # Store suggested settings temporarily
+                session['suggested_settings'] = suggested_settings
                 session.modified = True
-                return jsonify({
-                    'user_message': user_message,
-                    'assistant_message': '✅ Settings reset to defaults.\n\n' + format_settings_display(DEFAULT_SETTINGS),
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'model_used': 'system',
-                    'routing_reason': 'Settings command',
-                    'auto_switched': False,
-                    'success': True,
-                    'is_system_message': True
-                })
-            
-            # Check for preset configuration
-            for preset_name, preset_settings in CONFIGURATION_PRESETS.items():
-                if f'configure for {preset_name.replace("_", " ")}' in user_message.lower():
-                    session['claude_settings'] = preset_settings.copy()
-                    session.modified = True
-                    return jsonify({
-                        'user_message': user_message,
-                        'assistant_message': f'✅ Configured for **{preset_name.replace("_", " ").title()}**\n\n' + format_settings_display(preset_settings),
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'model_used': 'system',
-                        'routing_reason': 'Settings command',
-                        'auto_switched': False,
-                        'success': True,
-                        'is_system_message': True
-                    })
             
-            # Check if this is a configuration request
-            is_config, config_type = is_configuration_request(user_message)
+            response_text += "\n\nOr choose a preset by typing `configure for [preset name]`"
             
-            if is_config:
-                # Generate configuration advice
-                advice = generate_configuration_advice(user_message, current_settings)
-                
-                if advice:
-                    # Try to parse the advice into settings
-                    suggested_settings = parse_configuration_advice(advice)
-                    
-                    response_text = f"Based on your request, here are my recommendations:\n\n{advice}\n\n"
-                    
-                    if suggested_settings:
-                        response_text += "\n**To apply these settings, type:** `apply suggested settings`"
-                        # Store suggested settings temporarily
-                        session['suggested_settings'] = suggested_settings
-                        session.modified = True
-                    
-                    response_text += "\n\nOr choose a preset by typing `configure for [preset name]`"
-                    
-                    return jsonify({
-                        'user_message': user_message,
-                        'assistant_message': response_text,
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'model_used': 'claude-sonnet-4-5-20250929',
-                        'routing_reason': 'Configuration advice',
-                        'auto_switched': False,
-                        'success': True,
-                        'is_system_message': True
-                    })
+            return {
+                'user_message': user_message,
+                'assistant_message': response_text,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'model_used': 'claude-sonnet-4-5-20250929',
+                'routing_reason': 'Configuration advice',
+                'auto_switched': False,
+                'success': True,
+                'is_system_message': True
+            }
+    
+    # Check for apply suggested settings command
+    if kind == 'apply':
+        if 'suggested_settings' in session:
+            session['claude_settings'] = session['suggested_settings'].copy()
+            session.modified = True
+            return {
+                'user_message': user_message,
+                'assistant_message': '✅ Suggested settings applied!\n\n' + format_settings_display(session['claude_settings']),
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'model_used': 'system',
+                'routing_reason': 'Settings command',
+                'auto_switched': False,
+                'success': True,
+                'is_system_message': True
+            }
+        else:
+            return {
+                'user_message': user_message,
+                'assistant_message': 'No suggested settings found. Ask me for configuration advice first!',
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'model_used': 'system',
+                'routing_reason': 'Settings command',
+                'auto_switched': False,
+                'success': True,
+                'is_system_message': True
+            }
+    
+    return None
+
+
+def summarize_conversation(previous_summary, turns):
+    """
+    Fold older turns into the rolling conversation summary
+    Uses a fast model; returns None on failure so callers can truncate instead
+    """
+    if not client:
+        return None
+    
+    transcript = "\n\n".join(
+        f"USER: {turn['user']}\nASSISTANT: {turn['assistant']}" for turn in turns
+    )
+    summary_prompt = f"""Update the running summary of a conversation with the new exchanges below.
+Keep names, decisions, facts, code identifiers and open questions. Be concise (under 300 words).
+
+EXISTING SUMMARY:
+{previous_summary or '(none)'}
+
+NEW EXCHANGES:
+{transcript}
+
+Respond with the updated summary only."""
+
+    response = client.messages.create(
+        model=SUMMARY_MODEL,
+        max_tokens=512,
+        temperature=0.2,
+        messages=[{"role": "user", "content": summary_prompt}]
+    )
+    return response.content[0].text.strip()
+
+
+# Keeps Claude prompts within CONTEXT_TOKEN_BUDGETS
+context_manager = ContextWindowManager(
+    conversation_store,
+    summarize_conversation,
+    budgets=CONTEXT_TOKEN_BUDGETS,
+    default_budget=CONTEXT_TOKEN_BUDGET
+)
+
+
+def request_key(model_id, model_name, system_prompt, temperature, max_tokens, messages):
+    """Fingerprint of a deterministic request, or None if the route is not deterministic"""
+    if not router.is_cacheable(model_id, temperature):
+        return None
+    return make_cache_key(model_name, system_prompt, temperature, max_tokens, messages)
+
+
+def cached_response(cache_key):
+    """Look up a cached response; a cache failure counts as a miss"""
+    if not cache_key:
+        return None
+    try:
+        return response_cache.get(cache_key)
+    except Exception as e:
+        logger.error(f"Response cache lookup failed: {e}")
+        return None
+
+
+def cache_response(cache_key, response, tokens):
+    """Store a finished response; a cache failure never discards the answer"""
+    try:
+        response_cache.put(cache_key, {'response': response, 'tokens': tokens})
+    except Exception as e:
+        logger.error(f"Failed to cache response: {e}")
+
+
+def stream_claude(settings, system_blocks, messages):
+    """
+    Stream a Claude response as local-style chunks
+    
+    Yields:
+        dict: {'token': str} per text delta, then {'done': True, 'usage': usage}
+    """
+    started = time.perf_counter()
+    first_token = True
+    with client.messages.stream(
+        model=settings['model'],
+        max_tokens=settings['max_tokens'],
+        temperature=settings['temperature'],
+        system=system_blocks,
+        messages=messages
+    ) as stream:
+        timing.record('claude_connect', (time.perf_counter() - started) * 1000)
+        for text in stream.text_stream:
+            if first_token:
+                timing.record('claude_ttft', (time.perf_counter() - started) * 1000)
+                first_token = False
+            yield {'token': text}
+        
+        final_message = stream.get_final_message()
+    
+    timing.record('claude', (time.perf_counter() - started) * 1000)
+    yield {'done': True, 'usage': final_message.usage}
+
+
+def collect_stream(chunks, cancel_token):
+    """
+    Drain a chunk stream into a whole answer, checking for cancellation
+    
+    Non-streaming requests still stream from upstream so that a cancel can
+    close the connection and stop the generation mid-way
+    
+    Returns:
+        tuple: (text, done_chunk)
+    
+    Raises:
+        Cancelled: If the request was cancelled (the stream is closed first)
+    """
+    parts = []
+    try:
+        for chunk in chunks:
+            cancel_token.check()
+            if chunk.get('done'):
+                return ''.join(parts), chunk
+            if 'token' in chunk:
+                parts.append(chunk['token'])
+        raise Exception("Stream ended before completion")
+    finally:
+        chunks.close()
+
+
+def local_circuit_open(model_id):
+    """
+    Check the circuit breaker for a local model before calling it
+    
+    Returns:
+        str: Routing reason when the call should go straight to Claude
+        None: If the local model may be called
+    """
+    breaker = circuit_breakers.get(router.get_model_name_for_ollama(model_id))
+    if breaker and not breaker.allow_request():
+        return f"{router.get_model_display_name(model_id)} circuit open"
+    return None
+
+
+def shed_local_request(model_id, retry_after):
+    """
+    Handle a request the local model's admission queue cannot take
+    
+    Returns:
+        Response: 503 with Retry-After when requests are rejected (or Claude is unavailable)
+        None: If the request should be diverted to Claude instead
+    """
+    reject = QUEUE_OVERFLOW_ACTION == 'reject' or not client
+    try:
+        metrics.inc(
+            'chat_queue_shed_total',
+            {'model': model_id, 'action': 'rejected' if reject else 'diverted'}
+        )
+    except Exception as e:
+        logger.error(f"Failed to record metrics: {e}")
+    
+    if not reject:
+        record_fallback(model_id, 'queue_full')
+        return None
+    
+    logger.warning(f"{model_id} queue full; rejecting request")
+    response = jsonify({
+        'error': 'The local model is busy. Please try again shortly.',
+        'success': False
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def divert_cold_model(model_id):
+    """Count a swap-cost diversion and start loading the cold model for next time"""
+    record_fallback(model_id, 'cold_model')
+    preload_local_model(router.get_model_name_for_ollama(model_id))
+
+
+def record_model_load(model_id, ollama_model, result):
+    """Track residency and cold starts from a local completion"""
+    residency.record_load(ollama_model, result.get('load_ms', 0), result.get('cold_start', False))
+    if result.get('cold_start'):
+        try:
+            metrics.inc('chat_cold_starts_total', {'model': model_id})
+        except Exception as e:
+            logger.error(f"Failed to record metrics: {e}")
+
+
+def record_queue_wait(model_id, admission):
+    """Record how long a request waited for a local model slot"""
+    try:
+        metrics.observe(
+            'chat_queue_wait_seconds', admission['queue_wait_ms'] / 1000, {'model': model_id}
+        )
+    except Exception as e:
+        logger.error(f"Failed to record metrics: {e}")
+
+
+def admitted_stream(queue, open_stream, cancelled=None):
+    """
+    Hold an admission slot for a whole local stream
+    
+    Args:
+        queue: The model's admission queue (None to skip admission)
+        open_stream: Fn returning the model's chunk iterator
+        cancelled: Fn() polled while queued; a cancelled stream gives up its place
+    
+    Yields:
+        dict: {'admission': {...}} first, then the model's chunks
+    """
+    if queue is None:
+        yield from open_stream()
+        return
+    
+    with queue.admit(cancelled=cancelled) as admission:
+        yield {'admission': admission}
+        yield from open_stream()
+
+
+def race_local_and_claude(model_id, user_message, settings):
+    """
+    Send one request to a local model and to Claude at once (race mode)
+    
+    The loser is closed on its next chunk once the winner finishes, or
+    leaves the admission queue if it is still waiting there. If neither
+    answer is acceptable, Claude's complete answer is kept rather than
+    paying for it twice. Circuit breaker, residency and race metrics are
+    updated here
+    
+    Returns:
+        dict: race() result plus 'ollama_model', 'local_context' and
+            'claude_context' (the message lists each side was sent)
+    
+    Raises:
+        RaceFailedError: If neither side produced a complete answer
+    """
+    conversation_id = get_conversation_id(session)
+    ollama_model = router.get_model_name_for_ollama(model_id)
+    breaker = circuit_breakers.get(ollama_model)
+    
+    local_context = context_manager.build_local_context(
+        conversation_id, user_message, LOCAL_CONTEXT_TOKENS
+    )
+    claude_context = context_manager.build_context(
+        conversation_id, user_message, settings['model'], settings['system_prompt']
+    )
+    system_blocks, cached_messages = apply_cache_breakpoints(
+        settings['system_prompt'], claude_context['summary'], claude_context['messages']
+    )
+    
+    winner = 'none'
+    race_over = threading.Event()
+    try:
+        result = race(
+            {
+                # A local leg still queued when Claude wins leaves the queue
+                'local': lambda: admitted_stream(
+                    admission_queues.get(ollama_model),
+                    lambda: local_pool.stream_chat(
+                        ollama_model,
+                        conversation_id,
+                        local_context['messages'],
+                        max_tokens=LOCAL_MAX_TOKENS,
+                        temperature=LOCAL_TEMPERATURE
+                    ),
+                    cancelled=race_over.is_set
+                ),
+                'claude': lambda: stream_claude(settings, system_blocks, cached_messages)
+            },
+            timeout=RACE_TIMEOUT,
+            cancelled=g.cancel_token.is_cancelled,
+            stop=race_over,
+            prefer='claude'
+        )
+        winner = result['winner'] if result['accepted'] else 'none'
+    except Cancelled:
+        winner = 'cancelled'
+        raise
+    finally:
+        try:
+            metrics.inc('chat_race_total', {'local_model': model_id, 'winner': winner})
+        except Exception as e:
+            logger.error(f"Failed to record metrics: {e}")
+    
+    local_leg = result['legs']['local']
+    if local_leg['outcome'] == 'failed' and breaker:
+        breaker.record_failure(local_leg['error'])
+    if result['winner'] == 'local':
+        record_model_load(model_id, ollama_model, result['final'])
+        if breaker:
+            breaker.record_success(result['first_token_ms'] - result['final']['load_ms'])
+    
+    return {
+        **result,
+        'ollama_model': ollama_model,
+        'local_context': local_context,
+        'claude_context': claude_context
+    }
+
+
+def wait_for_rate_limit(client_id, model_id, cancel_token):
+    """
+    Take one token from the client's batch bucket for a prompt, waiting for it
+    
+    A batch is paced rather than rejected, since a long batch would never fit
+    in one burst; its buckets are separate from /chat's, so a running batch
+    leaves the client's interactive allowance alone
+    """
+    tier, limit = (
+        ('claude', BATCH_RATE_LIMIT) if model_id == 'claude' else ('local', BATCH_LOCAL_RATE_LIMIT)
+    )
+    if limit <= 0:
+        return
+    while True:
+        allowed, retry_after = rate_limiter.acquire(
+            f"{client_id}:batch-{tier}",
+            capacity=limit,
+            refill_per_second=limit / RATE_WINDOW
+        )
+        if allowed:
+            return
+        cancel_token.check()
+        time.sleep(min(retry_after, 1.0))
+
+
+def run_batch_item(item, default_preference, default_settings, client_id, cancel_token):
+    """
+    Answer one /chat/batch prompt with the same routing as /chat
+    
+    Batch prompts are independent: no conversation history is read or
+    stored, settings commands are not interpreted, and race mode is routed
+    automatically
+    
+    Returns:
+        dict: Result line for the batch response
+    """
+    message = item.get('message')
+    result = {'id': item.get('id')}
+    if not isinstance(message, str) or not message.strip():
+        return {**result, 'success': False, 'error': 'Message cannot be empty'}
+    message = message.strip()
+    if len(message) > 4000:
+        return {**result, 'success': False, 'error': 'Message too long. Please limit to 4000 characters.'}
+    
+    settings = default_settings
+    if item.get('preset'):
+        if item['preset'] not in CONFIGURATION_PRESETS:
+            return {**result, 'success': False, 'error': f"Unknown preset: {item['preset']}"}
+        settings = CONFIGURATION_PRESETS[item['preset']]
+    
+    model_preference = item.get('model_preference') or default_preference
+    if model_preference == router.RACE:
+        # Racing every prompt would pay for Claude on the whole batch; route automatically instead
+        model_preference = router.AUTO
+    model_to_use, routing_reason, _ = router.route_query(model_preference, message)
+    if model_to_use in ["local-general", "local-coder"]:
+        fallback_reason = (
+            'local_unavailable' if not local_client
+            else 'circuit_open' if local_circuit_open(model_to_use) else None
+        )
+        if fallback_reason:
+            record_fallback(model_to_use, fallback_reason)
+            model_to_use = "claude"
+            routing_reason = f"Local LLM unavailable ({fallback_reason})"
+    
+    messages = [{'role': 'user', 'content': message}]
+    started = time.time()
+    queue_wait_ms = 0
+    
+    if model_to_use in ["local-general", "local-coder"]:
+        ollama_model = router.get_model_name_for_ollama(model_to_use)
+        breaker = circuit_breakers.get(ollama_model)
+        queue = admission_queues.get(ollama_model)
+        wait_for_rate_limit(client_id, model_to_use, cancel_token)
+        try:
+            with queue.admit(cancelled=cancel_token.is_cancelled) as slot:
+                queue_wait_ms = slot['queue_wait_ms']
+                record_queue_wait(model_to_use, slot)
+                text, done = collect_stream(
+                    local_pool.stream_chat(
+                        ollama_model,
+                        None,
+                        messages,
+                        max_tokens=LOCAL_MAX_TOKENS,
+                        temperature=LOCAL_TEMPERATURE
+                    ),
+                    cancel_token
+                )
+            record_model_load(model_to_use, ollama_model, done)
+            if breaker:
+                breaker.record_success(done['duration_ms'] - done['load_ms'])
+            response_time_ms = int((time.time() - started) * 1000)
+            record_chat_metrics(
+                'chat_batch', model_to_use, routing_reason, 'success',
+                duration_ms=response_time_ms, tokens=done['tokens'],
+                generation_ms=done['duration_ms'], queue_wait_ms=queue_wait_ms
+            )
+            return {
+                **result,
+                'success': True,
+                'response': text,
+                'model_used': ollama_model,
+                'routing_reason': routing_reason,
+                'response_time_ms': response_time_ms,
+                'queue_wait_ms': queue_wait_ms,
+                'tokens': done['tokens']
+            }
+        except Cancelled:
+            raise
+        except QueueFullError:
+            if QUEUE_OVERFLOW_ACTION == 'reject' or not client:
+                return {**result, 'success': False, 'error': 'The local model is busy'}
+            record_fallback(model_to_use, 'queue_full')
+            routing_reason = "Local queue full"
+        except Exception as e:
+            if breaker:
+                breaker.record_failure(str(e))
+            logger.warning(f"Local LLM failed on batch item: {e}, escalating to Claude")
+            record_fallback(model_to_use, 'local_error')
+            routing_reason = "Local LLM error"
+        model_to_use = "claude"
+        started = time.time()
+    
+    if not client:
+        return {**result, 'success': False, 'error': 'Claude API not available'}
+    
+    wait_for_rate_limit(client_id, model_to_use, cancel_token)
+    system_blocks, cached_messages = apply_cache_breakpoints(settings['system_prompt'], None, messages)
+    text, done = collect_stream(stream_claude(settings, system_blocks, cached_messages), cancel_token)
+    response_time_ms = int((time.time() - started) * 1000)
+    tokens = done['usage'].output_tokens
+    # Labelled with the Claude model name, as /chat labels its Claude traffic
+    record_chat_metrics(
+        'chat_batch', settings['model'], routing_reason, 'success',
+        duration_ms=response_time_ms, tokens=tokens
+    )
+    return {
+        **result,
+        'success': True,
+        'response': text,
+        'model_used': settings['model'],
+        'routing_reason': routing_reason,
+        'response_time_ms': response_time_ms,
+        'queue_wait_ms': 0,
+        'tokens': tokens
+    }
+
+
+def sse_event(event, data):
+    """Format a Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/')
+def index():
+    """Main chat interface"""
+    if 'conversation_id' not in session:
+        session['conversation_id'] = ConversationStore.new_conversation_id()
+        session['claude_settings'] = DEFAULT_SETTINGS.copy()
+        session.modified = True
+    
+    logger.info(f"User accessed main page from {request.remote_addr}")
+    return render_template('index.html')
+
+
+@app.route('/chat', methods=['POST'])
+@rate_limit
+def chat():
+    """
+    Handle chat messages with intelligent routing between models
+    Supports: Local General, Local Coder, and Claude
+    """
+    model_to_use = routing_reason = None
+    cancel_token = g.cancel_token
+    try:
+        user_message = request.json.get('message', '').strip()
+        model_preference = request.json.get('model_preference') or DEFAULT_MODEL_PREFERENCE
+        
+        if not user_message:
+            return jsonify({
+                'error': 'Message cannot be empty',
+                'success': False
+            }), 400
+        
+        if len(user_message) > 4000:
+            return jsonify({
+                'error': 'Message too long. Please limit to 4000 characters.',
+                'success': False
+            }), 400
+        
+        # Route the query
+        model_to_use, routing_reason, auto_switched = route_request(
+            model_preference, 
+            user_message
+        )
+        
+        if model_to_use in ["local-general", "local-coder"] and not local_client:
+            record_fallback(model_to_use, 'local_unavailable')
+            model_to_use = "claude"
+            auto_switched = True
+            routing_reason = local_unavailable_reason()
+        
+        # Initialize response variables
+        assistant_message = None
+        model_used = None
+        response_time_ms = 0
+        tokens_used = 0
+        context_tokens_saved = 0
+        cache_stats = cache_usage(None)
+        cache_hit = False
+        coalesced = False
+        generation_ms = 0
+        admission = {'queue_depth': 0, 'queue_wait_ms': 0}
+        warmth = {'cold_start': False, 'load_ms': 0}
+        local_context = {}
+        race_stats = {}
+        
+        # Skip a local model whose circuit is open instead of waiting on it
+        if model_to_use in ["local-general", "local-coder"] and local_client:
+            circuit_reason = local_circuit_open(model_to_use)
+            if circuit_reason:
+                logger.info(f"{circuit_reason}, escalating to Claude")
+                record_fallback(model_to_use, 'circuit_open')
+                model_to_use = "claude"
+                auto_switched = True
+                routing_reason = circuit_reason
+        
+        # Shed or divert work the local model's queue has no room for
+        if model_to_use in ["local-general", "local-coder"] and local_client:
+            queue = admission_queues.get(router.get_model_name_for_ollama(model_to_use))
+            if queue and queue.is_full():
+                shed_response = shed_local_request(model_to_use, queue.retry_after())
+                if shed_response:
+                    return shed_response
+                model_to_use = "claude"
+                auto_switched = True
+                routing_reason = "Local queue full"
+        
+        # Race mode: local model and Claude at once, first acceptable answer wins
+        raced = False
+        if (model_preference == router.RACE and model_to_use in ["local-general", "local-coder"]
+                and local_client and client):
+            current_settings = get_current_settings(session)
+            command_response = handle_settings_command(user_message, current_settings)
+            if command_response:
+                return jsonify(command_response)
             
-            # Check for apply suggested settings command
-            if user_message.lower().strip() == 'apply suggested settings':
-                if 'suggested_settings' in session:
-                    session['claude_settings'] = session['suggested_settings'].copy()
-                    session.modified = True
+            try:
+                result = race_local_and_claude(model_to_use, user_message, current_settings)
+            except Cancelled:
+                raise
+            except RaceFailedError as e:
+                if e.legs['claude']['outcome'] == 'running':
+                    # Claude is already being paid for and is as slow as a fresh call would be
+                    logger.warning(f"Race timed out: {e}")
+                    record_chat_metrics('chat', model_to_use, routing_reason, 'error')
                     return jsonify({
-                        'user_message': user_message,
-                        'assistant_message': '✅ Suggested settings applied!\n\n' + format_settings_display(session['claude_settings']),
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'model_used': 'system',
-                        'routing_reason': 'Settings command',
-                        'auto_switched': False,
-                        'success': True,
-                        'is_system_message': True
-                    })
+                        'error': 'No answer in time. Please try again.',
+                        'success': False
+                    }), 504
+                logger.warning(f"Race failed: {e}, escalating to Claude")
+                record_fallback(model_to_use, 'race_failed')
+                model_to_use = "claude"
+                auto_switched = True
+                routing_reason = "Race failed"
+            except Exception as e:
+                logger.warning(f"Race failed: {e}, escalating to Claude")
+                record_fallback(model_to_use, 'race_failed')
+                model_to_use = "claude"
+                auto_switched = True
+                routing_reason = "Race failed"
+            else:
+                raced = True
+                final = result['final']
+                assistant_message = result['response']
+                response_time_ms = result['duration_ms']
+                generation_ms = response_time_ms - (result['first_token_ms'] or 0)
+                
+                if result['winner'] == 'local':
+                    model_used = result['ollama_model']
+                    tokens_used = final['tokens']
+                    warmth = {'cold_start': final['cold_start'], 'load_ms': final['load_ms']}
+                    local_context = {
+                        'history_turns': result['local_context']['history_turns'],
+                        'prompt_eval_tokens': final['prompt_eval_tokens']
+                    }
                 else:
-                    return jsonify({
-                        'user_message': user_message,
-                        'assistant_message': 'No suggested settings found. Ask me for configuration advice first!',
-                        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'model_used': 'system',
-                        'routing_reason': 'Settings command',
-                        'auto_switched': False,
-                        'success': True,
-                        'is_system_message': True
-                    })
+                    model_to_use = "claude"
+                    model_used = current_settings['model']
+                    tokens_used = final['usage'].output_tokens
+                    cache_stats = cache_usage(final['usage'])
+                    context_tokens_saved = result['claude_context']['tokens_saved']
+                
+                routing_reason = (
+                    f"{routing_reason}; {router.get_model_display_name(model_used)} "
+                    f"{'won' if result['accepted'] else 'kept (no acceptable answer)'}"
+                )
+                race_stats = {'race': {'winner': result['winner'], 'legs': result['legs']}}
+        
+        # Try local LLM if routed there (general or coder)
+        if model_to_use in ["local-general", "local-coder"] and local_client and not raced:
+            breaker = circuit_breakers.get(router.get_model_name_for_ollama(model_to_use))
+            queue = admission_queues.get(router.get_model_name_for_ollama(model_to_use))
+            try:
+                # Get the correct Ollama model name
+                ollama_model = router.get_model_name_for_ollama(model_to_use)
+                
+                logger.info(f"Using {ollama_model}: {routing_reason}")
+                
+                # Whole conversation via /api/chat so Ollama reuses the cached prompt prefix
+                context = context_manager.build_local_context(
+                    get_conversation_id(session),
+                    user_message,
+                    LOCAL_CONTEXT_TOKENS
+                )
+                flight_key = request_key(
+                    model_to_use, ollama_model, '', LOCAL_TEMPERATURE, LOCAL_MAX_TOKENS,
+                    context['messages']
+                )
+                cache_key = flight_key if response_cache else None
+                cached = cached_response(cache_key)
+                
+                if cached:
+                    result = {'response': cached['response'], 'tokens': cached['tokens'], 'duration_ms': 0}
+                    cache_hit = True
+                else:
+                    def call_local():
+                        with queue.admit(cancelled=cancel_token.is_cancelled) as slot:
+                            record_queue_wait(model_to_use, slot)
+                            call_started = time.time()
+                            try:
+                                text, done = collect_stream(
+                                    local_pool.stream_chat(
+                                        ollama_model,
+                                        get_conversation_id(session),
+                                        context['messages'],
+                                        max_tokens=LOCAL_MAX_TOKENS,
+                                        temperature=LOCAL_TEMPERATURE
+                                    ),
+                                    cancel_token
+                                )
+                                local_result = {**done, 'response': text}
+                            except Cancelled:
+                                raise
+                            except Exception as e:
+                                if breaker:
+                                    breaker.record_failure(str(e))
+                                raise
+                            record_model_load(model_to_use, ollama_model, local_result)
+                            if breaker:
+                                # A cold load is expected to be slow; judge only the generation
+                                breaker.record_success(
+                                    int((time.time() - call_started) * 1000) - local_result['load_ms']
+                                )
+                            return {**local_result, 'admission': slot}
+                    
+                    # Identical prompts already being generated are joined, not repeated
+                    result, coalesced = single_flight.run(flight_key, call_local)
+                    generation_ms = result['duration_ms']
+                    warmth = {'cold_start': result['cold_start'], 'load_ms': result['load_ms']}
+                    local_context['prompt_eval_tokens'] = result['prompt_eval_tokens']
+                    if not coalesced:
+                        admission = result['admission']
+                    if cache_key and not coalesced:
+                        cache_response(cache_key, result['response'], result['tokens'])
+                
+                assistant_message = result['response']
+                model_used = ollama_model
+                response_time_ms = result['duration_ms']
+                tokens_used = result['tokens']
+                local_context['history_turns'] = context['history_turns']
+            
+            except QueueFullError as e:
+                # Lost the race for the last queue slot, or waited too long
+                shed_response = shed_local_request(model_to_use, e.retry_after)
+                if shed_response:
+                    return shed_response
+                model_to_use = "claude"
+                auto_switched = True
+                routing_reason = "Local queue full"
+            
+            except Cancelled:
+                raise
+            
+            except Exception as e:
+                logger.warning(f"Local LLM failed: {e}, escalating to Claude")
+                record_fallback(model_to_use, 'local_error')
+                model_to_use = "claude"  # Fall back to Claude
+                auto_switched = True
+                routing_reason = "Local LLM error"
+        
+        # Use Claude if routed there or local failed
+        if model_to_use == "claude" and not raced:
+            if not client:
+                return jsonify({
+                    'error': 'Claude API not available and local LLM failed',
+                    'success': False
+                }), 500
             
-            # Normal Claude processing
-            conversation_history = session.get('conversation_history', [])
+            logger.info(f"Using Claude: {routing_reason}")
             
-            # Build messages for Claude API
-            messages = []
-            for entry in conversation_history:
-                messages.append({"role": "user", "content": entry['user']})
-                messages.append({"role": "assistant", "content": entry['assistant']})
+            # Get current settings
+            current_settings = get_current_settings(session)
             
-            messages.append({"role": "user", "content": user_message})
+            # Settings, preset and configuration commands short-circuit the call
+            command_response = handle_settings_command(user_message, current_settings)
+            if command_response:
+                return jsonify(command_response)
             
-            import time
-            start_time = time.time()
+            # Normal Claude processing: recent turns verbatim, older ones summarized
+            context = context_manager.build_context(
+                get_conversation_id(session),
+                user_message,
+                current_settings['model'],
+                current_settings['system_prompt']
+            )
+            context_tokens_saved = context['tokens_saved']
             
-            # Call Claude API with current settings
-            response = client.messages.create(
-                model=current_settings['model'],
-                max_tokens=current_settings['max_tokens'],
-                temperature=current_settings['temperature'],
-                system=current_settings['system_prompt'],
-                messages=messages
+            # Mark the system prompt and stable history prefix as cacheable
+            system_blocks, cached_messages = apply_cache_breakpoints(
+                current_settings['system_prompt'],
+                context['summary'],
+                context['messages']
             )
             
-            response_time_ms = int((time.time() - start_time) * 1000)
+            flight_key = request_key(
+                model_to_use,
+                current_settings['model'],
+                context['system'],
+                current_settings['temperature'],
+                current_settings['max_tokens'],
+                context['messages']
+            )
+            cache_key = flight_key if response_cache else None
+            cached = cached_response(cache_key)
             
-            assistant_message = response.content[0].text
-            model_used = current_settings['model']
+            start_time = time.time()
             
-            # Get token usage if available
-            if hasattr(response, 'usage'):
-                tokens_used = response.usage.output_tokens
+            if cached:
+                assistant_message = cached['response']
+                tokens_used = cached['tokens']
+                cache_hit = True
+            else:
+                # Call Claude API with current settings (streamed so a cancel can stop it)
+                (assistant_message, done), coalesced = single_flight.run(
+                    flight_key,
+                    lambda: collect_stream(
+                        stream_claude(current_settings, system_blocks, cached_messages),
+                        cancel_token
+                    )
+                )
+                
+                # A coalesced request was not billed
+                tokens_used = done['usage'].output_tokens
+                if not coalesced:
+                    cache_stats = cache_usage(done['usage'])
+                
+                if cache_key and not coalesced:
+                    cache_response(cache_key, assistant_message, tokens_used)
+            
+            response_time_ms = int((time.time() - start_time) * 1000)
+            model_used = current_settings['model']
+            if not cache_hit:
+                generation_ms = response_time_ms
         
         # Update conversation history (only for non-system messages)
-        conversation_history = session.get('conversation_history', [])
-        conversation_history.append({
-            'user': user_message,
-            'assistant': assistant_message,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'model': model_used
-        })
+        conversation_store.append_turn(
+            get_conversation_id(session),
+            user_message,
+            assistant_message,
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            model=model_used,
+            metadata={
+                'response_time_ms': response_time_ms,
+                'tokens_used': tokens_used,
+                'context_tokens_saved': context_tokens_saved,
+                'routing_reason': routing_reason,
+                'cached': cache_hit,
+                'coalesced': coalesced,
+                **cache_stats,
+                **local_context
+            }
+        )
         
-        session['conversation_history'] = conversation_history
+        # History lives server-side, so re-sign the cookie to keep an active session alive
         session.modified = True
         
         # Get display name for model
@@ -549,6 +1694,16 @@ def chat():
             f"{tokens_used} tokens, {response_time_ms}ms"
         )
         
+        record_chat_metrics(
+            'chat',
+            model_to_use if model_to_use != "claude" else model_used,
+            routing_reason,
+            'cached' if cache_hit else 'coalesced' if coalesced else 'success',
+            duration_ms=response_time_ms,
+            tokens=tokens_used,
+            generation_ms=generation_ms
+        )
+        
         return jsonify({
             'user_message': user_message,
             'assistant_message': assistant_message,
@@ -559,23 +1714,521 @@ def chat():
             'auto_switched': auto_switched,
             'response_time_ms': response_time_ms,
             'tokens_used': tokens_used,
+            'context_tokens_saved': context_tokens_saved,
+            **cache_stats,
+            'cached': cache_hit,
+            'coalesced': coalesced,
+            **admission,
+            **warmth,
+            **local_context,
+            **race_stats,
             'success': True
         })
-        
+    
+    except Cancelled:
+        logger.info("Chat request cancelled by client")
+        record_cancellation('chat', 'cancelled')
+        return jsonify({
+            'error': 'Request cancelled',
+            'cancelled': True,
+            'success': False
+        }), 499
+    
     except Exception as e:
         logger.error(f"Error processing chat message: {str(e)}")
+        record_chat_metrics('chat', model_to_use or 'unknown', routing_reason, 'error')
+        return jsonify({
+            'error': 'Failed to process message. Please try again.',
+            'success': False
+        }), 500
+
+
+@app.route('/chat/stream', methods=['POST'])
+@rate_limit
+def chat_stream():
+    """
+    Stream chat responses token-by-token over Server-Sent Events
+    Events: 'meta' (routing), 'token' (text chunk), 'done' (final stats), 'error'
+    Settings commands are answered with a regular JSON response
+    """
+    model_to_use = routing_reason = None
+    try:
+        user_message = request.json.get('message', '').strip()
+        model_preference = request.json.get('model_preference') or DEFAULT_MODEL_PREFERENCE
+        if model_preference == router.RACE:
+            # Racing compares whole answers, so streams are routed automatically instead
+            model_preference = router.AUTO
+        
+        if not user_message:
+            return jsonify({
+                'error': 'Message cannot be empty',
+                'success': False
+            }), 400
+        
+        if len(user_message) > 4000:
+            return jsonify({
+                'error': 'Message too long. Please limit to 4000 characters.',
+                'success': False
+            }), 400
+        
+        # Route the query
+        model_to_use, routing_reason, auto_switched = route_request(
+            model_preference,
+            user_message
+        )
+        
+        if model_to_use in ["local-general", "local-coder"] and not local_client:
+            record_fallback(model_to_use, 'local_unavailable')
+            model_to_use = "claude"
+            auto_switched = True
+            routing_reason = local_unavailable_reason()
+        
+        if model_to_use in ["local-general", "local-coder"]:
+            circuit_reason = local_circuit_open(model_to_use)
+            if circuit_reason:
+                logger.info(f"{circuit_reason}, escalating to Claude")
+                record_fallback(model_to_use, 'circuit_open')
+                model_to_use = "claude"
+                auto_switched = True
+                routing_reason = circuit_reason
+        
+        # Shed before the stream starts, while a 503 can still be sent
+        if model_to_use in ["local-general", "local-coder"]:
+            queue = admission_queues.get(router.get_model_name_for_ollama(model_to_use))
+            if queue and queue.is_full():
+                shed_response = shed_local_request(model_to_use, queue.retry_after())
+                if shed_response:
+                    return shed_response
+                model_to_use = "claude"
+                auto_switched = True
+                routing_reason = "Local queue full"
+        
+        current_settings = get_current_settings(session)
+        
+        # Commands never reach a model, so there is nothing to stream
+        if model_to_use == "claude":
+            if not client:
+                return jsonify({
+                    'error': 'Claude API not available and local LLM failed',
+                    'success': False
+                }), 500
+            
+            command_response = handle_settings_command(user_message, current_settings)
+            if command_response:
+                return jsonify(command_response)
+        
+        conversation_id = get_conversation_id(session)
+        cancel_token = g.cancel_token
+        timings = timing.current()
+        
+        # The cookie is saved before the stream runs, so re-sign it now to keep
+        # an active session alive (history itself lives server-side)
+        session.modified = True
+    
+    except Exception as e:
+        logger.error(f"Error starting chat stream: {str(e)}")
+        record_chat_metrics('chat_stream', model_to_use or 'unknown', routing_reason, 'error')
         return jsonify({
             'error': 'Failed to process message. Please try again.',
             'success': False
         }), 500
+    
+    def generate():
+        nonlocal model_to_use, routing_reason, auto_switched
+        
+        start_time = time.time()
+        first_token_ms = None
+        chunks = []
+        model_used = None
+        tokens_used = 0
+        context_tokens_saved = 0
+        cache_stats = cache_usage(None)
+        cache_hit = False
+        coalesced = False
+        admission = {'queue_depth': 0, 'queue_wait_ms': 0}
+        warmth = {'cold_start': False, 'load_ms': 0}
+        local_context = {}
+        upstreams = []  # Closed when the stream ends, so a disconnect stops generation
+        completed = False
+        
+        def replay_cached(cached):
+            """Serve a cached response as a single token event"""
+            nonlocal first_token_ms, tokens_used, cache_hit
+            first_token_ms = int((time.time() - start_time) * 1000)
+            tokens_used = cached['tokens']
+            cache_hit = True
+            chunks.append(cached['response'])
+            return sse_event('token', {'text': cached['response']})
+        
+        try:
+            # Local models first; fall back to Claude only if nothing was sent yet
+            if model_to_use in ["local-general", "local-coder"]:
+                ollama_model = router.get_model_name_for_ollama(model_to_use)
+                breaker = circuit_breakers.get(ollama_model)
+                logger.info(f"Streaming {ollama_model}: {routing_reason}")
+                
+                yield sse_event('meta', {
+                    'model_used': ollama_model,
+                    'routing_reason': routing_reason,
+                    'auto_switched': auto_switched
+                })
+                
+                context = context_manager.build_local_context(
+                    conversation_id,
+                    user_message,
+                    LOCAL_CONTEXT_TOKENS
+                )
+                flight_key = request_key(
+                    model_to_use, ollama_model, '', LOCAL_TEMPERATURE, LOCAL_MAX_TOKENS,
+                    context['messages']
+                )
+                cache_key = flight_key if response_cache else None
+                cached = cached_response(cache_key)
+                
+                try:
+                    if cached:
+                        yield replay_cached(cached)
+                    else:
+                        # Join an identical generation already streaming, if any; it
+                        # leaves the queue only once every request sharing it cancels
+                        local_chunks, coalesced = single_flight.stream(
+                            flight_key,
+                            lambda flight_cancelled: admitted_stream(
+                                admission_queues.get(ollama_model),
+                                lambda: local_pool.stream_chat(
+                                    ollama_model,
+                                    conversation_id,
+                                    context['messages'],
+                                    max_tokens=LOCAL_MAX_TOKENS,
+                                    temperature=LOCAL_TEMPERATURE
+                                ),
+                                cancelled=flight_cancelled
+                            ),
+                            cancelled=cancel_token.is_cancelled
+                        )
+                        upstreams.append(local_chunks)
+                        for chunk in local_chunks:
+                            cancel_token.check()
+                            if 'admission' in chunk:
+                                if not coalesced:
+                                    admission = chunk['admission']
+                                    record_queue_wait(model_to_use, admission)
+                                continue
+                            
+                            if chunk.get('done'):
+                                tokens_used = chunk['tokens']
+                                warmth = {'cold_start': chunk['cold_start'], 'load_ms': chunk['load_ms']}
+                                local_context['prompt_eval_tokens'] = chunk['prompt_eval_tokens']
+                                if not coalesced:
+                                    record_model_load(model_to_use, ollama_model, chunk)
+                                break
+                            
+                            if first_token_ms is None:
+                                first_token_ms = int((time.time() - start_time) * 1000)
+                            chunks.append(chunk['token'])
+                            yield sse_event('token', {'text': chunk['token']})
+                        
+                        # Judge streaming health by time to first token, less any cold load
+                        if breaker and not coalesced:
+                            breaker.record_success(
+                                (first_token_ms if first_token_ms is not None
+                                 else int((time.time() - start_time) * 1000))
+                                - warmth['load_ms']
+                            )
+                        
+                        if cache_key and not coalesced:
+                            cache_response(cache_key, ''.join(chunks), tokens_used)
+                    
+                    model_used = ollama_model
+                    local_context['history_turns'] = context['history_turns']
+                
+                except QueueFullError as e:
+                    # Waited too long for a slot; the 503 option has passed, so divert or fail
+                    if shed_local_request(model_to_use, e.retry_after):
+                        raise
+                    model_to_use = "claude"
+                    auto_switched = True
+                    routing_reason = "Local queue full"
+                
+                except Cancelled:
+                    raise
+                
+                except Exception as e:
+                    if breaker and not coalesced:
+                        breaker.record_failure(str(e))
+                    if chunks or not client:
+                        raise
+                    logger.warning(f"Local LLM stream failed: {e}, escalating to Claude")
+                    record_fallback(model_to_use, 'local_error')
+                    model_to_use = "claude"
+                    auto_switched = True
+                    routing_reason = "Local LLM error"
+            
+            if model_to_use == "claude":
+                logger.info(f"Streaming Claude: {routing_reason}")
+                
+                # History is only needed once Claude is actually called
+                context = context_manager.build_context(
+                    conversation_id,
+                    user_message,
+                    current_settings['model'],
+                    current_settings['system_prompt']
+                )
+                context_tokens_saved = context['tokens_saved']
+                system_blocks, cached_messages = apply_cache_breakpoints(
+                    current_settings['system_prompt'],
+                    context['summary'],
+                    context['messages']
+                )
+                
+                yield sse_event('meta', {
+                    'model_used': current_settings['model'],
+                    'routing_reason': routing_reason,
+                    'auto_switched': auto_switched
+                })
+                
+                flight_key = request_key(
+                    model_to_use,
+                    current_settings['model'],
+                    context['system'],
+                    current_settings['temperature'],
+                    current_settings['max_tokens'],
+                    context['messages']
+                )
+                cache_key = flight_key if response_cache else None
+                cached = cached_response(cache_key)
+                
+                if cached:
+                    yield replay_cached(cached)
+                else:
+                    claude_chunks, coalesced = single_flight.stream(
+                        flight_key,
+                        lambda flight_cancelled: stream_claude(current_settings, system_blocks, cached_messages),
+                        cancelled=cancel_token.is_cancelled
+                    )
+                    upstreams.append(claude_chunks)
+                    for chunk in claude_chunks:
+                        cancel_token.check()
+                        if chunk.get('done'):
+                            tokens_used = chunk['usage'].output_tokens
+                            if not coalesced:
+                                cache_stats = cache_usage(chunk['usage'])
+                            break
+                        
+                        if first_token_ms is None:
+                            first_token_ms = int((time.time() - start_time) * 1000)
+                        chunks.append(chunk['token'])
+                        yield sse_event('token', {'text': chunk['token']})
+                    
+                    if cache_key and not coalesced:
+                        cache_response(cache_key, ''.join(chunks), tokens_used)
+                
+                model_used = current_settings['model']
+            
+            response_time_ms = int((time.time() - start_time) * 1000)
+            assistant_message = ''.join(chunks)
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            model_display = router.get_model_display_name(model_used)
+            
+            logger.info(
+                f"Stream generated: {model_display}, "
+                f"{tokens_used} tokens, {response_time_ms}ms "
+                f"(first token {first_token_ms}ms)"
+            )
+            
+            record_chat_metrics(
+                'chat_stream',
+                model_to_use if model_to_use != "claude" else model_used,
+                routing_reason,
+                'cached' if cache_hit else 'coalesced' if coalesced else 'success',
+                duration_ms=response_time_ms,
+                first_token_ms=first_token_ms,
+                tokens=tokens_used,
+                generation_ms=(
+                    response_time_ms - first_token_ms if first_token_ms is not None else 0
+                ),
+                queue_wait_ms=admission['queue_wait_ms']
+            )
+            
+            conversation_store.append_turn(
+                conversation_id,
+                user_message,
+                assistant_message,
+                timestamp,
+                model=model_used,
+                metadata={
+                    'response_time_ms': response_time_ms,
+                    'time_to_first_token_ms': first_token_ms,
+                    'tokens_used': tokens_used,
+                    'context_tokens_saved': context_tokens_saved,
+                    'routing_reason': routing_reason,
+                    'cached': cache_hit,
+                    'coalesced': coalesced,
+                    **cache_stats,
+                    **local_context
+                }
+            )
+            
+            yield sse_event('done', {
+                'timestamp': timestamp,
+                'model_used': model_used,
+                'model_display': model_display,
+                'routing_reason': routing_reason,
+                'auto_switched': auto_switched,
+                'response_time_ms': response_time_ms,
+                'time_to_first_token_ms': first_token_ms,
+                'tokens_used': tokens_used,
+                'context_tokens_saved': context_tokens_saved,
+                **cache_stats,
+                'cached': cache_hit,
+                'coalesced': coalesced,
+                **admission,
+                **warmth,
+                **local_context,
+                # The header only covers the time before streaming began
+                'server_timing': timings.as_dict() if timings else {},
+                'success': True
+            })
+            completed = True
+        
+        except Cancelled:
+            logger.info(f"Chat stream cancelled for {conversation_id[:8]}")
+            record_cancellation('chat_stream', 'cancelled')
+            completed = True
+            yield sse_event('cancelled', {'cancelled': True, 'success': False})
+        
+        except GeneratorExit:
+            # Client disconnected; the finally below drops the upstream request
+            if not completed:
+                logger.info(f"Client disconnected from chat stream for {conversation_id[:8]}")
+                record_cancellation('chat_stream', 'disconnect')
+                cancel_token.cancel()  # Frees a queue place the upstream is still waiting for
+            raise
+        
+        except Exception as e:
+            logger.error(f"Error streaming chat message: {str(e)}")
+            record_chat_metrics('chat_stream', model_to_use, routing_reason, 'error')
+            yield sse_event('error', {
+                'error': 'Failed to process message. Please try again.',
+                'success': False
+            })
+        
+        finally:
+            for upstream in upstreams:
+                try:
+                    upstream.close()
+                except Exception as e:
+                    logger.debug(f"Closing upstream stream failed: {e}")
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop nginx buffering the stream
+        }
+    )
+
+
+@app.route('/chat/cancel', methods=['POST'])
+def cancel_chat():
+    """Abort the current conversation's in-flight generations on every worker"""
+    try:
+        if 'conversation_id' not in session:
+            return jsonify({'cancelled': 0, 'success': True})
+        
+        cancelled_here = cancellations.cancel(session['conversation_id'])
+        return jsonify({'cancelled': cancelled_here, 'success': True})
+    
+    except Exception as e:
+        logger.error(f"Error cancelling chat: {str(e)}")
+        return jsonify({
+            'error': 'Failed to cancel request',
+            'success': False
+        }), 500
+
+
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """
+    Run a JSONL batch of independent prompts and stream results as they finish
+    
+    Body: one {"message", "id"?, "model_preference"?, "preset"?} object per line
+    Query: model (default preference), preset (Claude settings, default the
+    session's), concurrency (prompts in flight)
+    
+    Response: application/x-ndjson, one result per prompt in completion order
+    (each carries its input 'index'), then {"summary": {...}} with throughput
+    """
+    try:
+        items = parse_batch(request.get_data(as_text=True).splitlines(), BATCH_MAX_ITEMS)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+    if not items:
+        return jsonify({'error': 'Batch is empty', 'success': False}), 400
+    
+    preset = request.args.get('preset')
+    if preset and preset not in CONFIGURATION_PRESETS:
+        return jsonify({'error': f"Unknown preset: {preset}", 'success': False}), 400
+    settings = dict(CONFIGURATION_PRESETS[preset] if preset else get_current_settings(session))
+    
+    default_preference = request.args.get('model') or DEFAULT_MODEL_PREFERENCE
+    try:
+        concurrency = int(request.args.get('concurrency', BATCH_CONCURRENCY))
+    except ValueError:
+        return jsonify({'error': 'concurrency must be an integer', 'success': False}), 400
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    
+    client_id = request.remote_addr
+    cancel_token = g.cancel_token
+    logger.info(f"Batch of {len(items)} prompts from {client_id} (concurrency {concurrency})")
+    
+    def worker(item):
+        try:
+            return run_batch_item(item, default_preference, settings, client_id, cancel_token)
+        except Cancelled:
+            return {'id': item.get('id'), 'success': False, 'error': 'cancelled'}
+    
+    def generate():
+        started = time.time()
+        results = []
+        outcome = 'completed'
+        batch = run_batch(items, worker, concurrency)
+        try:
+            for result in batch:
+                results.append(result)
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        except GeneratorExit:
+            # Client went away: stop the prompts still running
+            outcome = 'disconnect'
+            cancel_token.cancel()
+            record_cancellation('chat_batch', 'disconnect')
+            raise
+        finally:
+            batch.close()
+            summary = summarize(results, time.time() - started)
+            logger.info(f"Batch {outcome}: {summary}")
+        
+        if cancel_token.is_cancelled():
+            record_cancellation('chat_batch', 'cancelled')
+        yield json.dumps({'summary': {'items': len(items), **summary}}) + "\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        content_type='application/x-ndjson; charset=utf-8',
+        headers={'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/new-chat', methods=['POST'])
 def new_chat():
     """Clear conversation history and start fresh"""
     try:
-        session['conversation_history'] = []
-        # Keep settings but clear conversation
+        # Keep settings but start a new conversation ID
+        if 'conversation_id' in session:
+            cancellations.cancel(session['conversation_id'])
+            conversation_store.delete_conversation(session['conversation_id'])
+        session['conversation_id'] = ConversationStore.new_conversation_id()
         session.modified = True
         
         logger.info(f"Conversation reset for {request.remote_addr}")
@@ -584,7 +2237,7 @@ def new_chat():
             'message': 'Conversation cleared (settings preserved)',
             'success': True
         })
-        
+    
     except Exception as e:
         logger.error(f"Error clearing conversation: {str(e)}")
         return jsonify({
@@ -595,61 +2248,44 @@ def new_chat():
 
 @app.route('/export', methods=['GET'])
 def export_conversation():
-    """Export conversation history as text file"""
+    """Stream conversation history as a download (?format=txt, md or jsonl)"""
     try:
-        conversation_history = session.get('conversation_history', [])
+        conversation_id = get_conversation_id(session)
+        export_format = request.args.get('format', 'txt').lower()
         
-        if not conversation_history:
+        if export_format not in EXPORT_FORMATS:
             return jsonify({
-                'error': 'No conversation to export',
+                'error': f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}",
                 'success': False
             }), 400
         
-        # Create formatted text content
-        lines = []
-        lines.append("=" * 80)
-        lines.append("CLAUDE CONVERSATION EXPORT")
-        lines.append(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        lines.append("=" * 80)
+        if not conversation_store.count_turns(conversation_id):
+            return jsonify({
+                'error': 'No conversation to export',
+                'success': False
+            }), 400
         
-        # Add current settings
+        writer, content_type, extension = EXPORT_FORMATS[export_format]
         current_settings = get_current_settings(session)
-        lines.append("\nCONFIGURATION:")
-        lines.append(f"Model: {current_settings['model']}")
-        lines.append(f"Temperature: {current_settings['temperature']}")
-        lines.append(f"Max Tokens: {current_settings['max_tokens']}")
-        lines.append(f"System Prompt: {current_settings['system_prompt']}")
-        lines.append("\n" + "=" * 80)
-        lines.append("")
-        
-        for i, entry in enumerate(conversation_history, 1):
-            lines.append(f"--- Exchange {i} ({entry['timestamp']}) ---")
-            lines.append("")
-            lines.append(f"USER:")
-            lines.append(entry['user'])
-            lines.append("")
-            lines.append(f"ASSISTANT ({entry.get('model', 'unknown')}):")
-            lines.append(entry['assistant'])
-            lines.append("")
-            lines.append("-" * 80)
-            lines.append("")
-        
-        content = "\n".join(lines)
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.txt', encoding='utf-8') as tmp_file:
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
-        logger.info(f"Conversation exported for {request.remote_addr}")
-        
-        return send_file(
-            tmp_path,
-            as_attachment=True,
-            download_name=f'claude_conversation_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt',
-            mimetype='text/plain'
-        )
+        now = datetime.now()
         
+        logger.info(f"Conversation exported as {export_format} for {request.remote_addr}")
+        
+        # Turns are paged from the store as the response is written
+        return Response(
+            writer(
+                conversation_store.iter_turns(conversation_id),
+                current_settings,
+                now.strftime('%Y-%m-%d %H:%M:%S')
+            ),
+            content_type=content_type,
+            headers={
+                'Content-Disposition': (
+                    f'attachment; filename=claude_conversation_{now.strftime("%Y%m%d_%H%M%S")}.{extension}'
+                )
+            }
+        )
+    
     except Exception as e:
         logger.error(f"Error exporting conversation: {str(e)}")
         return jsonify({
@@ -658,43 +2294,50 @@ def export_conversation():
         }), 500
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint (totals across all workers)"""
+    return Response(
+        metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
 @app.route('/health')
 def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (served from the background prober's cache)"""
     try:
-        claude_status = "not_initialized"
-        local_status = "not_available"
+        backends = health_prober.status()
         
-        # Check Claude
-        if client:
-            try:
-                # Make a minimal test call
-                test_response = client.messages.create(
-                    model="claude-sonnet-4-5-20250929",
-                    max_tokens=10,
-                    messages=[{"role": "user", "content": "Hi"}]
-                )
-                claude_status = "connected"
-            except:
-                claude_status = "error"
+        claude_status = backends['claude']['status'] if client else "not_initialized"
         
-        # Check Local LLM
+        local_status = "discovering" if local_discovery.is_pending() else "not_available"
         if local_client:
-            try:
-                if local_client.test_connection():
-                    local_status = "connected"
-                else:
-                    local_status = "unreachable"
-            except:
-                local_status = "error"
+            local_backends = [b for name, b in backends.items() if name != 'claude']
+            if any(b['status'] == 'connected' for b in local_backends):
+                local_status = "connected"
+            elif local_backends:
+                local_status = local_backends[0]['status']
         
         return jsonify({
             'status': 'healthy',
             'claude_api': claude_status,
             'local_llm': local_status,
+            'backends': backends,
+            'circuits': {name: b.snapshot() for name, b in circuit_breakers.items()},
+            'coalescing': single_flight.stats(),
+            'admission_queues': {name: q.stats() for name, q in admission_queues.items()},
+            'residency': residency.snapshot(),
+            'local_pool': local_pool.snapshot() if local_pool else None,
+            'startup': {**startup_ms, 'local_discovery': local_discovery.status()},
+            'routing': {
+                'latency_slo_ms': ROUTING_LATENCY_SLO_MS,
+                'observed': latency_tracker.snapshot()
+            },
+            'response_cache': response_cache.stats() if response_cache else {'enabled': False},
             'timestamp': datetime.now().isoformat()
         })
-        
+    
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return jsonify({
@@ -704,6 +2347,12 @@ def health_check():
         }), 500
 
 
+# Everything above runs at import; find Ollama in the background so the
+# worker can take requests from here on
+record_startup('ready')
+local_discovery.start()
+
+
 if __name__ == '__main__':
     # Create logs directory
     os.makedirs('logs', exist_ok=True)
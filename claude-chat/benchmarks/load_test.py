@@ -0,0 +1,209 @@
+"""
+Load test for Claude Chat serving modes
+Runs the real app under gunicorn against stub Ollama/Anthropic upstreams and
+compares how many slow LLM calls each worker class can hold at once
+
+Usage (from the claude-chat directory):
+    python -m benchmarks.load_test --requests 200 --concurrency 100 --delay 1.0
+
+Compare request latency under the old blocking log handlers and the
+queued logging pipeline (short upstream delay so logging cost shows):
+    python -m benchmarks.load_test --modes gevent --log-pipelines sync,queue --delay 0.05
+"""
+
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.stubs import start_anthropic_stub, start_ollama_stub
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def start_app(worker_class, ollama_port, anthropic_port, workers=2, extra_env=None):
+    """
+    Launch the app under gunicorn pointed at the stub upstreams
+    
+    Returns:
+        tuple: (process, base_url)
+    """
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "OLLAMA_HOST": "127.0.0.1",
+        "OLLAMA_PORT": str(ollama_port),
+        "ANTHROPIC_API_KEY": "stub-key",
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{anthropic_port}",
+        "SECRET_KEY": "load-test",
+        "RATE_LIMIT": "1000000",
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_WORKER_CLASS": worker_class,
+        "GUNICORN_WORKERS": str(workers),
+        "GUNICORN_ACCESS_LOG": "/dev/null",
+        "GUNICORN_ERROR_LOG": "-",
+    })
+    env.update(extra_env or {})
+    
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base_url}/health", timeout=5)
+            return process, base_url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    
+    process.kill()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def stop_app(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def run_load(base_url, total, concurrency, path="/chat", payload_fn=None):
+    """
+    Fire `total` chat requests with `concurrency` client threads while
+    probing /health, and return latency/throughput figures
+    """
+    payload_fn = payload_fn or (lambda i: {
+        "message": f"load test message {i}",
+        "model_preference": "claude" if i % 2 else "local-general",
+    })
+    latencies = []
+    errors = 0
+    health_latencies = []
+    done = threading.Event()
+    
+    def one(i):
+        started = time.perf_counter()
+        try:
+            response = requests.post(f"{base_url}{path}", json=payload_fn(i), timeout=600)
+            response.content
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+        return ok, time.perf_counter() - started
+    
+    def probe_health():
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                requests.get(f"{base_url}/health", timeout=60)
+                health_latencies.append(time.perf_counter() - started)
+            except requests.exceptions.RequestException:
+                pass
+            done.wait(0.5)
+    
+    prober = threading.Thread(target=probe_health, daemon=True)
+    prober.start()
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok, latency in pool.map(one, range(total)):
+            latencies.append(latency)
+            errors += 0 if ok else 1
+    wall = time.perf_counter() - started
+    
+    done.set()
+    prober.join()
+    
+    return {
+        "requests": total,
+        "errors": errors,
+        "wall_s": wall,
+        "throughput_rps": total / wall if wall else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "health_p95_ms": _percentile(health_latencies, 95) * 1000,
+    }
+
+
+def print_results(results):
+    header = (
+        f"{'mode':<16} {'reqs':>6} {'errors':>6} {'wall s':>8} {'req/s':>8} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'health p95':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for mode, r in results.items():
+        print(
+            f"{mode:<16} {r['requests']:>6} {r['errors']:>6} {r['wall_s']:>8.1f} "
+            f"{r['throughput_rps']:>8.1f} {r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f} "
+            f"{r['p99_ms']:>9.0f} {r['health_p95_ms']:>11.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gunicorn worker classes under slow LLM calls")
+    parser.add_argument("--requests", type=int, default=100, help="Total /chat requests per mode")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent client connections")
+    parser.add_argument("--delay", type=float, default=1.0, help="Stub upstream latency in seconds")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--modes", default="sync,gevent", help="Comma-separated worker classes")
+    parser.add_argument(
+        "--log-pipelines", default="queue",
+        help="Comma-separated LOG_PIPELINE values to run each mode with (sync, queue)"
+    )
+    args = parser.parse_args()
+    
+    _, ollama_port = start_ollama_stub(delay=args.delay)
+    _, anthropic_port = start_anthropic_stub(delay=args.delay)
+    
+    pipelines = args.log_pipelines.split(",")
+    results = {}
+    for mode in args.modes.split(","):
+        for pipeline in pipelines:
+            label = f"{mode}/{pipeline}-log" if len(pipelines) > 1 else mode
+            process, base_url = start_app(
+                mode, ollama_port, anthropic_port, workers=args.workers,
+                extra_env={"LOG_PIPELINE": pipeline}
+            )
+            try:
+                results[label] = run_load(base_url, args.requests, args.concurrency)
+            finally:
+                stop_app(process)
+    
+    print(f"\n{args.requests} requests, concurrency {args.concurrency}, "
+          f"upstream delay {args.delay}s, {args.workers} workers\n")
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
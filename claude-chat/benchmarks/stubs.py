@@ -0,0 +1,249 @@
+"""
+Stub upstream servers for benchmarks
+Minimal stand-ins for the Ollama and Anthropic Messages APIs with a
+configurable response delay, so load tests never touch a GPU or spend money
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+STUB_WORDS = ["This", " is", " a", " stubbed", " response", "."]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Shared helpers for the stub handlers"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        """Silence per-request logging"""
+        pass
+    
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+    
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+    
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+    
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+    
+    def _token_delay(self) -> float:
+        """Spread the configured delay across the streamed tokens"""
+        return self.server.delay / (len(STUB_WORDS) + 1)
+
+
+class OllamaStubHandler(_StubHandler):
+    """Implements /api/tags, /api/ps, /api/generate and /api/chat"""
+    
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": m} for m in self.server.models]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": m} for m in self.server.loaded]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+    
+    def do_POST(self):
+        payload = self._read_json()
+        
+        if self.path not in ("/api/generate", "/api/chat"):
+            self._send_json({}, 200)
+            return
+        
+        model = payload.get("model", "")
+        load_duration = 0
+        if model and model not in self.server.loaded:
+            # Cold load; evict the oldest model if only a few fit in memory
+            time.sleep(self.server.load_delay)
+            load_duration = int(self.server.load_delay * 1_000_000_000)
+            self.server.loaded.append(model)
+            if self.server.max_loaded and len(self.server.loaded) > self.server.max_loaded:
+                self.server.loaded.pop(0)
+        
+        # A generate request without a prompt only loads the model
+        if self.path == "/api/generate" and "prompt" not in payload:
+            self._send_json({"model": model, "done": True, "done_reason": "load",
+                             "load_duration": load_duration})
+            return
+        
+        final = {
+            "model": model,
+            "done": True,
+            "eval_count": len(STUB_WORDS),
+            "prompt_eval_count": self._prompt_eval_count(model, payload),
+            "total_duration": int(self.server.delay * 1_000_000_000) + load_duration,
+            "load_duration": load_duration,
+            "context": [1, 2, 3],
+        }
+        
+        if not payload.get("stream", True):
+            time.sleep(self.server.delay)
+            text = "".join(STUB_WORDS)
+            if self.path == "/api/generate":
+                final["response"] = text
+            else:
+                final["message"] = {"role": "assistant", "content": text}
+            self._send_json(final)
+            return
+        
+        self._start_chunked("application/x-ndjson")
+        for word in STUB_WORDS:
+            time.sleep(self._token_delay())
+            if self.path == "/api/generate":
+                chunk = {"model": model, "response": word, "done": False}
+            else:
+                chunk = {"model": model, "message": {"role": "assistant", "content": word}, "done": False}
+            self._send_chunk((json.dumps(chunk) + "\n").encode())
+        time.sleep(self._token_delay())
+        self._send_chunk((json.dumps(final) + "\n").encode())
+        self._end_chunked()
+    
+    def _prompt_eval_count(self, model: str, payload: dict) -> int:
+        """Words not covered by the previous prompt's prefix, like Ollama's KV cache"""
+        if self.path == "/api/chat":
+            prompt = [m.get("content", "") for m in payload.get("messages", [])]
+        else:
+            prompt = [payload.get("prompt", "")]
+        
+        with self.server.lock:
+            previous = self.server.prompts.get(model, [])
+            self.server.prompts[model] = prompt
+        
+        shared = 0
+        while shared < min(len(prompt), len(previous)) and prompt[shared] == previous[shared]:
+            shared += 1
+        return sum(len(text.split()) for text in prompt[shared:])
+
+
+class AnthropicStubHandler(_StubHandler):
+    """Implements POST /v1/messages (plain and streaming) and GET /v1/models"""
+    
+    def do_GET(self):
+        if self.path.startswith("/v1/models"):
+            self._send_json({
+                "data": [{
+                    "type": "model",
+                    "id": "claude-stub",
+                    "display_name": "Claude Stub",
+                    "created_at": "2025-01-01T00:00:00Z"
+                }],
+                "has_more": False,
+                "first_id": "claude-stub",
+                "last_id": "claude-stub",
+            })
+        else:
+            self.send_error(404)
+    
+    def do_POST(self):
+        payload = self._read_json()
+        model = payload.get("model", "claude-stub")
+        text = "".join(STUB_WORDS)
+        usage = {"input_tokens": 10, "output_tokens": len(STUB_WORDS)}
+        
+        if not payload.get("stream"):
+            time.sleep(self.server.delay)
+            self._send_json({
+                "id": "msg_stub",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": usage,
+            })
+            return
+        
+        def event(name, data):
+            self._send_chunk(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+        
+        self._start_chunked("text/event-stream")
+        event("message_start", {"type": "message_start", "message": {
+            "id": "msg_stub", "type": "message", "role": "assistant", "model": model,
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": 10, "output_tokens": 1},
+        }})
+        event("content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}})
+        for word in STUB_WORDS:
+            time.sleep(self._token_delay())
+            event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": word}})
+        time.sleep(self._token_delay())
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {"type": "message_delta",
+                                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": len(STUB_WORDS)}})
+        event("message_stop", {"type": "message_stop"})
+        self._end_chunked()
+
+
+def _serve(handler, delay: float, **attrs) -> Tuple[ThreadingHTTPServer, int]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    server.delay = delay
+    for name, value in attrs.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def start_ollama_stub(
+    delay: float = 1.0,
+    models: List[str] = None,
+    load_delay: float = 0.0,
+    max_loaded: int = 0
+) -> Tuple[ThreadingHTTPServer, int]:
+    """
+    Start a stub Ollama server on a free local port
+    
+    Args:
+        delay: Seconds each generation takes
+        models: Model names reported by /api/tags
+        load_delay: Extra seconds the first request to an unloaded model takes
+        max_loaded: Models kept in memory at once (0 for unlimited)
+    
+    Returns:
+        tuple: (server, port)
+    """
+    models = models or ["qwen2.5:14b", "qwen2.5-coder:14b"]
+    return _serve(
+        OllamaStubHandler, delay, models=list(models), loaded=[],
+        load_delay=load_delay, max_loaded=max_loaded,
+        prompts={}, lock=threading.Lock()
+    )
+
+
+def start_anthropic_stub(delay: float = 1.0) -> Tuple[ThreadingHTTPServer, int]:
+    """
+    Start a stub Anthropic Messages API server on a free local port
+    
+    Args:
+        delay: Seconds each message takes
+    
+    Returns:
+        tuple: (server, port)
+    """
+    return _serve(AnthropicStubHandler, delay)
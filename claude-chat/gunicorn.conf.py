@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for Claude Chat
+Cooperative gevent workers yield while waiting on Claude/Ollama, so a slow
+generation no longer pins a whole worker (or blocks /health probes)
+"""
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Worker model: "gevent" (default) or "sync" for the old blocking behaviour
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+
+# Concurrent connections per gevent worker (ignored by sync workers)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+
+# gevent workers heartbeat while requests wait, so this only catches hung workers
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Logging
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "logs/access.log")
+errorlog = os.getenv("GUNICORN_ERROR_LOG", "logs/error.log")
@@ -0,0 +1,217 @@
+"""
+Admission Control - Bounded FIFO queue in front of each local model
+Ollama runs one 14B model with very little parallelism, so requests beyond
+its concurrency wait in a short queue; once that queue is full new work is
+shed immediately instead of piling up until it times out
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from llm.cancellation import Cancelled
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting request checks whether it was cancelled
+CANCEL_POLL_SECONDS = 0.25
+
+
+class QueueFullError(Exception):
+    """Raised when a request cannot be admitted"""
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """
+    Concurrency limit plus bounded wait queue for one model (per process)
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 2,
+        max_queue: int = 8,
+        max_wait_seconds: float = 30,
+        on_depth_change: Optional[Callable[[int], None]] = None
+    ):
+        """
+        Initialize admission queue
+        
+        Args:
+            name: Model name used in logs and errors
+            max_concurrency: Requests allowed to run at once
+            max_queue: Requests allowed to wait; beyond this they are shed
+            max_wait_seconds: Longest a request waits before it is shed
+            on_depth_change: Optional fn(delta) called when the queue grows or shrinks
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.on_depth_change = on_depth_change
+        
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = deque()
+        self._avg_service_s = 5.0  # Running estimate for Retry-After
+    
+    def is_full(self) -> bool:
+        """Whether a new request would be shed right now"""
+        with self._cond:
+            return (
+                self._active >= self.max_concurrency
+                and len(self._waiting) >= self.max_queue
+            )
+    
+    def retry_after(self) -> float:
+        """Estimated seconds until a queue slot frees up"""
+        with self._cond:
+            return self._retry_after()
+    
+    def expected_wait_ms(self) -> int:
+        """Estimated wait before a request arriving now would start running"""
+        with self._cond:
+            if self._active < self.max_concurrency and not self._waiting:
+                return 0
+            backlog = len(self._waiting) + 1
+            return int(self._avg_service_s * backlog / self.max_concurrency * 1000)
+    
+    def _retry_after(self) -> float:
+        backlog = len(self._waiting) + 1
+        return max(1.0, self._avg_service_s * backlog / self.max_concurrency)
+    
+    def _depth_changed(self, delta: int):
+        if self.on_depth_change:
+            try:
+                self.on_depth_change(delta)
+            except Exception as e:
+                logger.error(f"Queue depth callback failed for {self.name}: {e}")
+    
+    def _wait_turn(
+        self,
+        ticket: object,
+        deadline: float,
+        cancelled: Optional[Callable[[], bool]]
+    ) -> str:
+        """
+        Wait until a queued ticket can take a slot, then take it
+        
+        Returns:
+            str: 'admitted', 'timeout' or 'cancelled' (the ticket has left
+                the queue either way)
+        """
+        try:
+            while True:
+                with self._cond:
+                    remaining = deadline - time.time()
+                    admitted = self._cond.wait_for(
+                        lambda: self._waiting[0] is ticket and self._active < self.max_concurrency,
+                        timeout=min(remaining, CANCEL_POLL_SECONDS) if cancelled else remaining
+                    )
+                    if admitted or remaining <= 0:
+                        self._waiting.remove(ticket)
+                        if admitted:
+                            self._active += 1
+                        self._cond.notify_all()
+                        return 'admitted' if admitted else 'timeout'
+                
+                if cancelled and cancelled():
+                    break
+        except BaseException:
+            # e.g. a failing cancel check; never leave a dead ticket at the head
+            self._leave(ticket)
+            raise
+        
+        self._leave(ticket)
+        return 'cancelled'
+    
+    def _leave(self, ticket: object):
+        """Take a ticket out of the queue without admitting it"""
+        with self._cond:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+            self._cond.notify_all()
+    
+    @contextmanager
+    def admit(self, cancelled: Optional[Callable[[], bool]] = None):
+        """
+        Hold a concurrency slot for the duration of the block
+        
+        Args:
+            cancelled: Optional fn() polled while waiting; a cancelled request
+                gives up its place in the queue
+        
+        Yields:
+            dict: {'queue_depth': int, 'queue_wait_ms': int} where queue_depth
+                is the caller's position on arrival (0 if it ran at once)
+        
+        Raises:
+            QueueFullError: If the queue is full or the wait times out
+            Cancelled: If the request was cancelled while waiting
+        """
+        arrived = time.time()
+        with self._cond:
+            if self._active < self.max_concurrency and not self._waiting:
+                self._active += 1
+                depth = 0
+            else:
+                if len(self._waiting) >= self.max_queue:
+                    raise QueueFullError(
+                        f"{self.name} queue full ({len(self._waiting)} waiting)",
+                        self._retry_after()
+                    )
+                
+                ticket = object()
+                self._waiting.append(ticket)
+                depth = len(self._waiting)
+        
+        # The depth callback and cancel check may do I/O, so they run without
+        # the lock; arrivals and releases on this queue never wait for them
+        if depth:
+            self._depth_changed(1)
+            try:
+                outcome = self._wait_turn(ticket, arrived + self.max_wait_seconds, cancelled)
+            finally:
+                self._depth_changed(-1)
+            if outcome == 'cancelled':
+                raise Cancelled(f"Request cancelled while queued for {self.name}")
+            if outcome == 'timeout':
+                raise QueueFullError(
+                    f"{self.name} queue wait exceeded {self.max_wait_seconds}s",
+                    self.retry_after()
+                )
+        
+        started = time.time()
+        try:
+            yield {
+                'queue_depth': depth,
+                'queue_wait_ms': int((started - arrived) * 1000)
+            }
+        finally:
+            with self._cond:
+                self._active -= 1
+                service_s = time.time() - started
+                self._avg_service_s = 0.8 * self._avg_service_s + 0.2 * service_s
+                self._cond.notify_all()
+    
+    def stats(self) -> Dict:
+        """
+        Queue state for health reporting
+        
+        Returns:
+            dict: {'active', 'waiting', 'max_concurrency', 'max_queue'}
+        """
+        with self._cond:
+            return {
+                'active': self._active,
+                'waiting': len(self._waiting),
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue
+            }
@@ -0,0 +1,286 @@
+"""
+Backend Pool - Spread local model requests over several Ollama servers
+Tracks each node's health, installed and loaded models, requests in flight
+and recent latency. A conversation sticks to the node that served it last,
+since that node holds its KV cache; new conversations are placed by
+rendezvous hashing so every worker agrees on the same node, and overflow
+goes to the least-busy (or lowest latency x load) node
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from llm.cancellation import Cancelled
+from llm.local_client import LocalLLMClient, get_local_client
+
+logger = logging.getLogger(__name__)
+
+LEAST_OUTSTANDING = "least_outstanding"
+LATENCY_WEIGHTED = "latency"
+
+
+def parse_endpoints(spec: str, default_port: int = 11434) -> List[Tuple[str, int]]:
+    """
+    Parse "host[:port],..." into (host, port) pairs
+    
+    Returns:
+        list: Endpoints in the order given (duplicates removed)
+    """
+    endpoints = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        host, _, port = part.rpartition(':') if ':' in part else (part, '', '')
+        endpoint = (host, int(port) if port else default_port)
+        if endpoint not in endpoints:
+            endpoints.append(endpoint)
+    return endpoints
+
+
+class _Node:
+    """State for one Ollama server"""
+    
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.healthy = False
+        self.installed = set()
+        self.loaded = set()
+        self.outstanding = 0
+        self.latency_ms = None  # EWMA of whole-request time
+        self.consecutive_failures = 0
+        self.served = 0
+        self.last_checked = None
+
+
+class OllamaPool:
+    """
+    Node selection and bookkeeping for a set of Ollama servers (per process)
+    """
+    
+    def __init__(
+        self,
+        endpoints: List[Tuple[str, int]],
+        strategy: str = LEAST_OUTSTANDING,
+        sticky_slack: int = 2,
+        sticky_ttl_seconds: float = 1800,
+        max_sticky: int = 10000,
+        failure_threshold: int = 3
+    ):
+        """
+        Initialize pool
+        
+        Args:
+            endpoints: (host, port) of every Ollama server
+            strategy: "least_outstanding" or "latency" (latency x load)
+            sticky_slack: A conversation leaves its node only when that node
+                has this many more requests in flight than the least-busy one
+            sticky_ttl_seconds: How long an idle conversation stays pinned
+            max_sticky: Pinned conversations remembered (oldest dropped first)
+            failure_threshold: Consecutive request failures that take a node
+                out until its next successful health check
+        """
+        self.nodes = [_Node(host, port) for host, port in endpoints]
+        self.strategy = strategy
+        self.sticky_slack = sticky_slack
+        self.sticky_ttl_seconds = sticky_ttl_seconds
+        self.max_sticky = max_sticky
+        self.failure_threshold = failure_threshold
+        
+        self._lock = threading.Lock()
+        self._sticky: "OrderedDict[str, Tuple[_Node, float]]" = OrderedDict()
+        
+        logger.info(f"OllamaPool initialized with {len(self.nodes)} nodes ({strategy})")
+    
+    def refresh(self) -> bool:
+        """
+        Re-check every node's installed and loaded models (health probe)
+        
+        Returns:
+            bool: True if at least one node is healthy
+        """
+        for node in self.nodes:
+            client = get_local_client(host=node.host, port=node.port)
+            installed = client.installed_models()
+            loaded = client.loaded_models() if installed is not None else None
+            
+            with self._lock:
+                node.last_checked = time.time()
+                if installed is None:
+                    if node.healthy:
+                        logger.warning(f"Ollama node {node.name} is unreachable")
+                    node.healthy = False
+                    continue
+                if not node.healthy:
+                    logger.info(f"Ollama node {node.name} is healthy ({len(installed)} models)")
+                node.healthy = True
+                node.consecutive_failures = 0
+                node.installed = set(installed)
+                node.loaded = set(loaded or [])
+        
+        with self._lock:
+            return any(node.healthy for node in self.nodes)
+    
+    def endpoints_with(self, model: str) -> List[Tuple[str, int]]:
+        """(host, port) of every healthy node with the model installed"""
+        with self._lock:
+            return [
+                (node.host, node.port) for node in self.nodes
+                if node.healthy and model in node.installed
+            ]
+    
+    def has_model(self, model: str) -> bool:
+        """Whether any healthy node has the model installed"""
+        with self._lock:
+            return any(node.healthy and model in node.installed for node in self.nodes)
+    
+    def loaded_models(self) -> List[str]:
+        """Models loaded on at least one healthy node"""
+        with self._lock:
+            return sorted(set().union(*(node.loaded for node in self.nodes if node.healthy)))
+    
+    def _rendezvous(self, key: str, nodes: List[_Node]) -> _Node:
+        """Highest random weight node for a key; stable across processes"""
+        return max(
+            nodes,
+            key=lambda node: hashlib.blake2b(f"{node.name}|{key}".encode(), digest_size=8).digest()
+        )
+    
+    def _score(self, node: _Node):
+        if self.strategy == LATENCY_WEIGHTED:
+            # Unmeasured nodes score zero so each gets tried at least once
+            latency = node.latency_ms if node.latency_ms is not None else 0.0
+            return (latency * (node.outstanding + 1), node.outstanding)
+        return (node.outstanding, node.latency_ms or 0.0)
+    
+    def pick(self, model: str, conversation_id: Optional[str] = None) -> _Node:
+        """
+        Choose the node for a request and count it as in flight
+        
+        Args:
+            model: Ollama model name
+            conversation_id: Keeps a conversation on the node holding its cache
+        
+        Returns:
+            _Node: Chosen node (release it with release())
+        
+        Raises:
+            Exception: If no healthy node has the model
+        """
+        with self._lock:
+            eligible = [n for n in self.nodes if n.healthy and model in n.installed]
+            if not eligible:
+                raise Exception(f"No healthy Ollama node has {model}")
+            
+            least_busy = min(n.outstanding for n in eligible)
+            warm = [n for n in eligible if model in n.loaded] or eligible
+            node = None
+            
+            if conversation_id:
+                pinned = self._sticky.get(conversation_id)
+                if pinned and time.time() - pinned[1] > self.sticky_ttl_seconds:
+                    pinned = None
+                preferred = pinned[0] if pinned else self._rendezvous(conversation_id, warm)
+                if preferred in eligible and preferred.outstanding < least_busy + self.sticky_slack:
+                    node = preferred
+            
+            if node is None:
+                # Nodes with the model loaded first, unless they are all much busier
+                node = min(warm, key=self._score)
+                if node.outstanding >= least_busy + self.sticky_slack:
+                    node = min(eligible, key=self._score)
+            
+            node.outstanding += 1
+            if conversation_id:
+                self._sticky[conversation_id] = (node, time.time())
+                self._sticky.move_to_end(conversation_id)
+                while len(self._sticky) > self.max_sticky:
+                    self._sticky.popitem(last=False)
+            return node
+    
+    def release(self, node: _Node, model: str, duration_ms: float, error: Optional[str] = None):
+        """
+        Finish a request picked on a node
+        
+        Args:
+            node: Node returned by pick()
+            model: Model the request used (now loaded there if it succeeded)
+            duration_ms: Time the request held the node
+            error: Failure message, or None if it succeeded or was cancelled
+        """
+        with self._lock:
+            node.outstanding -= 1
+            if error is None:
+                node.consecutive_failures = 0
+                node.served += 1
+                node.loaded.add(model)
+                node.latency_ms = (
+                    duration_ms if node.latency_ms is None
+                    else 0.8 * node.latency_ms + 0.2 * duration_ms
+                )
+                return
+            
+            node.consecutive_failures += 1
+            if node.healthy and node.consecutive_failures >= self.failure_threshold:
+                node.healthy = False
+                logger.warning(
+                    f"Ollama node {node.name} taken out after {node.consecutive_failures} failures: {error}"
+                )
+    
+    @contextmanager
+    def lease(self, model: str, conversation_id: Optional[str] = None) -> Iterator[LocalLLMClient]:
+        """
+        Hold a node for the duration of the block
+        
+        Yields:
+            LocalLLMClient: Client for the model on the chosen node
+        """
+        node = self.pick(model, conversation_id)
+        started = time.time()
+        error = None
+        try:
+            yield get_local_client(host=node.host, port=node.port, model=model)
+        except (Cancelled, GeneratorExit):
+            raise  # The client gave up; not the node's fault
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.release(node, model, (time.time() - started) * 1000, error)
+    
+    def stream_chat(self, model: str, conversation_id: Optional[str], messages: List[Dict], **kwargs) -> Iterator[Dict]:
+        """LocalLLMClient.stream_chat on a node picked when the stream starts"""
+        with self.lease(model, conversation_id) as client:
+            yield from client.stream_chat(messages, **kwargs)
+    
+    def snapshot(self) -> Dict:
+        """
+        Pool state for health reporting
+        
+        Returns:
+            dict: {'strategy', 'sticky_conversations', 'nodes': {name: {...}}}
+        """
+        with self._lock:
+            return {
+                'strategy': self.strategy,
+                'sticky_conversations': len(self._sticky),
+                'nodes': {
+                    node.name: {
+                        'healthy': node.healthy,
+                        'outstanding': node.outstanding,
+                        'served': node.served,
+                        'latency_ms': int(node.latency_ms) if node.latency_ms is not None else None,
+                        'loaded': sorted(node.loaded),
+                        'installed': len(node.installed),
+                        'consecutive_failures': node.consecutive_failures
+                    }
+                    for node in self.nodes
+                }
+            }
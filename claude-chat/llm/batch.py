@@ -0,0 +1,128 @@
+"""
+Batch - Run many independent prompts with bounded concurrency
+A fixed set of worker threads pulls items from a shared queue, so at most
+`concurrency` prompts are in flight however long the batch is; results are
+yielded in completion order, each tagged with its position in the input
+"""
+
+import contextvars
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+
+def parse_batch(lines: Iterable[str], max_items: int) -> List[Dict]:
+    """
+    Parse a JSONL batch, one {"message": ...} object per line
+    
+    Args:
+        lines: Payload lines (blank lines are skipped)
+        max_items: Most prompts one batch may hold
+    
+    Returns:
+        list: Item dicts in input order
+    
+    Raises:
+        ValueError: If a line is not a JSON object or the batch is too large
+    """
+    items = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {e.msg}")
+        if not isinstance(item, dict):
+            raise ValueError(f"Line {number} must be a JSON object")
+        items.append(item)
+        if len(items) > max_items:
+            raise ValueError(f"Batch too large. Please limit to {max_items} prompts.")
+    return items
+
+
+def run_batch(
+    items: List[Dict],
+    worker: Callable[[Dict], Dict],
+    concurrency: int
+) -> Iterator[Dict]:
+    """
+    Run worker(item) for every item, at most `concurrency` at a time
+    
+    A worker exception becomes an error result rather than ending the
+    batch. Closing the generator stops workers from starting new items;
+    items already running finish (or are cancelled by the worker itself)
+    
+    Args:
+        items: Batch items
+        worker: Fn(item) -> result dict
+        concurrency: Worker threads
+    
+    Yields:
+        dict: Worker result plus 'index', in completion order
+    """
+    pending = queue.SimpleQueue()
+    for index, item in enumerate(items):
+        pending.put((index, item))
+    results = queue.SimpleQueue()
+    stop = threading.Event()
+    
+    def run():
+        while not stop.is_set():
+            try:
+                index, item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = worker(item)
+            except Exception as e:
+                logger.warning(f"Batch item {index} failed: {e}")
+                result = {'success': False, 'error': str(e)}
+            results.put({'index': index, **result})
+    
+    for n in range(min(concurrency, len(items))):
+        # Each worker gets a copy of the caller's context, so request timings see it
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(run,),
+            name=f"batch-{n}",
+            daemon=True
+        ).start()
+    
+    try:
+        for _ in range(len(items)):
+            yield results.get()
+    finally:
+        stop.set()
+
+
+def summarize(results: List[Dict], elapsed_seconds: float) -> Dict:
+    """
+    Aggregate throughput for a finished (or abandoned) batch
+    
+    Returns:
+        dict: Counts, elapsed time, prompts and tokens per second, and
+            prompts per model
+    """
+    succeeded = [r for r in results if r.get('success')]
+    tokens = sum(r.get('tokens', 0) for r in succeeded)
+    by_model = {}
+    for r in succeeded:
+        by_model[r['model_used']] = by_model.get(r['model_used'], 0) + 1
+    
+    return {
+        'completed': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'elapsed_ms': int(elapsed_seconds * 1000),
+        'prompts_per_second': round(len(succeeded) / elapsed_seconds, 2) if elapsed_seconds else None,
+        'tokens_per_second': round(tokens / elapsed_seconds, 1) if elapsed_seconds else None,
+        'tokens': tokens,
+        'by_model': by_model
+    }
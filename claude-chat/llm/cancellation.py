@@ -0,0 +1,128 @@
+"""
+Cancellation - Abort in-flight generations when their client goes away
+Each request holds a token that is set by /chat/cancel on this worker at
+once, or noticed by polling the shared cancel store when the cancel landed
+on another worker; generation loops check it between chunks
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+
+class Cancelled(Exception):
+    """Raised when a request was cancelled by its client"""
+    pass
+
+
+class CancelToken:
+    """
+    Cancellation flag for one request
+    """
+    
+    def __init__(self, conversation_id: str, store=None, poll_interval: float = 0.5):
+        """
+        Initialize cancel token
+        
+        Args:
+            conversation_id: Conversation the request belongs to
+            store: CancelStore shared across workers (optional)
+            poll_interval: Minimum seconds between store lookups
+        """
+        self.conversation_id = conversation_id
+        self.store = store
+        self.poll_interval = poll_interval
+        self.started_at = time.time()
+        self._event = threading.Event()
+        self._last_poll = self.started_at
+    
+    def cancel(self):
+        """Mark the request cancelled"""
+        self._event.set()
+    
+    def is_cancelled(self) -> bool:
+        """Whether the request was cancelled, here or on another worker"""
+        if self._event.is_set():
+            return True
+        
+        now = time.time()
+        if self.store and now - self._last_poll >= self.poll_interval:
+            self._last_poll = now
+            try:
+                cancelled_at = self.store.cancelled_at(self.conversation_id)
+            except Exception as e:
+                logger.error(f"Failed to check cancellation: {e}")
+                cancelled_at = None
+            if cancelled_at is not None and cancelled_at >= self.started_at:
+                self._event.set()
+        
+        return self._event.is_set()
+    
+    def check(self):
+        """
+        Raises:
+            Cancelled: If the request was cancelled
+        """
+        if self.is_cancelled():
+            raise Cancelled(f"Request for {self.conversation_id[:8]} cancelled")
+
+
+class CancellationRegistry:
+    """
+    In-flight request tokens for this process, plus the shared cancel store
+    """
+    
+    def __init__(self, store=None, poll_interval: float = 0.5):
+        """
+        Initialize registry
+        
+        Args:
+            store: CancelStore shared across workers (optional)
+            poll_interval: Minimum seconds between store lookups per token
+        """
+        self.store = store
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._tokens: Dict[str, Set[CancelToken]] = {}
+    
+    def register(self, conversation_id: str) -> CancelToken:
+        """
+        Create the token for a request that is starting
+        
+        Returns:
+            CancelToken: Checked by the request between chunks
+        """
+        token = CancelToken(conversation_id, self.store, self.poll_interval)
+        with self._lock:
+            self._tokens.setdefault(conversation_id, set()).add(token)
+        return token
+    
+    def unregister(self, token: CancelToken):
+        """Forget a finished request's token"""
+        with self._lock:
+            tokens = self._tokens.get(token.conversation_id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens[token.conversation_id]
+    
+    def cancel(self, conversation_id: str) -> int:
+        """
+        Cancel every in-flight request for a conversation on every worker
+        
+        Returns:
+            int: Requests cancelled directly on this worker
+        """
+        with self._lock:
+            tokens = list(self._tokens.get(conversation_id, ()))
+        for token in tokens:
+            token.cancel()
+        
+        if self.store:
+            self.store.request_cancel(conversation_id)
+        
+        logger.info(f"Cancelled requests for {conversation_id[:8]} ({len(tokens)} on this worker)")
+        return len(tokens)
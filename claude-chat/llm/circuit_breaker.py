@@ -0,0 +1,141 @@
+"""
+Circuit Breaker - Fast failover away from unhealthy backends
+Tracks recent outcomes per backend; once too many calls fail or run slow
+the circuit opens and callers go straight to their fallback instead of
+waiting out a timeout, then a single trial request probes for recovery
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one backend (per process)
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        latency_threshold_ms: int = 30000,
+        window_size: int = 10,
+        min_calls: int = 4,
+        open_seconds: float = 30
+    ):
+        """
+        Initialize circuit breaker
+        
+        Args:
+            name: Backend name used in logs and routing reasons
+            failure_rate_threshold: Failure fraction of the window that opens the circuit
+            latency_threshold_ms: Successful calls slower than this count as failures
+            window_size: Number of recent outcomes considered
+            min_calls: Outcomes needed before the failure rate is trusted
+            open_seconds: Time the circuit stays open before a trial request
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.latency_threshold_ms = latency_threshold_ms
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        
+        self._outcomes = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        """Current state, moving open -> half_open once open_seconds has passed"""
+        with self._lock:
+            return self._current_state()
+    
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.time() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._trial_started = None
+            logger.info(f"Circuit for {self.name} half-open; allowing a trial request")
+        return self._state
+    
+    def allow_request(self) -> bool:
+        """
+        Whether a call to this backend should be attempted
+        
+        Returns:
+            bool: True when closed, or for the single trial call while half-open
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == OPEN:
+                return False
+            
+            # Half-open: one trial at a time; retry if a trial never reported back
+            now = time.time()
+            if self._trial_started is None or now - self._trial_started >= self.open_seconds:
+                self._trial_started = now
+                return True
+            return False
+    
+    def record_success(self, latency_ms: int = 0):
+        """Record a completed call; slow calls count as failures"""
+        if self.latency_threshold_ms and latency_ms > self.latency_threshold_ms:
+            self.record_failure(f"slow response ({latency_ms}ms)")
+            return
+        
+        with self._lock:
+            if self._current_state() == HALF_OPEN:
+                self._outcomes.clear()
+                self._state = CLOSED
+                logger.info(f"Circuit for {self.name} closed")
+            self._outcomes.append(True)
+    
+    def record_failure(self, error: str = ""):
+        """Record a failed call, opening the circuit past the failure threshold"""
+        with self._lock:
+            state = self._current_state()
+            self._outcomes.append(False)
+            
+            if state == HALF_OPEN:
+                self._open(f"trial failed: {error}")
+                return
+            
+            if state == CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate_threshold:
+                    self._open(f"{failures}/{len(self._outcomes)} recent calls failed: {error}")
+    
+    def _open(self, reason: str):
+        self._state = OPEN
+        self._opened_at = time.time()
+        self._trial_started = None
+        logger.warning(f"Circuit for {self.name} opened ({reason})")
+    
+    def snapshot(self) -> Dict:
+        """
+        Breaker state for health reporting
+        
+        Returns:
+            dict: {'state', 'failure_rate', 'recent_calls', 'open_for_s'}
+        """
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._outcomes)
+            return {
+                'state': state,
+                'failure_rate': round(self._outcomes.count(False) / calls, 3) if calls else 0.0,
+                'recent_calls': calls,
+                'open_for_s': round(time.time() - self._opened_at, 1) if state != CLOSED else 0.0
+            }
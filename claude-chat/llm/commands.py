@@ -0,0 +1,128 @@
+"""
+Commands - Recognize settings, preset and configuration-advice messages
+Every phrase is compiled once into a single pattern when the dispatcher is
+built, so a message is classified in one scan instead of a loop of regex
+searches and substring checks per preset
+"""
+
+import re
+from typing import Dict, Optional, Tuple
+
+# Whole-message commands (after lowercasing and collapsing whitespace)
+EXACT_COMMANDS = {
+    'show settings': 'show',
+    'current settings': 'show',
+    'what are your settings': 'show',
+    'display settings': 'show',
+    'settings': 'show',
+    'reset settings': 'reset',
+    'default settings': 'reset',
+    'apply suggested settings': 'apply',
+}
+
+# Requests for configuration advice, in priority order: (pattern, advice type)
+ADVICE_PATTERNS = [
+    (r'\bconfigure\s+(?:yourself|settings|claude)\b', 'general'),
+    (r'\bwhat\s+settings\s+(?:should|would|do)\b', 'advice'),
+    (r'\bhow\s+should\s+(?:you|claude)\s+be\s+configured\b', 'advice'),
+    (r'\boptimize\s+(?:yourself|settings)\s+for\b', 'optimize'),
+    (r'\bset\s+up\s+for\b', 'optimize'),
+    (r'\bbest\s+settings\s+for\b', 'advice'),
+]
+
+# Words that say "give me settings" rather than what the settings are for
+_FILLER_WORDS = {
+    'a', 'an', 'and', 'be', 'best', 'can', 'claude', 'configure', 'configured',
+    'could', 'do', 'for', 'help', 'how', 'i', 'is', 'it', 'me', 'my', 'optimize',
+    'please', 'set', 'setting', 'settings', 'should', 'the', 'to', 'up', 'use',
+    'want', 'what', 'would', 'you', 'yourself'
+}
+_WORD = re.compile(r"[a-z0-9+#]+")
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(message: str) -> str:
+    """Lowercase and collapse whitespace"""
+    return _WHITESPACE.sub(' ', message.lower()).strip()
+
+
+def advice_intent(message: str) -> str:
+    """
+    Reduce an advice request to what it is for, so rephrasings share advice
+    
+    "Configure yourself for coding" and "best settings for coding?" both
+    become "coding"; "python, not rust" and "rust, not python" stay apart
+    
+    Returns:
+        str: Content words in their original order, or every word of a
+            request that has none (so generic requests only share advice
+            when worded the same)
+    """
+    words = _WORD.findall(message.lower())
+    content = [word for word in words if word not in _FILLER_WORDS]
+    return ' '.join(content or words)
+
+
+class CommandDispatcher:
+    """
+    Classifies a chat message as a settings command (built once per process)
+    
+    Precedence matches the order the checks used to run in: exact commands,
+    then "configure for <preset>", then advice patterns, then a bare preset
+    name anywhere in the message
+    """
+    
+    def __init__(self, presets: Dict[str, Dict]):
+        """
+        Initialize dispatcher
+        
+        Args:
+            presets: Preset name -> settings (names use underscores for spaces)
+        """
+        self.presets = list(presets)
+        self._kinds = {}
+        alternatives = []
+        first_chars = set()
+        
+        def add(kind, arg, priority, pattern):
+            group = f"g{len(self._kinds)}"
+            self._kinds[group] = (priority, kind, arg)
+            alternatives.append(f"(?P<{group}>{pattern})")
+            first_chars.add(pattern[2] if pattern.startswith(r'\b') else pattern[0])
+        
+        for name in self.presets:
+            add('preset', name, 0, re.escape(f"configure for {name.replace('_', ' ')}"))
+        for priority, (pattern, advice_type) in enumerate(ADVICE_PATTERNS, 1):
+            add('advice', advice_type, priority, pattern)
+        for name in self.presets:
+            add('advice', name, len(ADVICE_PATTERNS) + 1, re.escape(name.replace('_', ' ')))
+        
+        # The lookahead skips positions no phrase can start at before any
+        # alternative is tried, which is most of the work on ordinary messages
+        self._pattern = re.compile(
+            f"(?=[{re.escape(''.join(sorted(first_chars)))}])(?:{'|'.join(alternatives)})"
+        )
+    
+    def match(self, message: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Classify a message
+        
+        Returns:
+            tuple: (kind, arg) where kind is 'show', 'reset' or 'apply' (arg
+                None), 'preset' (arg is the preset name) or 'advice' (arg is
+                the advice type or preset name)
+            None: If the message is not a command
+        """
+        text = normalize(message)
+        kind = EXACT_COMMANDS.get(text)
+        if kind:
+            return kind, None
+        
+        best = None
+        for found in self._pattern.finditer(text):
+            candidate = self._kinds[found.lastgroup]
+            if best is None or candidate[0] < best[0]:
+                best = candidate
+                if best[0] == 0:
+                    break  # Nothing outranks an explicit preset
+        return (best[1], best[2]) if best else None
@@ -0,0 +1,283 @@
+"""
+Context Window Manager - Keeps Claude prompts within a token budget
+Recent turns are sent verbatim; older turns are folded into a rolling
+summary that is cached in the conversation store and only extended when
+the conversation outgrows the budget again. Local models get the same
+history without summarization, trimmed so the prompt prefix stays stable
+"""
+
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message framing cost (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Space kept for the rolling summary when deciding what to fold
+SUMMARY_RESERVE_TOKENS = 512
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate token count locally without an API call
+    
+    Uses the ~4 characters per token rule of thumb for English text,
+    which is close enough for budgeting decisions
+    
+    Args:
+        text: Text to measure
+    
+    Returns:
+        int: Estimated token count
+    """
+    if not text:
+        return 0
+    return (len(text) + 3) // 4
+
+
+def estimate_turn_tokens(turn: Dict) -> int:
+    """Estimated tokens for one user/assistant exchange"""
+    return (
+        estimate_tokens(turn['user'])
+        + estimate_tokens(turn['assistant'])
+        + 2 * MESSAGE_OVERHEAD_TOKENS
+    )
+
+
+class ContextWindowManager:
+    """
+    Builds Claude and local message lists for a conversation within a budget
+    """
+    
+    def __init__(
+        self,
+        store,
+        summarizer: Callable[[Optional[str], List[Dict]], Optional[str]],
+        budgets: Optional[Dict[str, int]] = None,
+        default_budget: int = 32000,
+        keep_recent_turns: int = 4,
+        target_ratio: float = 0.75
+    ):
+        """
+        Initialize context window manager
+        
+        Args:
+            store: ConversationStore holding turns and cached summaries
+            summarizer: fn(previous_summary, turns) -> new summary text or None
+            budgets: Prompt token budget per model name
+            default_budget: Budget for models not listed in budgets
+            keep_recent_turns: Turns always kept verbatim when they fit
+            target_ratio: Fold down to this fraction of the budget so the
+                summary is not rebuilt on every turn
+        """
+        self.store = store
+        self.summarizer = summarizer
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.target_ratio = target_ratio
+        logger.info(f"ContextWindowManager initialized (default budget {default_budget} tokens)")
+    
+    def budget_for(self, model: str) -> int:
+        """Prompt token budget for a model"""
+        return self.budgets.get(model, self.default_budget)
+    
+    def build_context(
+        self,
+        conversation_id: str,
+        user_message: str,
+        model: str,
+        system_prompt: str
+    ) -> Dict:
+        """
+        Build the system prompt and message list for the next Claude call
+        
+        Args:
+            conversation_id: Opaque conversation ID
+            user_message: New user message
+            model: Claude model name (selects the budget)
+            system_prompt: Configured system prompt
+        
+        Returns:
+            dict: {
+                'system': str,              # System prompt incl. any summary
+                'summary': str,             # Rolling summary alone (or None)
+                'messages': list,           # Claude API messages
+                'prompt_tokens': int,       # Estimated tokens actually sent
+                'full_prompt_tokens': int,  # Estimate without the manager
+                'tokens_saved': int,        # full_prompt_tokens - prompt_tokens
+                'summarized_turns': int     # Turns covered by the summary
+            }
+        """
+        budget = self.budget_for(model)
+        summary = self.store.get_summary(conversation_id)
+        
+        # Turns already folded into the summary are never read again
+        first_seq = summary['upto_seq'] + 1 if summary else 0
+        turns = self.store.get_turns(conversation_id, offset=first_seq)
+        turn_tokens = [estimate_turn_tokens(turn) for turn in turns]
+        
+        base_tokens = (
+            estimate_tokens(system_prompt)
+            + estimate_tokens(user_message)
+            + MESSAGE_OVERHEAD_TOKENS
+        )
+        summary_tokens = estimate_tokens(summary['text']) if summary else 0
+        folded_tokens = summary['folded_tokens'] if summary else 0
+        
+        if base_tokens + summary_tokens + sum(turn_tokens) > budget:
+            summary, turns, turn_tokens = self._fold(
+                conversation_id, summary, turns, turn_tokens, base_tokens, budget
+            )
+            summary_tokens = estimate_tokens(summary['text']) if summary else 0
+            folded_tokens = summary['folded_tokens'] if summary else folded_tokens
+        
+        system = system_prompt
+        if summary and summary['text']:
+            system = (
+                f"{system_prompt}\n\n"
+                f"Summary of the earlier conversation:\n{summary['text']}"
+            )
+        
+        messages = []
+        for turn in turns:
+            messages.append({"role": "user", "content": turn['user']})
+            messages.append({"role": "assistant", "content": turn['assistant']})
+        messages.append({"role": "user", "content": user_message})
+        
+        prompt_tokens = base_tokens + summary_tokens + sum(turn_tokens)
+        full_prompt_tokens = base_tokens + folded_tokens + sum(turn_tokens)
+        
+        return {
+            'system': system,
+            'summary': summary['text'] if summary and summary['text'] else None,
+            'messages': messages,
+            'prompt_tokens': prompt_tokens,
+            'full_prompt_tokens': full_prompt_tokens,
+            'tokens_saved': max(0, full_prompt_tokens - prompt_tokens),
+            'summarized_turns': summary['upto_seq'] + 1 if summary else 0
+        }
+    
+    def build_local_context(
+        self,
+        conversation_id: str,
+        user_message: str,
+        budget: int,
+        drop_step: int = 4
+    ) -> Dict:
+        """
+        Build the /api/chat message list for a local model
+        
+        Never calls the summarizer; an existing rolling summary is reused as
+        a system message. When the history outgrows the budget, the oldest
+        turns are dropped drop_step at a time, so consecutive requests share
+        the same leading messages and Ollama can reuse its cached prompt
+        
+        Args:
+            conversation_id: Opaque conversation ID
+            user_message: New user message
+            budget: Prompt token budget for the local model
+            drop_step: Turns dropped together once over budget
+        
+        Returns:
+            dict: {
+                'messages': list,       # Ollama chat messages
+                'prompt_tokens': int,   # Estimated tokens sent
+                'history_turns': int,   # Earlier turns included verbatim
+                'dropped_turns': int    # Turns left out to fit the budget
+            }
+        """
+        summary = self.store.get_summary(conversation_id)
+        first_seq = summary['upto_seq'] + 1 if summary else 0
+        turns = self.store.get_turns(conversation_id, offset=first_seq)
+        turn_tokens = [estimate_turn_tokens(turn) for turn in turns]
+        
+        base_tokens = estimate_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+        if summary and summary['text']:
+            base_tokens += estimate_tokens(summary['text']) + MESSAGE_OVERHEAD_TOKENS
+        
+        # Start on a drop_step boundary so the window moves in jumps, not every turn
+        start = 0
+        history_tokens = sum(turn_tokens)
+        while start < len(turns) and base_tokens + history_tokens > budget:
+            history_tokens -= sum(turn_tokens[start:start + drop_step])
+            start += drop_step
+        start = min(start, len(turns))
+        
+        messages = []
+        if summary and summary['text']:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary['text']}"
+            })
+        for turn in turns[start:]:
+            messages.append({"role": "user", "content": turn['user']})
+            messages.append({"role": "assistant", "content": turn['assistant']})
+        messages.append({"role": "user", "content": user_message})
+        
+        return {
+            'messages': messages,
+            'prompt_tokens': base_tokens + max(0, history_tokens),
+            'history_turns': len(turns) - start,
+            'dropped_turns': start
+        }
+    
+    def _fold(self, conversation_id, summary, turns, turn_tokens, base_tokens, budget):
+        """
+        Fold the oldest unsummarized turns into the rolling summary
+        
+        Returns:
+            tuple: (summary, remaining_turns, remaining_turn_tokens)
+        """
+        target = int(budget * self.target_ratio) - base_tokens - SUMMARY_RESERVE_TOKENS
+        
+        # Walk back from the newest turn, keeping as many as fit the target
+        kept = 0
+        kept_tokens = 0
+        for tokens in reversed(turn_tokens):
+            if kept_tokens + tokens > target and kept >= self.keep_recent_turns:
+                break
+            kept += 1
+            kept_tokens += tokens
+        
+        # Never exceed the hard budget, even for the most recent turns
+        while kept and base_tokens + SUMMARY_RESERVE_TOKENS + kept_tokens > budget:
+            kept_tokens -= turn_tokens[len(turn_tokens) - kept]
+            kept -= 1
+        
+        split = len(turns) - kept
+        if split == 0:
+            return summary, turns, turn_tokens
+        
+        to_fold = turns[:split]
+        previous_text = summary['text'] if summary else None
+        
+        try:
+            new_text = self.summarizer(previous_text, to_fold)
+        except Exception as e:
+            logger.error(f"Failed to summarize conversation: {e}")
+            new_text = None
+        
+        new_summary = {
+            'upto_seq': to_fold[-1]['seq'],
+            'text': new_text or previous_text or '',
+            'folded_tokens': (summary['folded_tokens'] if summary else 0) + sum(turn_tokens[:split])
+        }
+        
+        if new_text:
+            self.store.save_summary(
+                conversation_id,
+                new_summary['upto_seq'],
+                new_summary['text'],
+                new_summary['folded_tokens']
+            )
+            logger.info(
+                f"Folded {split} turns into summary for {conversation_id[:8]} "
+                f"(through turn {new_summary['upto_seq']})"
+            )
+        else:
+            # Drop the oldest turns for this request only; retry summarizing next turn
+            logger.warning(f"Summary unavailable; truncating {split} oldest turns")
+        
+        return new_summary, turns[split:], turn_tokens[split:]
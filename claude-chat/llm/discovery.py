@@ -0,0 +1,143 @@
+"""
+Backend Discovery - Find the Ollama server without blocking startup
+Candidate hosts are probed from a background thread, retrying with backoff
+until one answers; the app serves Claude-only until the local client is
+published, so a missing or slow Ollama never holds up a worker
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llm.local_client import LocalLLMClient, get_local_client
+
+logger = logging.getLogger(__name__)
+
+
+class BackendDiscovery:
+    """
+    Background search for a reachable Ollama server (per process)
+    """
+    
+    def __init__(
+        self,
+        candidates: List[Tuple[str, int]],
+        model: str = "qwen2.5:14b",
+        retry_initial_seconds: float = 2,
+        retry_max_seconds: float = 60,
+        on_discovered: Optional[Callable[[LocalLLMClient], None]] = None
+    ):
+        """
+        Initialize discovery
+        
+        Args:
+            candidates: (host, port) pairs tried in order on each round
+            model: Model that must be installed for a host to count
+            retry_initial_seconds: Wait after the first failed round
+            retry_max_seconds: Longest wait between rounds (backoff doubles up to this)
+            on_discovered: Optional fn(client) called once a host answers
+        """
+        self.candidates = candidates
+        self.model = model
+        self.retry_initial_seconds = retry_initial_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.on_discovered = on_discovered
+        
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._client = None
+        self._started_at = None
+        self._discovered_ms = None
+        self._attempts = 0
+        self._failed_rounds = 0
+        self._last_error = None
+    
+    @property
+    def client(self) -> Optional[LocalLLMClient]:
+        """The discovered client, or None while searching"""
+        return self._client
+    
+    def is_pending(self) -> bool:
+        """Whether discovery is still searching"""
+        return not self._ready.is_set()
+    
+    def start(self):
+        """Start searching in a daemon thread (idempotent)"""
+        with self._lock:
+            if self._thread:
+                return
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="ollama-discovery", daemon=True)
+            self._thread.start()
+    
+    def wait(self, timeout: Optional[float] = None) -> Optional[LocalLLMClient]:
+        """Block until a client is discovered or the timeout passes"""
+        self._ready.wait(timeout)
+        return self._client
+    
+    def _run(self):
+        delay = self.retry_initial_seconds
+        while True:
+            for host, port in self.candidates:
+                with self._lock:
+                    self._attempts += 1
+                candidate = get_local_client(host=host, port=port, model=self.model)
+                try:
+                    reachable = candidate.test_connection()
+                    error = None if reachable else "not reachable or model missing"
+                except Exception as e:
+                    reachable = False
+                    error = str(e)
+                
+                if reachable:
+                    self._publish(candidate)
+                    return
+                
+                logger.warning(f"Local LLM not available at {host}:{port}: {error}")
+                with self._lock:
+                    self._last_error = f"{host}:{port}: {error}"
+            
+            with self._lock:
+                self._failed_rounds += 1
+            logger.info(f"Local LLM discovery retrying in {delay:g}s; serving Claude-only meanwhile")
+            time.sleep(delay)
+            delay = min(delay * 2, self.retry_max_seconds)
+    
+    def _publish(self, client: LocalLLMClient):
+        with self._lock:
+            self._discovered_ms = int((time.time() - self._started_at) * 1000)
+        logger.info(
+            f"Local LLM discovered at {client.host}:{client.port} "
+            f"after {self._discovered_ms}ms ({self._attempts} attempts)"
+        )
+        
+        # Callers set up routing for the new backend before it becomes visible
+        if self.on_discovered:
+            try:
+                self.on_discovered(client)
+            except Exception as e:
+                logger.error(f"Local LLM discovery callback failed: {e}")
+        
+        self._client = client
+        self._ready.set()
+    
+    def status(self) -> Dict:
+        """
+        Discovery state for health reporting
+        
+        Returns:
+            dict: {'state': 'starting' | 'searching' | 'ready', 'attempts': int,
+                'host': str, 'discovered_ms': int, 'last_error': str}
+            'starting' means the first round of candidates is still being tried
+        """
+        with self._lock:
+            client = self._client
+            return {
+                'state': 'ready' if client else 'searching' if self._failed_rounds else 'starting',
+                'attempts': self._attempts,
+                'host': f"{client.host}:{client.port}" if client else None,
+                'discovered_ms': self._discovered_ms,
+                'last_error': None if client else self._last_error
+            }
@@ -0,0 +1,166 @@
+"""
+Health Prober - Background backend checks with cached results
+Runs each backend check on its own schedule in a daemon thread so /health
+can answer from memory instead of making live upstream calls
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HealthProber:
+    """
+    Periodically probes registered backends and keeps recent history
+    """
+    
+    def __init__(self, history_size: int = 20):
+        """
+        Initialize health prober
+        
+        Args:
+            history_size: Number of recent results kept per backend
+        """
+        self.history_size = history_size
+        self._checks: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+    
+    def register(
+        self,
+        name: str,
+        check: Callable[[], bool],
+        interval: float,
+        on_result: Optional[Callable[[bool, int, Optional[str]], None]] = None
+    ):
+        """
+        Add a backend check
+        
+        Args:
+            name: Backend name reported by status()
+            check: Callable returning True when healthy (may raise)
+            interval: Seconds between checks
+            on_result: Optional fn(healthy, latency_ms, error) called after each probe
+        """
+        with self._lock:
+            self._checks[name] = {
+                'check': check,
+                'interval': interval,
+                'on_result': on_result,
+                'next_run': 0.0,
+                'history': deque(maxlen=self.history_size),
+                'errors': deque(maxlen=5)
+            }
+        self._wake.set()
+    
+    def start(self):
+        """Start the background thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+        self._thread.start()
+        logger.info(f"Health prober started for {len(self._checks)} backends")
+    
+    def _run(self):
+        while True:
+            self._wake.clear()
+            now = time.time()
+            with self._lock:
+                due = [(n, c) for n, c in self._checks.items() if c['next_run'] <= now]
+            
+            for name, entry in due:
+                self._probe(name, entry)
+            
+            with self._lock:
+                next_run = min((c['next_run'] for c in self._checks.values()), default=now + 60)
+            
+            self._wake.wait(max(0.1, next_run - time.time()))
+    
+    def _probe(self, name: str, entry: Dict):
+        started = time.time()
+        error = None
+        try:
+            healthy = bool(entry['check']())
+        except Exception as e:
+            healthy = False
+            error = str(e)
+        
+        latency_ms = int((time.time() - started) * 1000)
+        
+        with self._lock:
+            entry['history'].append((started, healthy, latency_ms))
+            if error:
+                entry['errors'].append({
+                    'time': datetime.fromtimestamp(started).isoformat(),
+                    'error': error
+                })
+            entry['last_error'] = error
+            entry['next_run'] = time.time() + entry['interval']
+        
+        if not healthy:
+            logger.warning(f"Health probe failed for {name}: {error or 'unhealthy'}")
+        
+        if entry['on_result']:
+            try:
+                entry['on_result'](healthy, latency_ms, error)
+            except Exception as e:
+                logger.error(f"Health probe callback failed for {name}: {e}")
+    
+    def is_healthy(self, name: str) -> bool:
+        """Whether the most recent probe of a backend succeeded"""
+        with self._lock:
+            entry = self._checks.get(name)
+            return bool(entry and entry['history'] and entry['history'][-1][1])
+    
+    def status(self) -> Dict[str, Dict]:
+        """
+        Cached status of every backend (no upstream calls)
+        
+        Returns:
+            dict: name -> {
+                'status': 'connected' | 'unreachable' | 'error' | 'pending',
+                'last_checked': str,          # ISO timestamp
+                'staleness_s': float,         # Seconds since last check
+                'stale': bool,                # Older than 3 intervals
+                'latency_ms': int,            # Last probe
+                'avg_latency_ms': int,        # Over recent history
+                'success_rate': float,        # Over recent history
+                'recent_errors': list
+            }
+        """
+        now = time.time()
+        result = {}
+        with self._lock:
+            for name, entry in self._checks.items():
+                history = entry['history']
+                if not history:
+                    result[name] = {'status': 'pending', 'stale': True}
+                    continue
+                
+                checked_at, healthy, latency_ms = history[-1]
+                staleness = now - checked_at
+                
+                if healthy:
+                    status = 'connected'
+                elif entry.get('last_error'):
+                    status = 'error'
+                else:
+                    status = 'unreachable'
+                
+                result[name] = {
+                    'status': status,
+                    'last_checked': datetime.fromtimestamp(checked_at).isoformat(),
+                    'staleness_s': round(staleness, 1),
+                    'stale': staleness > 3 * entry['interval'],
+                    'latency_ms': latency_ms,
+                    'avg_latency_ms': int(sum(h[2] for h in history) / len(history)),
+                    'success_rate': round(sum(1 for h in history if h[1]) / len(history), 3),
+                    'recent_errors': list(entry['errors'])
+                }
+        return result
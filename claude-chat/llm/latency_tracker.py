@@ -0,0 +1,113 @@
+"""
+Latency Tracker - Recent response latencies per backend
+Keeps a short window of first-token times and per-token generation times
+so the router can predict how long a request would take on each backend
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0-100), or None without samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class _Series:
+    """Sliding windows for one backend"""
+    
+    def __init__(self, window_size: int):
+        self.first_token_ms = deque(maxlen=window_size)
+        self.ms_per_token = deque(maxlen=window_size)
+        self.duration_ms = deque(maxlen=window_size)
+
+
+class LatencyTracker:
+    """
+    Per-process latency windows keyed by backend (local-general, local-coder, claude)
+    """
+    
+    def __init__(self, window_size: int = 50):
+        """
+        Initialize latency tracker
+        
+        Args:
+            window_size: Recent responses kept per backend
+        """
+        self.window_size = window_size
+        self._lock = threading.Lock()
+        self._series: Dict[str, _Series] = {}
+    
+    def record(
+        self,
+        backend: str,
+        duration_ms: Optional[float] = None,
+        first_token_ms: Optional[float] = None,
+        ms_per_token: Optional[float] = None
+    ):
+        """
+        Add one completed response
+        
+        Args:
+            backend: Routed model identifier
+            duration_ms: End-to-end time, excluding any queue wait
+            first_token_ms: Time to first token, if the response was streamed
+            ms_per_token: Generation time per output token, if known
+        """
+        with self._lock:
+            series = self._series.get(backend)
+            if series is None:
+                series = self._series[backend] = _Series(self.window_size)
+            if duration_ms is not None:
+                series.duration_ms.append(duration_ms)
+            if first_token_ms is not None:
+                series.first_token_ms.append(first_token_ms)
+            if ms_per_token is not None:
+                series.ms_per_token.append(ms_per_token)
+    
+    def first_token_ms(self, backend: str, q: float) -> Optional[float]:
+        """Percentile of time to first token, or None without samples"""
+        with self._lock:
+            series = self._series.get(backend)
+            return percentile(list(series.first_token_ms), q) if series else None
+    
+    def ms_per_token(self, backend: str, q: float = 50) -> Optional[float]:
+        """Percentile of generation time per token, or None without samples"""
+        with self._lock:
+            series = self._series.get(backend)
+            return percentile(list(series.ms_per_token), q) if series else None
+    
+    def snapshot(self) -> Dict:
+        """
+        Observed latencies for health reporting
+        
+        Returns:
+            dict: backend -> {'samples', 'p50_ms', 'p95_ms', 'first_token_p50_ms',
+                'first_token_p95_ms', 'ms_per_token'}
+        """
+        def rounded(value):
+            return int(value) if value is not None else None
+        
+        with self._lock:
+            return {
+                backend: {
+                    'samples': len(series.duration_ms),
+                    'p50_ms': rounded(percentile(list(series.duration_ms), 50)),
+                    'p95_ms': rounded(percentile(list(series.duration_ms), 95)),
+                    'first_token_p50_ms': rounded(percentile(list(series.first_token_ms), 50)),
+                    'first_token_p95_ms': rounded(percentile(list(series.first_token_ms), 95)),
+                    'ms_per_token': (
+                        round(percentile(list(series.ms_per_token), 50), 1)
+                        if series.ms_per_token else None
+                    )
+                }
+                for backend, series in self._series.items()
+            }
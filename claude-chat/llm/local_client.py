@@ -3,12 +3,55 @@ Local LLM Client for Qwen2.5 14B via Ollama
 Handles communication with locally-running Ollama instance
 """
 
+import json
+import os
 import requests
 import logging
-from typing import Dict, Optional
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from llm.timing import record as record_span, span
 
 logger = logging.getLogger(__name__)
 
+# Keep-alive pool sizing per client (one Ollama host per client); gevent
+# workers can hold many requests at once, so keep this above typical fan-out
+POOL_MAXSIZE = int(os.getenv("OLLAMA_POOL_MAXSIZE", "50"))
+
+# A down or unroutable host should fail in seconds, not after the read timeout
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))
+
+# How long Ollama keeps a model in memory after its last request
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# Context window requested for every call; changing it between requests makes
+# Ollama reload the model, so it is fixed per process
+NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+
+# Load time above which a response counts as a cold start
+COLD_LOAD_THRESHOLD_MS = 1000
+
+
+def _load_stats(data: Dict) -> Dict:
+    """Warm/cold details from an Ollama completion payload"""
+    load_ms = data.get('load_duration', 0) // 1_000_000
+    return {'load_ms': load_ms, 'cold_start': load_ms >= COLD_LOAD_THRESHOLD_MS}
+
+
+def _build_session() -> requests.Session:
+    """Create a keep-alive session with a connection pool sized for one Ollama host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=0  # Failover is handled by the caller, not by silent retries
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 class LocalLLMClient:
     """
@@ -30,8 +73,11 @@ class LocalLLMClient:
             port: Ollama server port (default: 11434)
             model: Model name in Ollama (default: qwen2.5:14b)
         """
+        self.host = host
+        self.port = port
         self.base_url = f"http://{host}:{port}"
         self.model = model
+        self.session = _build_session()
         logger.info(f"Initialized LocalLLMClient with model: {model}")
     
     def test_connection(self) -> bool:
@@ -43,14 +89,13 @@ class LocalLLMClient:
         """
         try:
             # Check if Ollama is running
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            
-            if response.status_code != 200:
-                logger.error(f"Ollama server returned status {response.status_code}")
-                return False
-            
-            # Check if our model is available
-            models = response.json().get('models', [])
+            with self.session.get(f"{self.base_url}/api/tags", timeout=5) as response:
+                if response.status_code != 200:
+                    logger.error(f"Ollama server returned status {response.status_code}")
+                    return False
+                
+                # Check if our model is available
+                models = response.json().get('models', [])
             model_names = [m.get('name', '') for m in models]
             
             if self.model not in model_names:
@@ -59,11 +104,142 @@ class LocalLLMClient:
             
             logger.info(f"Successfully connected to Ollama with model {self.model}")
             return True
-            
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to connect to Ollama: {e}")
             return False
     
+    def _options(self, max_tokens: int, temperature: float) -> Dict:
+        """Generation options; num_ctx never varies so Ollama never reloads the model"""
+        return {
+            "num_predict": max_tokens,
+            "temperature": temperature,
+            "num_ctx": NUM_CTX
+        }
+    
+    def _complete(self, endpoint: str, payload: Dict, text_of: Callable[[Dict], str]) -> Dict:
+        """POST a non-streaming request and normalize Ollama's completion payload"""
+        try:
+            with span('ollama'):
+                response = self.session.post(
+                    f"{self.base_url}{endpoint}",
+                    json={**payload, "model": self.model, "stream": False, "keep_alive": KEEP_ALIVE},
+                    timeout=(CONNECT_TIMEOUT, 60)  # Allow up to 60 seconds for response
+                )
+            
+            # Closed on every path so the connection goes back to the pool
+            with response:
+                if response.status_code != 200:
+                    error_msg = f"Ollama returned status {response.status_code}"
+                    logger.error(error_msg)
+                    raise Exception(error_msg)
+                
+                # Parse response
+                data = response.json()
+            
+            result = {
+                'response': text_of(data),
+                'tokens': data.get('eval_count', 0),
+                'duration_ms': data.get('total_duration', 0) // 1_000_000,  # Convert ns to ms
+                'model': self.model,
+                'prompt_eval_tokens': data.get('prompt_eval_count', 0),
+                **_load_stats(data)
+            }
+            
+            logger.info(
+                f"Response received: {result['tokens']} tokens in {result['duration_ms']}ms "
+                f"({result['prompt_eval_tokens']} prompt tokens evaluated)"
+            )
+            
+            return result
+        
+        except requests.exceptions.Timeout:
+            error_msg = "Local LLM request timed out (>60s)"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Failed to reach Ollama server: {e}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        except Exception as e:
+            error_msg = f"Unexpected error in local LLM: {e}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+    
+    def _stream(
+        self,
+        endpoint: str,
+        payload: Dict,
+        text_of: Callable[[Dict], str]
+    ) -> Iterator[Dict]:
+        """POST a streaming request and yield normalized token and done chunks"""
+        started = time.perf_counter()
+        first_token = True
+        try:
+            # Ollama sends one JSON object per line while generating
+            response = self.session.post(
+                f"{self.base_url}{endpoint}",
+                json={**payload, "model": self.model, "stream": True, "keep_alive": KEEP_ALIVE},
+                stream=True,
+                timeout=(CONNECT_TIMEOUT, 60)  # Read timeout applies per read, not to the whole generation
+            )
+            record_span('ollama_connect', (time.perf_counter() - started) * 1000)
+            
+            # Entered before the status check: an unread streamed response
+            # holds its connection until it is closed
+            with response:
+                if response.status_code != 200:
+                    error_msg = f"Ollama returned status {response.status_code}"
+                    logger.error(error_msg)
+                    raise Exception(error_msg)
+                
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    
+                    data = json.loads(line)
+                    
+                    if data.get('error'):
+                        raise Exception(f"Ollama error: {data['error']}")
+                    
+                    text = text_of(data)
+                    if text:
+                        if first_token:
+                            record_span('ollama_ttft', (time.perf_counter() - started) * 1000)
+                            first_token = False
+                        yield {'token': text}
+                    
+                    if data.get('done'):
+                        result = {
+                            'done': True,
+                            'tokens': data.get('eval_count', 0),
+                            'duration_ms': data.get('total_duration', 0) // 1_000_000,
+                            'model': self.model,
+                            'prompt_eval_tokens': data.get('prompt_eval_count', 0),
+                            **_load_stats(data)
+                        }
+                        logger.info(
+                            f"Stream complete: {result['tokens']} tokens in {result['duration_ms']}ms "
+                            f"({result['prompt_eval_tokens']} prompt tokens evaluated)"
+                        )
+                        record_span('ollama', (time.perf_counter() - started) * 1000)
+                        yield result
+                        return
+            
+            raise Exception("Ollama stream ended before completion")
+        
+        except requests.exceptions.Timeout:
+            error_msg = "Local LLM stream stalled (>60s without data)"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+        
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Failed to reach Ollama server: {e}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+    
     def get_response(
         self, 
         question: str, 
@@ -71,7 +247,7 @@ class LocalLLMClient:
         temperature: float = 0.7
     ) -> Dict:
         """
-        Get response from local LLM
+        Get response from local LLM for a single prompt
         
         Args:
             question: User's question/prompt
@@ -80,69 +256,184 @@ class LocalLLMClient:
         
         Returns:
             dict: {
-                'response': str,      # The actual response text
-                'tokens': int,        # Number of tokens generated
-                'duration_ms': int,   # Time taken in milliseconds
-                'model': str          # Model name used
+                'response': str,          # The actual response text
+                'tokens': int,            # Number of tokens generated
+                'duration_ms': int,       # Time taken in milliseconds
+                'model': str,             # Model name used
+                'prompt_eval_tokens': int,  # Prompt tokens Ollama had to process
+                'load_ms': int,           # Time Ollama spent loading the model
+                'cold_start': bool        # Whether the model had to be loaded
             }
         
         Raises:
             Exception: If request fails or Ollama returns error
         """
+        logger.info(f"Sending query to {self.model}: {question[:50]}...")
+        return self._complete(
+            "/api/generate",
+            {"prompt": question, "options": self._options(max_tokens, temperature)},
+            lambda data: data.get('response', '')
+        )
+    
+    def stream_response(
+        self,
+        question: str,
+        max_tokens: int = 1024,
+        temperature: float = 0.7
+    ) -> Iterator[Dict]:
+        """
+        Stream response from local LLM for a single prompt
+        
+        Args:
+            question: User's question/prompt
+            max_tokens: Maximum tokens to generate (default: 1024)
+            temperature: Creativity level 0-1 (default: 0.7)
+        
+        Yields:
+            dict: {'token': str} for each generated chunk, followed by a
+                  final {'done': True, 'tokens': int, 'duration_ms': int,
+                  'model': str, 'prompt_eval_tokens': int, 'load_ms': int,
+                  'cold_start': bool} once Ollama reports completion
+        
+        Raises:
+            Exception: If request fails or Ollama returns error
+        """
+        logger.info(f"Streaming query to {self.model}: {question[:50]}...")
+        return self._stream(
+            "/api/generate",
+            {"prompt": question, "options": self._options(max_tokens, temperature)},
+            lambda data: data.get('response', '')
+        )
+    
+    def chat_response(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 1024,
+        temperature: float = 0.7
+    ) -> Dict:
+        """
+        Get the next assistant turn for a conversation via /api/chat
+        
+        Ollama keeps the KV cache of the previous prompt, so when messages
+        extends an earlier request only the new tokens are evaluated
+        
+        Args:
+            messages: Chat history as [{'role', 'content'}], ending with the user turn
+            max_tokens: Maximum tokens to generate (default: 1024)
+            temperature: Creativity level 0-1 (default: 0.7)
+        
+        Returns:
+            dict: Same shape as get_response
+        
+        Raises:
+            Exception: If request fails or Ollama returns error
+        """
+        logger.info(f"Sending {len(messages)} messages to {self.model}")
+        return self._complete(
+            "/api/chat",
+            {"messages": messages, "options": self._options(max_tokens, temperature)},
+            lambda data: data.get('message', {}).get('content', '')
+        )
+    
+    def stream_chat(
+        self,
+        messages: List[Dict],
+        max_tokens: int = 1024,
+        temperature: float = 0.7
+    ) -> Iterator[Dict]:
+        """
+        Stream the next assistant turn for a conversation via /api/chat
+        
+        Args:
+            messages: Chat history as [{'role', 'content'}], ending with the user turn
+            max_tokens: Maximum tokens to generate (default: 1024)
+            temperature: Creativity level 0-1 (default: 0.7)
+        
+        Yields:
+            dict: Same chunks as stream_response
+        
+        Raises:
+            Exception: If request fails or Ollama returns error
+        """
+        logger.info(f"Streaming {len(messages)} messages to {self.model}")
+        return self._stream(
+            "/api/chat",
+            {"messages": messages, "options": self._options(max_tokens, temperature)},
+            lambda data: data.get('message', {}).get('content', '')
+        )
+    
+    def preload(self) -> Dict:
+        """
+        Load the model into memory without generating anything
+        
+        Returns:
+            dict: {'load_ms': int, 'cold_start': bool}
+        
+        Raises:
+            Exception: If the model cannot be loaded
+        """
         try:
-            logger.info(f"Sending query to {self.model}: {question[:50]}...")
-            
-            # Make request to Ollama
-            response = requests.post(
+            # A generate request without a prompt only loads the model
+            response = self.session.post(
                 f"{self.base_url}/api/generate",
                 json={
                     "model": self.model,
-                    "prompt": question,
-                    "stream": False,  # Get complete response at once
-                    "options": {
-                        "num_predict": max_tokens,
-                        "temperature": temperature
-                    }
+                    "keep_alive": KEEP_ALIVE,
+                    "stream": False,
+                    "options": {"num_ctx": NUM_CTX}  # Load with the context size chat calls use
                 },
-                timeout=60  # Allow up to 60 seconds for response
+                timeout=(CONNECT_TIMEOUT, 300)  # Loading 14B weights from disk can be slow
             )
             
-            if response.status_code != 200:
-                error_msg = f"Ollama returned status {response.status_code}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
-            
-            # Parse response
-            data = response.json()
-            
-            result = {
-                'response': data.get('response', ''),
-                'tokens': data.get('eval_count', 0),
-                'duration_ms': data.get('total_duration', 0) // 1_000_000,  # Convert ns to ms
-                'model': self.model
-            }
-            
-            logger.info(
-                f"Response received: {result['tokens']} tokens in {result['duration_ms']}ms"
-            )
-            
-            return result
-            
-        except requests.exceptions.Timeout:
-            error_msg = "Local LLM request timed out (>60s)"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-            
+            with response:
+                if response.status_code != 200:
+                    raise Exception(f"Ollama returned status {response.status_code}")
+                
+                stats = _load_stats(response.json())
+            logger.info(f"Preloaded {self.model} ({stats['load_ms']}ms load)")
+            return stats
+        
         except requests.exceptions.RequestException as e:
-            error_msg = f"Failed to reach Ollama server: {e}"
-            logger.error(error_msg)
-            raise Exception(error_msg)
-            
-        except Exception as e:
-            error_msg = f"Unexpected error in local LLM: {e}"
+            error_msg = f"Failed to preload {self.model}: {e}"
             logger.error(error_msg)
             raise Exception(error_msg)
     
+    def installed_models(self) -> Optional[List[str]]:
+        """
+        Models pulled onto the Ollama server (/api/tags)
+        
+        Returns:
+            list: Installed model names
+            None: If the server could not be queried
+        """
+        try:
+            with self.session.get(f"{self.base_url}/api/tags", timeout=5) as response:
+                if response.status_code != 200:
+                    return None
+                return [m.get('name', '') for m in response.json().get('models', [])]
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to list installed models: {e}")
+            return None
+    
+    def loaded_models(self) -> Optional[List[str]]:
+        """
+        Models Ollama currently holds in memory (/api/ps)
+        
+        Returns:
+            list: Loaded model names
+            None: If the server could not be queried
+        """
+        try:
+            with self.session.get(f"{self.base_url}/api/ps", timeout=5) as response:
+                if response.status_code != 200:
+                    return None
+                return [m.get('name', '') for m in response.json().get('models', [])]
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to list loaded models: {e}")
+            return None
+    
     def get_model_info(self) -> Optional[Dict]:
         """
         Get information about the current model
@@ -152,22 +443,53 @@ class LocalLLMClient:
             None: If request fails
         """
         try:
-            response = requests.post(
+            with self.session.post(
                 f"{self.base_url}/api/show",
                 json={"name": self.model},
                 timeout=5
-            )
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return None
-                
+            ) as response:
+                if response.status_code == 200:
+                    return response.json()
+                else:
+                    return None
+        
         except Exception as e:
             logger.error(f"Failed to get model info: {e}")
             return None
 
 
+# Process-wide registry so connections are reused across requests
+_client_registry: Dict[Tuple[str, int, str], LocalLLMClient] = {}
+_registry_lock = threading.Lock()
+
+
+def get_local_client(
+    host: str = "localhost",
+    port: int = 11434,
+    model: str = "qwen2.5:14b"
+) -> LocalLLMClient:
+    """
+    Get the shared client for a (host, port, model), creating it on first use
+    
+    Args:
+        host: Ollama server host (default: localhost)
+        port: Ollama server port (default: 11434)
+        model: Model name in Ollama (default: qwen2.5:14b)
+    
+    Returns:
+        LocalLLMClient: Pooled client that lives for the whole process
+    """
+    key = (host, int(port), model)
+    client = _client_registry.get(key)
+    if client is None:
+        with _registry_lock:
+            client = _client_registry.get(key)
+            if client is None:
+                client = LocalLLMClient(host=host, port=int(port), model=model)
+                _client_registry[key] = client
+    return client
+
+
 # Convenience function for simple usage
 def quick_query(question: str, model: str = "qwen2.5:14b") -> str:
     """
@@ -180,6 +502,6 @@ def quick_query(question: str, model: str = "qwen2.5:14b") -> str:
     Returns:
         str: Response text
     """
-    client = LocalLLMClient(model=model)
+    client = get_local_client(model=model)
     result = client.get_response(question)
     return result['response']
\ No newline at end of file
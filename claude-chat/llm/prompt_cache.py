@@ -0,0 +1,73 @@
+"""
+Prompt Caching - Anthropic cache breakpoints for stable prompt prefixes
+The system prompt, the rolling summary and the conversation so far are
+identical from one turn to the next, so they are marked as cacheable and
+only the newest exchange is billed at the full input rate
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def apply_cache_breakpoints(
+    system_prompt: str,
+    summary: Optional[str],
+    messages: List[Dict]
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Build system blocks and messages with cache breakpoints
+    
+    Breakpoints (at most 3 of the 4 the API allows):
+        1. The configured system prompt
+        2. The rolling summary, which only changes when turns are folded
+        3. The last message before the new user message; this moves forward
+           every turn, and the previous turn's cached prefix is still found
+           by the API's lookback, so only the newest exchange is written
+    
+    Args:
+        system_prompt: Configured system prompt
+        summary: Rolling summary of older turns, if any
+        messages: Claude API messages ending with the new user message
+    
+    Returns:
+        tuple: (system_blocks, messages) ready for messages.create/stream
+    """
+    system_blocks = [
+        {"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}
+    ]
+    if summary:
+        system_blocks.append({
+            "type": "text",
+            "text": f"Summary of the earlier conversation:\n{summary}",
+            "cache_control": CACHE_CONTROL
+        })
+    
+    cached_messages = list(messages)
+    if len(cached_messages) > 1:
+        stable = cached_messages[-2]
+        cached_messages[-2] = {
+            "role": stable["role"],
+            "content": [
+                {"type": "text", "text": stable["content"], "cache_control": CACHE_CONTROL}
+            ]
+        }
+    
+    return system_blocks, cached_messages
+
+
+def cache_usage(usage) -> Dict:
+    """
+    Extract cache token counts from a Claude response's usage
+    
+    Args:
+        usage: response.usage from the Anthropic SDK
+    
+    Returns:
+        dict: {'input_tokens': int, 'cache_read_tokens': int, 'cache_write_tokens': int}
+    """
+    return {
+        'input_tokens': getattr(usage, 'input_tokens', 0) or 0,
+        'cache_read_tokens': getattr(usage, 'cache_read_input_tokens', 0) or 0,
+        'cache_write_tokens': getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    }
@@ -0,0 +1,207 @@
+"""
+Race - Run the same request on several backends and keep the first good answer
+Each leg streams in its own thread; once one finishes with an acceptable
+answer the others are cancelled by closing their streams on their next
+chunk, which drops the upstream connection so the model stops generating.
+A leg still waiting for its first chunk (e.g. while a model loads) keeps its
+connection until that chunk arrives; work it has not started yet can be
+given up sooner by watching the race's stop event
+"""
+
+import contextvars
+import logging
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from llm.cancellation import Cancelled
+
+logger = logging.getLogger(__name__)
+
+# Answers that open like this are refusals, not answers
+REFUSAL_PATTERN = re.compile(
+    r"^\s*(?:i'?m sorry|i am sorry|i cannot|i can'?t|i'?m unable|i am unable|as an ai)\b",
+    re.IGNORECASE
+)
+
+
+class RaceFailedError(Exception):
+    """Raised when no leg produced a complete answer"""
+    
+    def __init__(self, message: str, legs: Dict[str, Dict]):
+        super().__init__(message)
+        self.legs = legs
+
+
+def acceptable_answer(text: str, min_chars: int = 1) -> bool:
+    """
+    Quality heuristic for a finished answer
+    
+    Args:
+        text: Complete response text
+        min_chars: Shortest answer (after stripping) that counts
+    
+    Returns:
+        bool: True if the answer is non-empty and not a refusal
+    """
+    stripped = text.strip()
+    return len(stripped) >= min_chars and not REFUSAL_PATTERN.match(stripped)
+
+
+class _Leg:
+    """State for one racing backend"""
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.outcome = 'running'
+        self.chunks = []
+        self.final = None
+        self.error = None
+        self.first_token_ms = None
+        self.duration_ms = None
+
+
+def race(
+    legs: Dict[str, Callable[[], Iterator[Dict]]],
+    acceptable: Callable[[str], bool] = acceptable_answer,
+    timeout: float = 60,
+    cancelled: Optional[Callable[[], bool]] = None,
+    stop: Optional[threading.Event] = None,
+    prefer: Optional[str] = None
+) -> Dict:
+    """
+    Stream every leg at once and return the first acceptable answer
+    
+    If every leg that finished was rejected, the complete answer is kept
+    anyway rather than paying for another call
+    
+    Args:
+        legs: Leg name -> fn returning a chunk iterator ({'token'} chunks,
+            then a {'done': True, ...} chunk; other chunks are ignored)
+        acceptable: Decides whether a finished answer may win
+        timeout: Seconds to wait for a winner
+        cancelled: Optional fn() polled while waiting; cancels every leg
+        stop: Optional event set once the race is decided or abandoned, so
+            legs can give up work they have not started (e.g. a queued slot)
+        prefer: Leg whose answer is kept when every finished answer was rejected
+    
+    Returns:
+        dict: {
+            'winner': str,          # Name of the winning (or kept) leg
+            'accepted': bool,       # False if its answer was kept despite rejection
+            'response': str,        # Its full answer
+            'final': dict,          # Its done chunk
+            'first_token_ms': int,  # Its time to first token
+            'duration_ms': int,     # Its total time
+            'legs': dict            # name -> {'outcome', 'duration_ms', 'error'}
+        }
+        Outcomes are 'won', 'cancelled', 'rejected', 'failed' or 'running' (timed out)
+    
+    Raises:
+        Cancelled: If the request was cancelled first
+        RaceFailedError: If no leg produced a complete answer in time
+    """
+    started = time.time()
+    cond = threading.Condition()
+    stop = stop or threading.Event()
+    state = {name: _Leg(name) for name in legs}
+    winner = []
+    
+    def run(leg: _Leg, open_stream: Callable[[], Iterator[Dict]]):
+        chunks = None
+        try:
+            chunks = open_stream()
+            for chunk in chunks:
+                if stop.is_set():
+                    leg.outcome = 'cancelled'
+                    return
+                if chunk.get('done'):
+                    leg.final = chunk
+                    break
+                if 'token' in chunk:
+                    if leg.first_token_ms is None:
+                        leg.first_token_ms = int((time.time() - started) * 1000)
+                    leg.chunks.append(chunk['token'])
+            
+            leg.duration_ms = int((time.time() - started) * 1000)
+            if leg.final is None:
+                raise Exception("stream ended before completion")
+            
+            with cond:
+                if not winner and acceptable(''.join(leg.chunks)):
+                    winner.append(leg)
+                    leg.outcome = 'won'
+                    stop.set()
+                elif winner:
+                    leg.outcome = 'cancelled'  # Finished, but too late to matter
+                else:
+                    leg.outcome = 'rejected'
+        
+        except Exception as e:
+            leg.outcome = 'cancelled' if stop.is_set() else 'failed'
+            leg.error = str(e)
+            leg.duration_ms = int((time.time() - started) * 1000)
+        
+        finally:
+            # Closing the generator closes the upstream HTTP response
+            if chunks is not None and hasattr(chunks, 'close'):
+                try:
+                    chunks.close()
+                except Exception as e:
+                    logger.debug(f"Closing {leg.name} stream failed: {e}")
+            with cond:
+                cond.notify_all()
+    
+    for name, open_stream in legs.items():
+        # Each leg gets a copy of the caller's context, so request timings see it
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(run, state[name], open_stream),
+            name=f"race-{name}",
+            daemon=True
+        ).start()
+    
+    deadline = started + timeout
+    with cond:
+        while True:
+            remaining = deadline - time.time()
+            settled = cond.wait_for(
+                lambda: winner or all(leg.outcome != 'running' for leg in state.values()),
+                timeout=min(remaining, 0.25) if cancelled else remaining
+            )
+            if settled or remaining <= 0:
+                break
+            if cancelled and cancelled():
+                stop.set()
+                raise Cancelled("Race cancelled")
+    stop.set()
+    
+    # Legs still running are closed on their next chunk
+    summary = {
+        name: {
+            'outcome': 'cancelled' if winner and leg.outcome == 'running' else leg.outcome,
+            'duration_ms': leg.duration_ms,
+            'error': leg.error
+        }
+        for name, leg in state.items()
+    }
+    if winner:
+        leg = winner[0]
+        logger.info(f"Race won by {leg.name} in {leg.duration_ms}ms ({summary})")
+    else:
+        rejected = [leg for leg in state.values() if leg.outcome == 'rejected']
+        if not rejected:
+            raise RaceFailedError(f"No complete answer from race: {summary}", summary)
+        leg = min(rejected, key=lambda leg: (leg.name != prefer, leg.duration_ms))
+        logger.info(f"Race had no acceptable answer; keeping {leg.name}'s ({summary})")
+    
+    return {
+        'winner': leg.name,
+        'accepted': bool(winner),
+        'response': ''.join(leg.chunks),
+        'final': leg.final,
+        'first_token_ms': leg.first_token_ms,
+        'duration_ms': leg.duration_ms,
+        'legs': summary
+    }
@@ -0,0 +1,87 @@
+"""
+Model Residency - Which Ollama models are loaded and what a swap costs
+Kept current from /api/ps and from the load times Ollama reports with each
+response, so routing can avoid waiting on a cold model load
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelResidency:
+    """
+    Tracks resident models and learned cold-load times (per process)
+    """
+    
+    def __init__(self):
+        """Initialize residency tracker"""
+        self._lock = threading.Lock()
+        self._resident = set()
+        self._refreshed_at = None
+        self._load_ms: Dict[str, float] = {}
+    
+    def update(self, loaded: List[str]):
+        """Replace the resident set with a fresh /api/ps listing"""
+        with self._lock:
+            if set(loaded) != self._resident:
+                logger.info(f"Resident Ollama models: {sorted(loaded) or 'none'}")
+            self._resident = set(loaded)
+            self._refreshed_at = time.time()
+    
+    def record_load(self, model: str, load_ms: int, cold_start: bool):
+        """
+        Note that a model just served a request
+        
+        Args:
+            model: Ollama model name
+            load_ms: Load time Ollama reported
+            cold_start: Whether the load counted as a cold start
+        """
+        with self._lock:
+            self._resident.add(model)
+            if cold_start:
+                previous = self._load_ms.get(model)
+                self._load_ms[model] = (
+                    load_ms if previous is None else 0.7 * previous + 0.3 * load_ms
+                )
+    
+    def is_resident(self, model: str) -> bool:
+        """Whether the model was loaded at last sight"""
+        with self._lock:
+            return model in self._resident
+    
+    def swap_cost_ms(self, model: str) -> Optional[int]:
+        """
+        Expected extra latency before the model can answer
+        
+        Returns:
+            int: 0 if resident, else the learned cold-load time
+            None: If the model is cold but no cold load has been observed yet
+        """
+        with self._lock:
+            if model in self._resident:
+                return 0
+            load_ms = self._load_ms.get(model)
+            return int(load_ms) if load_ms is not None else None
+    
+    def snapshot(self) -> Dict:
+        """
+        Residency state for health reporting
+        
+        Returns:
+            dict: {'resident', 'refreshed_at', 'cold_load_ms'}
+        """
+        with self._lock:
+            return {
+                'resident': sorted(self._resident),
+                'refreshed_at': (
+                    datetime.fromtimestamp(self._refreshed_at).isoformat()
+                    if self._refreshed_at else None
+                ),
+                'cold_load_ms': {m: int(ms) for m, ms in self._load_ms.items()}
+            }
@@ -1,14 +1,43 @@
 """
 LLM Router - Manages routing between Local Models and Claude
-Phase 1: Simple manual routing (no auto-switching)
+Honors an explicit model choice; the "auto" preference picks the model from
+the query itself and from current latency, queue depth and swap cost
 Supports: General, Coder, and Claude models
 """
 
 import logging
-from typing import Tuple
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llm.timing import timed
 
 logger = logging.getLogger(__name__)
 
+# Single-pass classifiers: each keyword list is one alternation compiled once
+CODE_PATTERN = re.compile(
+    r"```|\bdef\s|\b(?:function|class|import|algorithm|bug|debug|refactor|implement|"
+    r"code|python|javascript|typescript|java|c\+\+|rust|golang|sql|regex|"
+    r"traceback|stack ?trace|exception|compile[rd]?)\b",
+    re.IGNORECASE
+)
+COMPLEX_PATTERN = re.compile(
+    r"\b(?:analy[sz]e|detailed|comprehensive|research|compare|evaluate|"
+    r"explain in depth|write a report|pros and cons|trade-?offs?)\b",
+    re.IGNORECASE
+)
+BRIEF_PATTERN = re.compile(
+    r"\b(?:briefly|brief|short|quick(?:ly)?|one (?:line|sentence|word)|tl;?dr|yes or no)\b",
+    re.IGNORECASE
+)
+LONG_OUTPUT_PATTERN = re.compile(
+    r"\b(?:essay|report|step[- ]by[- ]step|in detail|full (?:code|implementation)|"
+    r"tutorial|guide)\b",
+    re.IGNORECASE
+)
+
+# Queries longer than this read as complex tasks
+LONG_QUERY_CHARS = 500
+
 
 class ModelRouter:
     """
@@ -21,8 +50,61 @@ class ModelRouter:
     LOCAL_CODER = "local-coder"
     CLAUDE_MODEL = "claude"
     
-    def __init__(self):
-        """Initialize router"""
+    AUTO = "auto"
+    RACE = "race"  # A local model and Claude at once; the first good answer wins
+    
+    # Highest sampling temperature treated as deterministic enough to cache
+    CACHEABLE_MAX_TEMPERATURE = 0.3
+    
+    # Assumed (first token ms, ms per output token) until latencies are observed
+    LATENCY_PRIORS = {
+        LOCAL_GENERAL: (800, 40),
+        LOCAL_CODER: (800, 40),
+        CLAUDE_MODEL: (1500, 15),
+    }
+    
+    # Models tried in order for each query kind under auto routing
+    PREFERENCE_ORDER = {
+        'code': (LOCAL_CODER, CLAUDE_MODEL, LOCAL_GENERAL),
+        'complex': (CLAUDE_MODEL, LOCAL_GENERAL),
+        'general': (LOCAL_GENERAL, CLAUDE_MODEL),
+    }
+    
+    def __init__(
+        self,
+        residency=None,
+        max_swap_ms: Optional[int] = None,
+        latency=None,
+        queues: Optional[Dict] = None,
+        latency_slo_ms: Optional[int] = None,
+        max_output_tokens: int = 1024,
+        models: Optional[set] = None,
+        on_cold_skip: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Initialize router
+        
+        Args:
+            residency: ModelResidency used to price model swaps (optional)
+            max_swap_ms: Send a query to Claude rather than wait longer than
+                this for a cold local model to load (None never diverts)
+            latency: LatencyTracker with observed latencies per model (optional)
+            queues: AdmissionQueue per Ollama model name (optional)
+            latency_slo_ms: Target p95 response time for auto routing
+                (None routes on query kind alone)
+            max_output_tokens: Upper bound for output length estimates
+            models: Models auto routing may choose (default all three)
+            on_cold_skip: Optional fn(model_id) called when a cold local model
+                is passed over, so it can be loaded for next time
+        """
+        self.residency = residency
+        self.max_swap_ms = max_swap_ms
+        self.latency = latency
+        self.queues = queues or {}
+        self.latency_slo_ms = latency_slo_ms
+        self.max_output_tokens = max_output_tokens
+        self.models = models
+        self.on_cold_skip = on_cold_skip
         self.last_model_used = self.LOCAL_GENERAL
         logger.info("ModelRouter initialized with 3 models (General, Coder, Claude)")
     
@@ -34,12 +116,13 @@ class ModelRouter:
         """
         Determine which model should handle the query
         
-        Phase 1: Simply honors user preference
-        Phase 2: Will analyze query and potentially override
+        An explicit choice is honored unless its local model needs a slow
+        swap; "auto" is decided by route_auto and "race" picks the local
+        model that races Claude
         
         Args:
-            user_preference: "local-general", "local-coder", or "claude"
-            query: The user's question (unused in Phase 1)
+            user_preference: "local-general", "local-coder", "claude", "auto" or "race"
+            query: The user's question
         
         Returns:
             tuple: (
@@ -48,10 +131,62 @@ class ModelRouter:
                 auto_switched: bool     # True if system overrode user choice
             )
         """
-        # Phase 1: Always honor user preference
-        model_to_use = user_preference
-        reason = "User selected"
-        auto_switched = False
+        return self.apply_route(self.plan_route(user_preference, query))
+    
+    @timed('route')
+    def plan_route(
+        self,
+        user_preference: str,
+        query: str = None
+    ) -> Tuple[str, str, bool, List[str]]:
+        """
+        Decide a route without acting on it (no callbacks, stats or logs)
+        
+        Lets a caller see where a request would go, e.g. to pick its rate
+        limit, before committing to it with apply_route
+        
+        Returns:
+            tuple: route_query's result plus the cold local models passed over
+        """
+        cold_skipped = []
+        if user_preference == self.AUTO:
+            model_to_use, reason, auto_switched, cold_skipped = self._plan_auto(query or '')
+        elif user_preference == self.RACE:
+            # The local side of the race; Claude always runs alongside it
+            kind, label = self.classify_query(query or '')
+            model_to_use = self.LOCAL_CODER if kind == 'code' else self.LOCAL_GENERAL
+            reason = f"{label} (race); {self.get_model_display_name(model_to_use)} vs Claude"
+            auto_switched = False
+        else:
+            # Honor user preference unless the local model needs a slow swap
+            model_to_use = user_preference
+            reason = "User selected"
+            auto_switched = False
+            
+            swap_ms = self.swap_cost_ms(model_to_use)
+            if self.max_swap_ms is not None and swap_ms and swap_ms > self.max_swap_ms:
+                model_to_use = self.CLAUDE_MODEL
+                # Detail after ';' stays out of metric labels
+                reason = (
+                    f"{self.get_model_display_name(user_preference)} not loaded; "
+                    f"~{swap_ms / 1000:.0f}s swap"
+                )
+                auto_switched = True
+                cold_skipped = [user_preference]
+        
+        return model_to_use, reason, auto_switched, cold_skipped
+    
+    def apply_route(self, plan: Tuple[str, str, bool, List[str]]) -> Tuple[str, str, bool]:
+        """
+        Commit to a route from plan_route: cold models passed over are
+        reported to on_cold_skip, so they can be loaded for next time
+        
+        Returns:
+            tuple: (model_to_use, reason, auto_switched) as route_query
+        """
+        model_to_use, reason, auto_switched, cold_skipped = plan
+        for model_id in cold_skipped:
+            self._cold_skipped(model_id)
         
         # Track for stats
         self.last_model_used = model_to_use
@@ -60,6 +195,173 @@ class ModelRouter:
         
         return model_to_use, reason, auto_switched
     
+    def route_auto(self, query: str) -> Tuple[str, str, bool]:
+        """
+        Pick a model from the query kind and the latency each model would give
+        
+        Models are tried in the order preferred for the query kind; the first
+        whose predicted p95 meets the latency SLO wins, otherwise the fastest
+        
+        Args:
+            query: The user's question
+        
+        Returns:
+            tuple: (model_to_use, reason, auto_switched) where auto_switched
+                means the preferred model was passed over for latency
+        """
+        model_to_use, reason, auto_switched, cold_skipped = self._plan_auto(query)
+        for model_id in cold_skipped:
+            self._cold_skipped(model_id)
+        return model_to_use, reason, auto_switched
+    
+    def _plan_auto(self, query: str) -> Tuple[str, str, bool, List[str]]:
+        """route_auto without side effects; also returns the cold models passed over"""
+        kind, label = self.classify_query(query)
+        est_tokens = self.estimate_output_tokens(query, kind)
+        candidates = [
+            m for m in self.PREFERENCE_ORDER[kind] if self.models is None or m in self.models
+        ] or sorted(self.models)
+        
+        if self.latency_slo_ms is None:
+            return candidates[0], f"{label} (auto)", False, []
+        
+        predictions = {}
+        for model_id in candidates:
+            predictions[model_id] = self.predict_latency_ms(model_id, est_tokens)
+            if predictions[model_id]['p95_ms'] <= self.latency_slo_ms:
+                break
+        
+        within_slo = [
+            m for m, p in predictions.items() if p['p95_ms'] <= self.latency_slo_ms
+        ]
+        chosen = within_slo[0] if within_slo else min(
+            predictions, key=lambda m: predictions[m]['p95_ms']
+        )
+        
+        passed_over = [m for m in predictions if m != chosen]
+        cold_skipped = [m for m in passed_over if predictions[m]['swap_ms']]
+        
+        slo_s = self.latency_slo_ms / 1000
+        parts = [f"{label} (auto)", f"~{est_tokens} tokens"]
+        for model_id in passed_over:
+            parts.append(
+                f"{self._describe(model_id, predictions[model_id])} > {slo_s:g}s SLO"
+            )
+        chosen_text = self._describe(chosen, predictions[chosen])
+        parts.append(
+            f"{chosen_text} within {slo_s:g}s SLO" if chosen in within_slo
+            else f"{chosen_text} fastest"
+        )
+        return chosen, "; ".join(parts), chosen != candidates[0], cold_skipped
+    
+    def classify_query(self, query: str) -> Tuple[str, str]:
+        """
+        Classify a query for auto routing
+        
+        Returns:
+            tuple: (kind, label) where kind is 'code', 'complex' or 'general'
+        """
+        if CODE_PATTERN.search(query):
+            return 'code', "Code query"
+        if len(query) > LONG_QUERY_CHARS:
+            return 'complex', "Long complex query"
+        if COMPLEX_PATTERN.search(query):
+            return 'complex', "Complex analysis"
+        return 'general', "General query"
+    
+    def estimate_output_tokens(self, query: str, kind: str) -> int:
+        """Rough length of the answer a query will get, for latency prediction"""
+        if BRIEF_PATTERN.search(query):
+            tokens = 80
+        elif LONG_OUTPUT_PATTERN.search(query) or kind == 'complex':
+            tokens = 800
+        elif kind == 'code':
+            tokens = 400
+        else:
+            tokens = 250
+        return min(tokens, self.max_output_tokens)
+    
+    def predict_latency_ms(self, model_id: str, est_tokens: int) -> Dict:
+        """
+        Predicted p95 response time on a model right now
+        
+        Args:
+            model_id: Routed model identifier
+            est_tokens: Expected output tokens
+        
+        Returns:
+            dict: {'p95_ms', 'queue_wait_ms', 'queue_depth', 'swap_ms'}
+        """
+        first_token_ms, ms_per_token = self.LATENCY_PRIORS[model_id]
+        if self.latency:
+            observed_first = self.latency.first_token_ms(model_id, 95)
+            observed_rate = self.latency.ms_per_token(model_id, 50)
+            first_token_ms = observed_first if observed_first is not None else first_token_ms
+            ms_per_token = observed_rate if observed_rate is not None else ms_per_token
+        
+        queue_wait_ms = queue_depth = 0
+        queue = self.queues.get(self.get_model_name_for_ollama(model_id))
+        if queue and model_id != self.CLAUDE_MODEL:
+            queue_wait_ms = queue.expected_wait_ms()
+            queue_depth = queue.stats()['waiting']
+        
+        swap_ms = self.swap_cost_ms(model_id) or 0
+        return {
+            'p95_ms': int(first_token_ms + est_tokens * ms_per_token + queue_wait_ms + swap_ms),
+            'queue_wait_ms': queue_wait_ms,
+            'queue_depth': queue_depth,
+            'swap_ms': swap_ms
+        }
+    
+    def _describe(self, model_id: str, prediction: Dict) -> str:
+        """Short routing-reason text for one model's prediction"""
+        text = f"{self.get_model_display_name(model_id)} ~{prediction['p95_ms'] / 1000:.1f}s"
+        extras = []
+        if prediction['queue_depth']:
+            extras.append(f"{prediction['queue_depth']} queued")
+        if prediction['swap_ms']:
+            extras.append("not loaded")
+        return f"{text} ({', '.join(extras)})" if extras else text
+    
+    def _cold_skipped(self, model_id: str):
+        if self.on_cold_skip:
+            try:
+                self.on_cold_skip(model_id)
+            except Exception as e:
+                logger.error(f"Cold model callback failed for {model_id}: {e}")
+    
+    def swap_cost_ms(self, model_id: str) -> Optional[int]:
+        """
+        Expected model load delay before a local model can answer
+        
+        Args:
+            model_id: Routed model identifier
+        
+        Returns:
+            int: 0 when resident (or not a local model), else learned load time
+            None: If the cost is unknown
+        """
+        if not self.residency or model_id not in (self.LOCAL_GENERAL, self.LOCAL_CODER):
+            return 0
+        return self.residency.swap_cost_ms(self.get_model_name_for_ollama(model_id))
+    
+    def is_cacheable(self, model_id: str, temperature: float = None) -> bool:
+        """
+        Decide whether responses on this route may be served from cache
+        (or shared between identical concurrent requests)
+        
+        Only near-deterministic sampling qualifies, on any backend: a sampled
+        answer handed to another request would not be the answer it asked for
+        
+        Args:
+            model_id: Routed model identifier
+            temperature: Sampling temperature of the request
+        
+        Returns:
+            bool: True if the response can be cached and reused
+        """
+        return temperature is not None and temperature <= self.CACHEABLE_MAX_TEMPERATURE
+    
     def get_model_name_for_ollama(self, model_id: str) -> str:
         """
         Convert model ID to actual Ollama model name
@@ -120,61 +422,3 @@ class ModelRouter:
         }
         
         return icons.get(model_id, "🤖")
-
-
-# Phase 2 Preview: Auto-routing logic (commented out for now)
-"""
-class IntelligentRouter(ModelRouter):
-    '''
-    Smart router that automatically selects best model based on query
-    '''
-    
-    # Complexity indicators
-    COMPLEX_KEYWORDS = [
-        'analyze', 'detailed', 'comprehensive', 'research',
-        'compare', 'evaluate', 'explain in depth', 'write a report',
-    ]
-    
-    # Code indicators
-    CODE_KEYWORDS = [
-        'function', 'class', 'def ', 'import', 'algorithm',
-        'bug', 'debug', 'refactor', 'implement', 'code',
-        '```', 'python', 'javascript', 'java', 'c++',
-    ]
-    
-    def analyze_query_type(self, query: str) -> Tuple[str, str]:
-        '''
-        Determine which model is best for this query
-        Returns: (model_id: str, reason: str)
-        '''
-        query_lower = query.lower()
-        
-        # 1. Check for code-related queries
-        if any(kw in query_lower for kw in self.CODE_KEYWORDS):
-            return self.LOCAL_CODER, "Code-related query"
-        
-        # 2. Check for complex tasks needing Claude
-        if len(query) > 500:
-            return self.CLAUDE_MODEL, "Long complex query"
-        
-        if any(kw in query_lower for kw in self.COMPLEX_KEYWORDS):
-            return self.CLAUDE_MODEL, "Complex analysis required"
-        
-        # 3. Default to general model for everything else
-        return self.LOCAL_GENERAL, "General query"
-    
-    def route_query(self, user_preference: str, query: str = None):
-        '''Route with intelligence'''
-        
-        # If query provided, analyze it
-        if query:
-            best_model, reason = self.analyze_query_type(query)
-            
-            # Auto-switch if different from user preference
-            if best_model != user_preference:
-                logger.info(f"Auto-switching from {user_preference} to {best_model}: {reason}")
-                return best_model, reason, True  # auto_switched=True
-        
-        # Otherwise honor user preference
-        return user_preference, "User selected", False
-"""
\ No newline at end of file
@@ -0,0 +1,281 @@
+"""
+Single Flight - Coalesce identical concurrent model calls
+When several requests ask for the same deterministic generation at once,
+only the first one calls the model; the rest wait for and share its result
+(or, when streaming, replay its chunks as they arrive). A shared stream is
+abandoned, and its upstream call closed, once every follower has gone or
+cancelled; one caller cancelling leaves the stream running for the rest
+"""
+
+import contextvars
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from llm.cancellation import Cancelled
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One upstream call and everything waiting on it"""
+    
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.done = False
+        self.result = None
+        self.error = None
+        self.chunks = []
+        self.waiters = 0
+        self.followers = set()
+        self.joined = 0
+        self.abandoned = False
+    
+    def gone(self) -> bool:
+        """
+        Whether every follower has left or cancelled, polled by the upstream
+        call (e.g. while it waits for an admission slot)
+        
+        Once true the flight is abandoned, so a caller arriving afterwards
+        starts its own call instead of sharing a cancelled one
+        """
+        with self.cond:
+            if self.abandoned:
+                return True
+            followers = list(self.followers)
+            joined = self.joined
+        
+        # Checks may do I/O (the shared cancel store), so run them unlocked
+        if not followers or not all(follower.cancelled() for follower in followers):
+            return False
+        
+        with self.cond:
+            if self.joined == joined and not self.done:
+                self.abandoned = True
+            return self.abandoned
+
+
+class _Follower:
+    """Iterator over a shared stream that detaches from it exactly once"""
+    
+    def __init__(self, flight: _Flight, chunks: Iterator, cancelled: Optional[Callable[[], bool]]):
+        self._flight = flight
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._detached = True
+    
+    def attach(self) -> bool:
+        """Join the flight; False if it was abandoned first, so the caller starts a new one"""
+        flight = self._flight
+        with flight.cond:
+            if flight.abandoned:
+                return False
+            flight.followers.add(self)
+            flight.joined += 1
+            self._detached = False
+            return True
+    
+    def cancelled(self) -> bool:
+        """Whether this caller's own request was cancelled"""
+        return self._cancelled is not None and self._cancelled()
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self._detach()
+            raise
+    
+    def close(self):
+        """Stop following; the last follower to leave abandons the flight"""
+        self._chunks.close()
+        self._detach()
+    
+    def __del__(self):
+        self._detach()
+    
+    def _detach(self):
+        if self._detached:
+            return
+        self._detached = True
+        flight = self._flight
+        with flight.cond:
+            flight.followers.discard(self)
+            if not flight.followers and not flight.done:
+                flight.abandoned = True
+
+
+class SingleFlight:
+    """
+    Per-process registry of in-flight calls keyed by request fingerprint
+    """
+    
+    def __init__(self):
+        """Initialize single-flight registry"""
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._calls = 0
+        self._coalesced = 0
+    
+    def _join(self, key: str) -> Tuple[_Flight, bool]:
+        """Return the flight for a key and whether the caller leads it"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.abandoned:
+                flight = _Flight()
+                self._flights[key] = flight
+                self._calls += 1
+                return flight, True
+            
+            flight.waiters += 1
+            self._coalesced += 1
+            return flight, False
+    
+    def _finish(self, key: str, flight: _Flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        with flight.cond:
+            flight.done = True
+            flight.cond.notify_all()
+        if flight.waiters:
+            logger.info(f"Single-flight call shared with {flight.waiters} waiting requests")
+    
+    def run(self, key: Optional[str], fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Call fn once per key among concurrent callers
+        
+        Args:
+            key: Request fingerprint, or None to always call fn directly
+            fn: The upstream call
+        
+        Returns:
+            tuple: (result, coalesced) where coalesced is True if another
+                request's call was reused; its exception is re-raised too,
+                except a cancellation, after which waiters call fn themselves
+        """
+        if key is None:
+            return fn(), False
+        
+        # Whole results and chunk streams are never shared with each other
+        key = f"run:{key}"
+        flight, leader = self._join(key)
+        if leader:
+            try:
+                flight.result = fn()
+                return flight.result, False
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                self._finish(key, flight)
+        
+        with flight.cond:
+            flight.cond.wait_for(lambda: flight.done)
+        if isinstance(flight.error, Cancelled):
+            # The leader's client went away; that says nothing about this request
+            return self.run(key[len("run:"):], fn)
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, True
+    
+    def stream(
+        self,
+        key: Optional[str],
+        fn: Callable[[Callable[[], bool]], Iterator],
+        cancelled: Optional[Callable[[], bool]] = None
+    ) -> Tuple[Iterator, bool]:
+        """
+        Share one streaming call among concurrent callers
+        
+        The upstream iterator is drained by a background thread, so it
+        finishes for the remaining waiters even if the first caller goes away;
+        once every caller has closed its iterator or cancelled, the upstream
+        call is closed
+        
+        Args:
+            key: Request fingerprint, or None to stream fn directly
+            fn: Fn(cancelled) returning the upstream chunk iterator, where
+                cancelled() is true once no caller still wants the stream
+            cancelled: This caller's own cancellation check (optional)
+        
+        Returns:
+            tuple: (chunk iterator, coalesced)
+        """
+        if key is None:
+            return fn(cancelled or (lambda: False)), False
+        
+        key = f"stream:{key}"
+        while True:
+            flight, leader = self._join(key)
+            follower = _Follower(flight, self._follow(flight), cancelled)
+            if follower.attach():
+                break
+        
+        if leader:
+            # Run in the leader's context so its request timings see the call
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self._pump, key, flight, fn),
+                name="single-flight",
+                daemon=True
+            ).start()
+        
+        return follower, not leader
+    
+    def _pump(self, key: str, flight: _Flight, fn: Callable[[Callable[[], bool]], Iterator]):
+        chunks = None
+        try:
+            chunks = fn(flight.gone)
+            for chunk in chunks:
+                with flight.cond:
+                    if flight.abandoned:
+                        logger.info("Shared stream abandoned by every caller; closing upstream")
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            # Closing the generator closes the upstream HTTP response
+            if chunks is not None and hasattr(chunks, 'close'):
+                try:
+                    chunks.close()
+                except Exception as e:
+                    logger.error(f"Failed to close abandoned stream: {e}")
+            self._finish(key, flight)
+    
+    @staticmethod
+    def _follow(flight: _Flight) -> Iterator:
+        position = 0
+        while True:
+            with flight.cond:
+                flight.cond.wait_for(lambda: len(flight.chunks) > position or flight.done)
+                batch = flight.chunks[position:]
+                finished = flight.done
+            
+            position += len(batch)
+            for chunk in batch:
+                yield chunk
+            
+            if finished and not batch:
+                if flight.error is not None:
+                    raise flight.error
+                return
+    
+    def stats(self) -> Dict:
+        """
+        Coalescing counters for this worker
+        
+        Returns:
+            dict: {'upstream_calls', 'coalesced', 'in_flight'}
+        """
+        with self._lock:
+            return {
+                'upstream_calls': self._calls,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._flights)
+            }
@@ -0,0 +1,160 @@
+"""
+Request Timing - Named spans for a per-request Server-Timing breakdown
+Code anywhere in a request wraps its phases in span(); durations land in the
+timings started for the current request (tracked per thread or greenlet)
+and spans are no-ops outside one, so instrumented clients still work from
+scripts and background threads. Also holds the opt-in request profiler
+"""
+
+import cProfile
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Dict, Optional
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+except ImportError:
+    PyinstrumentProfiler = None
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional['RequestTimings']] = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Span durations for one request, in the order they were first seen
+    """
+    
+    def __init__(self):
+        """Start the request clock"""
+        self.started = time.perf_counter()
+        self._spans: Dict[str, float] = {}
+    
+    def add(self, name: str, duration_ms: float):
+        """Add time to a span (repeated spans accumulate)"""
+        self._spans[name] = self._spans.get(name, 0.0) + duration_ms
+    
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the request started"""
+        return (time.perf_counter() - self.started) * 1000
+    
+    def as_dict(self) -> Dict[str, float]:
+        """Span name -> milliseconds, plus 'total' so far"""
+        # Copied first: background threads may still be adding spans
+        spans = {name: round(ms, 1) for name, ms in list(self._spans.items())}
+        spans['total'] = round(self.elapsed_ms(), 1)
+        return spans
+    
+    def header(self) -> str:
+        """Server-Timing header value"""
+        return ', '.join(f"{name};dur={ms}" for name, ms in self.as_dict().items())
+
+
+def start_request() -> RequestTimings:
+    """Begin collecting spans for the request on this thread or greenlet"""
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def end_request():
+    """Stop collecting spans on this thread or greenlet"""
+    _current.set(None)
+
+
+def current() -> Optional[RequestTimings]:
+    """Timings for the running request, or None outside one"""
+    return _current.get()
+
+
+def record(name: str, duration_ms: float):
+    """Add an already measured duration to the running request, if any"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, duration_ms)
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block as a named span of the running request"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+
+
+def timed(name: str):
+    """Decorator form of span()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RequestProfiler:
+    """
+    Profiles one request with pyinstrument (if installed) or cProfile
+    Both only see the thread that started them; under gevent that thread
+    also runs other requests' greenlets, which then show up in the dump
+    """
+    
+    def __init__(self, kind: str = "cprofile"):
+        """
+        Initialize profiler
+        
+        Args:
+            kind: "pyinstrument" or "cprofile" (falls back to cProfile if
+                pyinstrument is not installed)
+        """
+        self.kind = "pyinstrument" if kind == "pyinstrument" and PyinstrumentProfiler else "cprofile"
+        self._profiler = PyinstrumentProfiler() if self.kind == "pyinstrument" else cProfile.Profile()
+    
+    def start(self):
+        """Start profiling the current thread"""
+        if self.kind == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+    
+    def stop_and_dump(self, directory: str, label: str) -> str:
+        """
+        Stop profiling and write the result
+        
+        Args:
+            directory: Where dumps are written (created if missing)
+            label: Included in the file name (e.g. the endpoint)
+        
+        Returns:
+            str: Path of the dump (.html for pyinstrument, .prof for pstats)
+        """
+        os.makedirs(directory, exist_ok=True)
+        stem = f"{datetime.now():%Y%m%d-%H%M%S}-{label}-{uuid.uuid4().hex[:8]}"
+        
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+            path = os.path.join(directory, f"{stem}.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self._profiler.output_html())
+        else:
+            self._profiler.disable()
+            path = os.path.join(directory, f"{stem}.prof")
+            self._profiler.dump_stats(path)
+        
+        logger.info(f"Request profile written to {path}")
+        return path
@@ -17,7 +17,7 @@ function handleMessageSubmit(event) {
     
     // Get model selection from radio button
     const selectedRadio = document.querySelector('input[name="llm-model"]:checked');
-    const modelPreference = selectedRadio ? selectedRadio.value : 'local-general';
+    const modelPreference = selectedRadio ? selectedRadio.value : null;  // Server default when no selector
     
     // Clear welcome message if it exists
     const welcomeMessage = document.querySelector('.welcome-message');
@@ -32,43 +32,147 @@ function handleMessageSubmit(event) {
     messageInput.value = '';
     document.getElementById('char-count').textContent = '0';
     
-    // Show loading state
+    // Show loading state until the first token arrives
     showLoading(true);
     
-    // Send to server with model preference
-    fetch('/chat', {
+    // Send to server with model preference; tokens stream back as SSE
+    fetch('/chat/stream', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ 
+        body: JSON.stringify({
             message: message,
             model_preference: modelPreference  // Send selected model
         })
     })
-    .then(response => response.json())
-    .then(data => {
-        showLoading(false);
+    .then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
         
-        if (data.success) {
-            appendMessage('assistant', data.assistant_message, data.timestamp);
-            
-            // Update model indicator with response info
-            updateModelDisplay(data);
-            
-            // Sync radio button if auto-switched
-            if (data.auto_switched) {
-                syncRadioButton(data.model_used, true);
-            }
-            
-            messageInput.focus();
-        } else {
-            showError(data.error || 'Failed to get response');
+        // Settings commands and validation errors come back as plain JSON
+        if (!contentType.includes('text/event-stream')) {
+            return response.json().then(data => {
+                showLoading(false);
+                handleChatResponse(data);
+            });
         }
+        
+        return readChatStream(response);
     })
     .catch(error => {
         showLoading(false);
         console.error('Error:', error);
         showError('Unable to connect to server. Please try again.');
     });
-}
\ No newline at end of file
+}
+
+function handleChatResponse(data) {
+    const messageInput = document.getElementById('message-input');
+    
+    if (data.success) {
+        appendMessage('assistant', data.assistant_message, data.timestamp);
+        
+        // Update model indicator with response info
+        updateModelDisplay(data);
+        
+        // Sync radio button if auto-switched
+        if (data.auto_switched) {
+            syncRadioButton(data.model_used, true);
+        }
+        
+        messageInput.focus();
+    } else {
+        showError(data.error || 'Failed to get response');
+    }
+}
+
+function readChatStream(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    let streamingContent = null;
+    
+    function handleEvent(eventName, data) {
+        if (eventName === 'token') {
+            if (!streamingContent) {
+                showLoading(false);
+                streamingContent = appendStreamingMessage();
+            }
+            text += data.text;
+            streamingContent.textContent = text;
+            scrollMessagesToBottom();
+        } else if (eventName === 'done') {
+            showLoading(false);
+            removeStreamingMessage(streamingContent);
+            handleChatResponse(Object.assign({ assistant_message: text }, data));
+        } else if (eventName === 'error') {
+            showLoading(false);
+            removeStreamingMessage(streamingContent);
+            showError(data.error || 'Failed to get response');
+        } else if (eventName === 'cancelled') {
+            showLoading(false);
+            removeStreamingMessage(streamingContent);
+        }
+    }
+    
+    function pump() {
+        return reader.read().then(({ done, value }) => {
+            if (done) {
+                return;
+            }
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // SSE frames are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let dataLines = [];
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        eventName = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        dataLines.push(line.slice(6));
+                    }
+                });
+                
+                if (dataLines.length) {
+                    handleEvent(eventName, JSON.parse(dataLines.join('\n')));
+                }
+            }
+            
+            return pump();
+        });
+    }
+    
+    return pump();
+}
+
+function appendStreamingMessage() {
+    const container = document.getElementById('messages-container');
+    
+    const messageDiv = document.createElement('div');
+    messageDiv.className = 'message assistant streaming';
+    
+    const contentDiv = document.createElement('div');
+    contentDiv.className = 'message-content';
+    messageDiv.appendChild(contentDiv);
+    
+    container.appendChild(messageDiv);
+    return contentDiv;
+}
+
+function removeStreamingMessage(contentDiv) {
+    if (contentDiv && contentDiv.parentNode) {
+        contentDiv.parentNode.remove();
+    }
+}
+
+function scrollMessagesToBottom() {
+    const container = document.getElementById('messages-container');
+    container.scrollTop = container.scrollHeight;
+}
@@ -0,0 +1,62 @@
+"""
+Cancel Store - Cancellation requests shared by every gunicorn worker
+A cancel can arrive on a different worker than the generation it targets,
+so requests are recorded per conversation in SQLite and polled by the
+worker doing the work; old entries are swept away
+"""
+
+import logging
+import time
+from typing import Optional
+
+from storage.sqlite_base import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cancellations (
+    conversation_id TEXT PRIMARY KEY,
+    requested_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class CancelStore(SQLiteStore):
+    """
+    Latest cancellation time per conversation
+    """
+    
+    def __init__(self, path: str = "data/cancellations.db", retention_seconds: float = 600):
+        """
+        Initialize cancel store
+        
+        Args:
+            path: SQLite database file (created if missing)
+            retention_seconds: How long a cancellation is kept; longer than
+                any request can run
+        """
+        super().__init__(path, SCHEMA)
+        self.retention_seconds = retention_seconds
+        logger.info(f"CancelStore initialized at {path}")
+    
+    def request_cancel(self, conversation_id: str):
+        """Cancel everything started for a conversation before now"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO cancellations (conversation_id, requested_at) VALUES (?, ?) "
+                "ON CONFLICT(conversation_id) DO UPDATE SET requested_at = excluded.requested_at",
+                (conversation_id, now)
+            )
+            conn.execute(
+                "DELETE FROM cancellations WHERE requested_at < ?",
+                (now - self.retention_seconds,)
+            )
+    
+    def cancelled_at(self, conversation_id: str) -> Optional[float]:
+        """Time of the latest cancellation for a conversation, if any"""
+        rows = self._query(
+            "SELECT requested_at FROM cancellations WHERE conversation_id = ?",
+            (conversation_id,)
+        )
+        return rows[0]["requested_at"] if rows else None
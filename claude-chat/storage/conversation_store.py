@@ -0,0 +1,259 @@
+"""
+Conversation Store - Server-side chat history backed by SQLite
+Replaces cookie-held history: the session only carries an opaque
+conversation ID, turns live in a WAL-mode database shared by all workers
+"""
+
+import json
+import logging
+import secrets
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional
+
+from storage.sqlite_base import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    conversation_id TEXT PRIMARY KEY,
+    turn_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated
+    ON conversations (updated_at);
+CREATE TABLE IF NOT EXISTS turns (
+    conversation_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    user_message TEXT NOT NULL,
+    assistant_message TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    model TEXT,
+    metadata TEXT,
+    PRIMARY KEY (conversation_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    conversation_id TEXT PRIMARY KEY,
+    upto_seq INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    folded_tokens INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class ConversationStore(SQLiteStore):
+    """
+    Append-only conversation history keyed by conversation ID
+    Appends and page reads are primary-key lookups, independent of history length
+    """
+    
+    def __init__(self, path: str = "data/conversations.db"):
+        """
+        Initialize conversation store
+        
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        super().__init__(path, SCHEMA)
+        logger.info(f"ConversationStore initialized at {path}")
+    
+    @staticmethod
+    def new_conversation_id() -> str:
+        """Generate an opaque, unguessable conversation ID"""
+        return secrets.token_urlsafe(24)
+    
+    def append_turn(
+        self,
+        conversation_id: str,
+        user_message: str,
+        assistant_message: str,
+        timestamp: str,
+        model: Optional[str] = None,
+        metadata: Optional[Dict] = None
+    ) -> int:
+        """
+        Append one exchange to a conversation
+        
+        Args:
+            conversation_id: Opaque conversation ID from the session
+            user_message: User's message
+            assistant_message: Model's reply
+            timestamp: Display timestamp of the exchange
+            model: Model that produced the reply
+            metadata: Extra per-turn data (latency, tokens, routing, ...)
+        
+        Returns:
+            int: Sequence number of the new turn (0-based)
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT turn_count FROM conversations WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+            
+            if row is None:
+                seq = 0
+                conn.execute(
+                    "INSERT INTO conversations (conversation_id, turn_count, created_at, updated_at) "
+                    "VALUES (?, 1, ?, ?)",
+                    (conversation_id, now, now)
+                )
+            else:
+                seq = row["turn_count"]
+                conn.execute(
+                    "UPDATE conversations SET turn_count = ?, updated_at = ? WHERE conversation_id = ?",
+                    (seq + 1, now, conversation_id)
+                )
+            
+            conn.execute(
+                "INSERT INTO turns (conversation_id, seq, user_message, assistant_message, "
+                "timestamp, model, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    conversation_id, seq, user_message, assistant_message,
+                    timestamp, model, json.dumps(metadata) if metadata else None
+                )
+            )
+        
+        return seq
+    
+    def count_turns(self, conversation_id: str) -> int:
+        """Number of turns in a conversation (0 if it does not exist)"""
+        rows = self._query(
+            "SELECT turn_count FROM conversations WHERE conversation_id = ?",
+            (conversation_id,)
+        )
+        return rows[0]["turn_count"] if rows else 0
+    
+    def get_turns(
+        self,
+        conversation_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Read a page of turns in conversation order
+        
+        Args:
+            conversation_id: Opaque conversation ID
+            offset: First turn sequence number to return
+            limit: Maximum turns to return (None for all remaining)
+        
+        Returns:
+            list: Turn dicts with 'user', 'assistant', 'timestamp', 'model', 'metadata'
+        """
+        rows = self._query(
+            "SELECT seq, user_message, assistant_message, timestamp, model, metadata "
+            "FROM turns WHERE conversation_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+            (conversation_id, offset, -1 if limit is None else limit)
+        )
+        return [self._row_to_turn(row) for row in rows]
+    
+    def get_recent_turns(self, conversation_id: str, limit: int) -> List[Dict]:
+        """Read the last `limit` turns in conversation order"""
+        start = max(0, self.count_turns(conversation_id) - limit)
+        return self.get_turns(conversation_id, offset=start, limit=limit)
+    
+    def iter_turns(self, conversation_id: str, page_size: int = 100) -> Iterator[Dict]:
+        """Yield every turn, reading one page at a time"""
+        offset = 0
+        while True:
+            page = self.get_turns(conversation_id, offset=offset, limit=page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
+    
+    def get_summary(self, conversation_id: str) -> Optional[Dict]:
+        """
+        Get the cached rolling summary of a conversation's older turns
+        
+        Returns:
+            dict: {'upto_seq': int, 'text': str, 'folded_tokens': int}
+            None: If nothing has been summarized yet
+        """
+        rows = self._query(
+            "SELECT upto_seq, summary, folded_tokens FROM summaries WHERE conversation_id = ?",
+            (conversation_id,)
+        )
+        
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            'upto_seq': row["upto_seq"],
+            'text': row["summary"],
+            'folded_tokens': row["folded_tokens"]
+        }
+    
+    def save_summary(
+        self,
+        conversation_id: str,
+        upto_seq: int,
+        text: str,
+        folded_tokens: int
+    ):
+        """
+        Store the rolling summary covering turns 0..upto_seq
+        
+        Args:
+            conversation_id: Opaque conversation ID
+            upto_seq: Last turn sequence number folded into the summary
+            text: Summary text
+            folded_tokens: Estimated tokens of all turns the summary replaces
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO summaries (conversation_id, upto_seq, summary, folded_tokens) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(conversation_id) DO UPDATE SET "
+                "upto_seq = excluded.upto_seq, summary = excluded.summary, "
+                "folded_tokens = excluded.folded_tokens",
+                (conversation_id, upto_seq, text, folded_tokens)
+            )
+    
+    def delete_conversation(self, conversation_id: str):
+        """Remove a conversation and all of its turns"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM turns WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("DELETE FROM summaries WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+    
+    def purge_inactive(self, max_age_seconds: float) -> int:
+        """
+        Delete conversations not updated within max_age_seconds
+        
+        Returns:
+            int: Number of conversations removed
+        """
+        cutoff = time.time() - max_age_seconds
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM turns WHERE conversation_id IN "
+                "(SELECT conversation_id FROM conversations WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            conn.execute(
+                "DELETE FROM summaries WHERE conversation_id IN "
+                "(SELECT conversation_id FROM conversations WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            removed = conn.execute(
+                "DELETE FROM conversations WHERE updated_at < ?", (cutoff,)
+            ).rowcount
+        
+        if removed:
+            logger.info(f"Purged {removed} inactive conversations")
+        return removed
+    
+    @staticmethod
+    def _row_to_turn(row: sqlite3.Row) -> Dict:
+        return {
+            'seq': row["seq"],
+            'user': row["user_message"],
+            'assistant': row["assistant_message"],
+            'timestamp': row["timestamp"],
+            'model': row["model"],
+            'metadata': json.loads(row["metadata"]) if row["metadata"] else {}
+        }
@@ -0,0 +1,82 @@
+"""
+Conversation Export - Render stored turns as text, Markdown or JSONL
+Each writer is a generator yielding one piece per turn, so an export is
+streamed to the client while turns are paged out of the store and memory
+stays flat however long the conversation is
+"""
+
+import json
+from typing import Dict, Iterable, Iterator
+
+RULE = "=" * 80
+
+
+def write_text(turns: Iterable[Dict], settings: Dict, generated: str) -> Iterator[str]:
+    """Plain-text transcript"""
+    yield (
+        f"{RULE}\n"
+        "CLAUDE CONVERSATION EXPORT\n"
+        f"Generated: {generated}\n"
+        f"{RULE}\n"
+        "\nCONFIGURATION:\n"
+        f"Model: {settings['model']}\n"
+        f"Temperature: {settings['temperature']}\n"
+        f"Max Tokens: {settings['max_tokens']}\n"
+        f"System Prompt: {settings['system_prompt']}\n"
+        f"\n{RULE}\n\n"
+    )
+    for i, turn in enumerate(turns, 1):
+        yield (
+            f"--- Exchange {i} ({turn['timestamp']}) ---\n\n"
+            "USER:\n"
+            f"{turn['user']}\n\n"
+            f"ASSISTANT ({turn.get('model') or 'unknown'}):\n"
+            f"{turn['assistant']}\n\n"
+            f"{'-' * 80}\n\n"
+        )
+
+
+def write_markdown(turns: Iterable[Dict], settings: Dict, generated: str) -> Iterator[str]:
+    """Markdown transcript with one section per exchange"""
+    yield (
+        "# Claude Conversation Export\n\n"
+        f"Generated: {generated}\n\n"
+        "## Configuration\n\n"
+        f"- **Model:** {settings['model']}\n"
+        f"- **Temperature:** {settings['temperature']}\n"
+        f"- **Max Tokens:** {settings['max_tokens']}\n"
+        f"- **System Prompt:** {settings['system_prompt']}\n\n"
+    )
+    for i, turn in enumerate(turns, 1):
+        response_time_ms = turn['metadata'].get('response_time_ms')
+        timing = f", {response_time_ms}ms" if response_time_ms is not None else ""
+        yield (
+            f"## Exchange {i}\n\n"
+            f"*{turn['timestamp']}*\n\n"
+            "### User\n\n"
+            f"{turn['user']}\n\n"
+            f"### Assistant ({turn.get('model') or 'unknown'}{timing})\n\n"
+            f"{turn['assistant']}\n\n"
+            "---\n\n"
+        )
+
+
+def write_jsonl(turns: Iterable[Dict], settings: Dict, generated: str) -> Iterator[str]:
+    """One JSON object per turn, with its model and response metadata"""
+    for turn in turns:
+        yield json.dumps({
+            'seq': turn['seq'],
+            'timestamp': turn['timestamp'],
+            'model': turn.get('model'),
+            'user': turn['user'],
+            'assistant': turn['assistant'],
+            'metadata': turn['metadata']
+        }, ensure_ascii=False) + "\n"
+
+
+# format -> (writer, content type, file extension)
+EXPORT_FORMATS = {
+    'txt': (write_text, 'text/plain; charset=utf-8', 'txt'),
+    'md': (write_markdown, 'text/markdown; charset=utf-8', 'md'),
+    'jsonl': (write_jsonl, 'application/x-ndjson; charset=utf-8', 'jsonl'),
+}
@@ -0,0 +1,225 @@
+"""
+Metrics Store - Prometheus-style counters, histograms and gauges
+Samples live in SQLite so every gunicorn worker adds to the same series and
+/metrics reports totals for the whole server, not for whichever worker
+happened to answer the scrape
+"""
+
+import logging
+import os
+from typing import Dict, Optional
+
+from storage.sqlite_base import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_values (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS metric_gauges (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, pid)
+) WITHOUT ROWID;
+"""
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'chat_requests_total': (
+        'counter', 'Chat requests by model, routing reason and outcome', None
+    ),
+    'chat_request_duration_seconds': (
+        'histogram', 'End-to-end chat response time', LATENCY_BUCKETS
+    ),
+    'chat_time_to_first_token_seconds': (
+        'histogram', 'Time until the first streamed token', LATENCY_BUCKETS
+    ),
+    'chat_tokens_per_second': (
+        'histogram', 'Generation throughput per response', THROUGHPUT_BUCKETS
+    ),
+    'chat_tokens_generated_total': (
+        'counter', 'Output tokens generated', None
+    ),
+    'chat_fallbacks_total': (
+        'counter', 'Requests escalated away from the routed model', None
+    ),
+    'rate_limit_rejections_total': (
+        'counter', 'Requests rejected by the rate limiter', None
+    ),
+    'chat_requests_in_flight': (
+        'gauge', 'Chat requests currently being served', None
+    ),
+    'chat_queue_wait_seconds': (
+        'histogram', 'Time spent waiting for a local model slot', LATENCY_BUCKETS
+    ),
+    'chat_queue_depth': (
+        'gauge', 'Requests waiting for a local model slot', None
+    ),
+    'chat_queue_shed_total': (
+        'counter', 'Requests the local admission queue had no room for', None
+    ),
+    'chat_cold_starts_total': (
+        'counter', 'Local responses that had to wait for a model load', None
+    ),
+    'chat_race_total': (
+        'counter', 'Race-mode requests by winning backend (local, claude, none or cancelled)', None
+    ),
+    'chat_cancellations_total': (
+        'counter', 'Chat requests aborted before finishing, by endpoint and reason (cancelled or disconnect)', None
+    ),
+    'config_advice_total': (
+        'counter', 'Configuration advice served, by source (claude or cache)', None
+    ),
+    'startup_seconds': (
+        'histogram', 'Time from worker import to each startup stage (ready, local_discovered)', LATENCY_BUCKETS
+    ),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels: Optional[Dict]) -> str:
+    """Render labels in exposition format with a stable key order"""
+    if not labels:
+        return ''
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _format_le(bound) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _sample_order(sample):
+    """Sort key keeping histogram buckets in ascending le order"""
+    labels = sample[0]
+    base, _, le = labels.partition('le="')
+    if not le:
+        return (labels, 0.0)
+    return (base, float(le.rstrip('"').replace('+Inf', 'inf')))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsStore(SQLiteStore):
+    """
+    Shared metric registry rendered in the Prometheus text format
+    """
+    
+    def __init__(self, path: str = "data/metrics.db"):
+        """
+        Initialize metrics store
+        
+        Args:
+            path: SQLite database file (created if missing)
+        """
+        super().__init__(path, SCHEMA)
+        logger.info(f"MetricsStore initialized at {path}")
+    
+    def inc(self, name: str, labels: Optional[Dict] = None, amount: float = 1):
+        """Increment a counter"""
+        with self._transaction() as conn:
+            self._add(conn, name, format_labels(labels), amount)
+    
+    def observe(self, name: str, value: float, labels: Optional[Dict] = None):
+        """Record one histogram observation (buckets stored cumulatively)"""
+        buckets = METRICS[name][2] + (float('inf'),)
+        label_str = format_labels(labels)
+        
+        with self._transaction() as conn:
+            for bound in buckets:
+                if value <= bound:
+                    le = f'le="{_format_le(bound)}"'
+                    self._add(conn, f'{name}_bucket', f'{label_str},{le}' if label_str else le, 1)
+            self._add(conn, f'{name}_sum', label_str, value)
+            self._add(conn, f'{name}_count', label_str, 1)
+    
+    def gauge_add(self, name: str, amount: float, labels: Optional[Dict] = None):
+        """
+        Adjust a gauge for this process
+        
+        Each worker keeps its own row so a crashed worker's in-flight
+        requests drop out of the total instead of leaking forever
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO metric_gauges (name, labels, pid, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(name, labels, pid) DO UPDATE SET value = value + excluded.value",
+                (name, format_labels(labels), os.getpid(), amount)
+            )
+    
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format
+        
+        Returns:
+            str: Exposition text (version 0.0.4)
+        """
+        values = {}
+        for row in self._query("SELECT name, labels, value FROM metric_values"):
+            values.setdefault(row["name"], []).append((row["labels"], row["value"]))
+        
+        gauges = {}
+        dead_pids = set()
+        for row in self._query("SELECT name, labels, pid, value FROM metric_gauges"):
+            if row["pid"] in dead_pids or not _pid_alive(row["pid"]):
+                dead_pids.add(row["pid"])
+                continue
+            key = (row["name"], row["labels"])
+            gauges[key] = gauges.get(key, 0) + row["value"]
+        
+        if dead_pids:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "DELETE FROM metric_gauges WHERE pid = ?", [(pid,) for pid in dead_pids]
+                )
+        
+        lines = []
+        for name, (metric_type, help_text, _) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            
+            if metric_type == 'gauge':
+                samples = [(labels, value) for (n, labels), value in gauges.items() if n == name]
+                lines.extend(self._sample_lines(name, samples))
+            elif metric_type == 'histogram':
+                for suffix in ('_bucket', '_sum', '_count'):
+                    lines.extend(self._sample_lines(name + suffix, values.get(name + suffix, [])))
+            else:
+                lines.extend(self._sample_lines(name, values.get(name, [])))
+        
+        return '\n'.join(lines) + '\n'
+    
+    @staticmethod
+    def _sample_lines(name: str, samples) -> list:
+        lines = []
+        for labels, value in sorted(samples, key=_sample_order):
+            value_str = repr(int(value)) if float(value).is_integer() else repr(value)
+            lines.append(f"{name}{{{labels}}} {value_str}" if labels else f"{name} {value_str}")
+        return lines
+    
+    @staticmethod
+    def _add(conn, name: str, labels: str, amount: float):
+        conn.execute(
+            "INSERT INTO metric_values (name, labels, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value",
+            (name, labels, amount)
+        )
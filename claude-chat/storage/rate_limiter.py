@@ -0,0 +1,101 @@
+"""
+Rate Limiter - Token buckets shared by every gunicorn worker
+Each bucket is one SQLite row updated in a single transaction, so a check
+is O(1) and the limit holds across workers; buckets that have refilled
+completely carry no state and are swept away
+"""
+
+import logging
+import time
+from typing import Tuple
+
+from storage.sqlite_base import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    bucket_key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    full_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rate_buckets_full
+    ON rate_buckets (full_at);
+"""
+
+
+class TokenBucketLimiter(SQLiteStore):
+    """
+    Shared token-bucket limiter keyed by arbitrary strings
+    """
+    
+    def __init__(self, path: str = "data/rate_limits.db", sweep_interval: float = 60):
+        """
+        Initialize rate limiter
+        
+        Args:
+            path: SQLite database file (created if missing)
+            sweep_interval: Seconds between sweeps of idle (full) buckets
+        """
+        super().__init__(path, SCHEMA)
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        logger.info(f"TokenBucketLimiter initialized at {path}")
+    
+    def acquire(
+        self,
+        key: str,
+        capacity: float,
+        refill_per_second: float,
+        cost: float = 1
+    ) -> Tuple[bool, float]:
+        """
+        Take tokens from a bucket if enough are available
+        
+        Args:
+            key: Bucket key (e.g. client address plus model tier)
+            capacity: Bucket size, i.e. the allowed burst
+            refill_per_second: Tokens added back per second
+            cost: Tokens this request needs
+        
+        Returns:
+            tuple: (allowed, retry_after_seconds)
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE bucket_key = ?",
+                (key,)
+            ).fetchone()
+            
+            if row is None:
+                tokens = capacity
+            else:
+                elapsed = max(0.0, now - row["updated_at"])
+                tokens = min(capacity, row["tokens"] + elapsed * refill_per_second)
+            
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            
+            full_at = now + (capacity - tokens) / refill_per_second
+            conn.execute(
+                "INSERT INTO rate_buckets (bucket_key, tokens, updated_at, full_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(bucket_key) DO UPDATE SET "
+                "tokens = excluded.tokens, updated_at = excluded.updated_at, "
+                "full_at = excluded.full_at",
+                (key, tokens, now, full_at)
+            )
+            
+            # A full bucket is indistinguishable from a missing one, so drop it
+            if now - self._last_sweep >= self.sweep_interval:
+                self._last_sweep = now
+                swept = conn.execute(
+                    "DELETE FROM rate_buckets WHERE full_at <= ?", (now,)
+                ).rowcount
+                if swept:
+                    logger.debug(f"Swept {swept} idle rate limit buckets")
+        
+        retry_after = 0.0 if allowed else (cost - tokens) / refill_per_second
+        return allowed, retry_after
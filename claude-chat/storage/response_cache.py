@@ -0,0 +1,193 @@
+"""
+Response Cache - Exact-match cache for deterministic LLM requests
+Keyed by a hash of (model, system prompt, temperature, max_tokens,
+normalized messages); bounded by LRU eviction and a TTL, and stored in
+SQLite so every gunicorn worker shares entries and hit/miss counters
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional
+
+from storage.sqlite_base import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS response_cache (
+    cache_key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_response_cache_access
+    ON response_cache (last_access);
+CREATE TABLE IF NOT EXISTS cache_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _normalize(text: str) -> str:
+    """Collapse whitespace so trivially different prompts share an entry"""
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def make_cache_key(
+    model: str,
+    system_prompt: str,
+    temperature: float,
+    max_tokens: int,
+    messages: List[Dict]
+) -> str:
+    """
+    Hash a request into a cache key
+    
+    Args:
+        model: Model name
+        system_prompt: System prompt (including any conversation summary)
+        temperature: Sampling temperature
+        max_tokens: Output token limit
+        messages: Claude-style [{'role', 'content'}] message list
+    
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    payload = json.dumps(
+        {
+            'model': model,
+            'system': _normalize(system_prompt or ''),
+            'temperature': round(float(temperature), 3),
+            'max_tokens': int(max_tokens),
+            'messages': [
+                [m['role'], _normalize(m['content'])] for m in messages
+            ]
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(SQLiteStore):
+    """
+    Shared LRU + TTL cache of complete model responses
+    """
+    
+    def __init__(
+        self,
+        path: str = "data/response_cache.db",
+        max_entries: int = 1000,
+        ttl_seconds: float = 3600
+    ):
+        """
+        Initialize response cache
+        
+        Args:
+            path: SQLite database file (created if missing)
+            max_entries: Entries kept before least-recently-used eviction
+            ttl_seconds: Age after which an entry is no longer served
+        """
+        super().__init__(path, SCHEMA)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        logger.info(
+            f"ResponseCache initialized at {path} "
+            f"({max_entries} entries, {ttl_seconds}s TTL)"
+        )
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a cached response, counting the hit or miss
+        
+        Returns:
+            dict: Cached response payload
+            None: On miss or expired entry
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM response_cache WHERE cache_key = ?",
+                (key,)
+            ).fetchone()
+            
+            if row is not None and now - row["created_at"] > self.ttl_seconds:
+                conn.execute("DELETE FROM response_cache WHERE cache_key = ?", (key,))
+                row = None
+            
+            if row is None:
+                self._increment(conn, 'misses')
+                return None
+            
+            conn.execute(
+                "UPDATE response_cache SET last_access = ? WHERE cache_key = ?",
+                (now, key)
+            )
+            self._increment(conn, 'hits')
+        
+        return json.loads(row["response"])
+    
+    def put(self, key: str, response: Dict):
+        """
+        Store a response, evicting least-recently-used entries past max_entries
+        
+        Args:
+            key: Key from make_cache_key()
+            response: JSON-serializable response payload
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO response_cache (cache_key, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(cache_key) DO UPDATE SET "
+                "response = excluded.response, created_at = excluded.created_at, "
+                "last_access = excluded.last_access",
+                (key, json.dumps(response), now, now)
+            )
+            
+            count = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM response_cache WHERE cache_key IN "
+                    "(SELECT cache_key FROM response_cache ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                self._increment(conn, 'evictions', count - self.max_entries)
+    
+    def stats(self) -> Dict:
+        """
+        Cache statistics aggregated across all workers
+        
+        Returns:
+            dict: {'entries', 'hits', 'misses', 'evictions', 'hit_rate'}
+        """
+        counters = {
+            row["name"]: row["value"]
+            for row in self._query("SELECT name, value FROM cache_counters")
+        }
+        entries = self._query("SELECT COUNT(*) AS n FROM response_cache")[0]["n"]
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        lookups = hits + misses
+        
+        return {
+            'entries': entries,
+            'hits': hits,
+            'misses': misses,
+            'evictions': counters.get('evictions', 0),
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0
+        }
+    
+    @staticmethod
+    def _increment(conn, name: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO cache_counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
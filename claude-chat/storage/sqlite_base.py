@@ -0,0 +1,73 @@
+"""
+SQLite Base - Shared connection handling for the local stores
+Each store keeps one WAL-mode connection per process (reopened after a
+gunicorn fork) so state is shared across workers without a server
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStore:
+    """
+    Base class for stores backed by a local SQLite file
+    """
+    
+    def __init__(self, path: str, schema: str):
+        """
+        Open the database and create its schema
+        
+        Args:
+            path: SQLite database file (created if missing)
+            schema: SQL script run once at startup (CREATE ... IF NOT EXISTS)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        with self._lock:
+            self._connection().executescript(schema)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Return this process's connection, reopening it after a fork"""
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=10,
+                isolation_level=None,  # Explicit transactions only
+                check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+    
+    @contextmanager
+    def _transaction(self):
+        """Run statements in one write transaction, rolling back on error"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        """Run a read query and return all rows"""
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
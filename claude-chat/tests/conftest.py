@@ -0,0 +1,9 @@
+"""
+Test setup - Import the app's packages (llm, storage, benchmarks) from the
+claude-chat directory, however pytest is invoked
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
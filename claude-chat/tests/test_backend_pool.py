@@ -0,0 +1,138 @@
+"""
+Ollama pool - Node selection checked against stub Ollama servers:
+sticky conversations, spread by requests in flight, failover when a node
+goes down, and preference for nodes that already hold the model
+"""
+
+import threading
+from typing import Callable, Dict
+
+import pytest
+
+from benchmarks.stubs import start_ollama_stub
+from llm.backend_pool import OllamaPool
+from llm.local_client import get_local_client
+
+GENERAL = "qwen2.5:14b"
+CODER = "qwen2.5-coder:14b"
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+# Long enough that concurrent requests overlap on the stubs
+DELAY = 0.3
+
+
+@pytest.fixture
+def start_node():
+    """Fn(models=None, preload=()) starting a stub node; returns (server, port)"""
+    servers = []
+    
+    def start(models=None, preload=()):
+        server, port = start_ollama_stub(DELAY, models=models)
+        servers.append(server)
+        for model in preload:
+            get_local_client(host="127.0.0.1", port=port, model=model).preload()
+        return server, port
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _pool(nodes, **kwargs) -> OllamaPool:
+    pool = OllamaPool([("127.0.0.1", port) for _, port in nodes], **kwargs)
+    pool.refresh()
+    return pool
+
+
+def _name(node) -> str:
+    return f"127.0.0.1:{node[1]}"
+
+
+def _served(pool: OllamaPool) -> Dict[str, int]:
+    return {name: node['served'] for name, node in pool.snapshot()['nodes'].items()}
+
+
+def _count(pool: OllamaPool, run: Callable[[], None]) -> Dict[str, int]:
+    """Requests each node served while run() ran"""
+    before = _served(pool)
+    run()
+    return {name: served - before[name] for name, served in _served(pool).items()}
+
+
+def _generate(pool: OllamaPool, model: str, conversation_id: str = None):
+    for _ in pool.stream_chat(model, conversation_id, MESSAGES, max_tokens=16):
+        pass
+
+
+def _concurrently(count: int, fn: Callable[[int], None]):
+    threads = [threading.Thread(target=fn, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_conversation_stays_on_one_node(start_node):
+    pool = _pool([start_node(preload=[GENERAL]) for _ in range(3)])
+    for conversation_id in ("conv-a", "conv-b", "conv-c"):
+        per_node = _count(pool, lambda: [_generate(pool, GENERAL, conversation_id) for _ in range(4)])
+        assert sorted(per_node.values()) == [0, 0, 4], f"{conversation_id} spread over {per_node}"
+
+
+def test_concurrent_requests_spread_by_outstanding(start_node):
+    pool = _pool([start_node(preload=[GENERAL]) for _ in range(3)])
+    per_node = _count(pool, lambda: _concurrently(6, lambda i: _generate(pool, GENERAL)))
+    assert sorted(per_node.values()) == [2, 2, 2]
+
+
+def test_sticky_conversations_stay_within_slack(start_node):
+    # Distinct conversations may prefer the same node, but only up to the slack
+    pool = _pool([start_node(preload=[GENERAL]) for _ in range(3)], sticky_slack=1)
+    per_node = _count(pool, lambda: _concurrently(9, lambda i: _generate(pool, GENERAL, f"conv-{i}")))
+    assert max(per_node.values()) - min(per_node.values()) <= 1, per_node
+
+
+def test_failover_moves_conversation_off_stopped_node(start_node):
+    nodes = [start_node(preload=[GENERAL]) for _ in range(3)]
+    pool = _pool(nodes, failure_threshold=1)
+    _generate(pool, GENERAL, "conv-x")
+    pinned = next(name for name, served in _served(pool).items() if served)
+    server = next(server for server, port in nodes if _name((server, port)) == pinned)
+    server.shutdown()
+    server.server_close()
+    
+    # The first request still goes to the stopped node; the app escalates it to Claude
+    with pytest.raises(Exception):
+        _generate(pool, GENERAL, "conv-x")
+    assert not pool.snapshot()['nodes'][pinned]['healthy']
+    
+    per_node = _count(pool, lambda: [_generate(pool, GENERAL, "conv-x") for _ in range(3)])
+    assert per_node[pinned] == 0
+    assert sorted(per_node.values()) == [0, 0, 3], f"conversation spread over {per_node}"
+    
+    # The next health probe keeps it out too
+    assert pool.refresh()
+    assert not pool.snapshot()['nodes'][pinned]['healthy']
+
+
+def test_prefers_node_with_model_loaded(start_node):
+    bare = start_node(models=[GENERAL])                          # Coder not installed
+    warm = start_node(models=[GENERAL, CODER], preload=[CODER])
+    cold = start_node(models=[GENERAL, CODER])                   # Installed, not loaded
+    pool = _pool([bare, warm, cold])
+    
+    per_node = _count(pool, lambda: [_generate(pool, CODER, f"code-{i}") for i in range(4)])
+    assert per_node[_name(warm)] == 4, per_node
+
+
+def test_overflow_only_to_nodes_with_model(start_node):
+    bare = start_node(models=[GENERAL])
+    warm = start_node(models=[GENERAL, CODER], preload=[CODER])
+    cold = start_node(models=[GENERAL, CODER])
+    pool = _pool([bare, warm, cold])
+    
+    # Past the slack, overflow goes to the cold node, never the one without the model
+    per_node = _count(pool, lambda: _concurrently(6, lambda i: _generate(pool, CODER)))
+    assert per_node[_name(bare)] == 0, per_node
+    assert per_node[_name(cold)] > 0, per_node
@@ -0,0 +1,29 @@
+"""
+Log pipeline copies - rag-agent-factory carries its own copy of
+log_pipeline.py, which must match this one apart from the module docstring
+"""
+
+import ast
+import os
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = os.path.join(APP_DIR, 'log_pipeline.py')
+COPY = os.path.join(APP_DIR, '..', 'rag-agent-factory', 'utils', 'log_pipeline.py')
+
+
+def _code(path):
+    """Module AST without its docstring (each copy's docstring names the other)"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    tree.body = tree.body[1:]
+    return ast.dump(tree)
+
+
+@pytest.mark.skipif(not os.path.exists(COPY), reason="rag-agent-factory not checked out")
+def test_copies_match():
+    assert _code(MODULE) == _code(COPY), (
+        "claude-chat/log_pipeline.py and rag-agent-factory/utils/log_pipeline.py "
+        "have drifted; apply the change to both"
+    )
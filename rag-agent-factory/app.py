@@ -12,19 +12,18 @@ from datetime import datetime
 from config.settings import Config
 from llm.ollama_client import OllamaClient
 from utils.error_handlers import handle_ollama_error, log_user_interaction
+from utils.log_pipeline import configure_logging
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ]
+# Set up logging: JSON lines written by a background thread, with the
+# interaction CSV kept in its own file (LOG_PIPELINE=sync for the old handlers)
+log_writer = configure_logging(
+    Config.LOG_FILE,
+    level=getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO),
+    side_files={'interactions': 'logs/interactions.log'}
 )
 logger = logging.getLogger(__name__)
 
@@ -9,6 +9,9 @@ from flask import jsonify
 
 logger = logging.getLogger(__name__)
 
+# CSV audit lines, written to logs/interactions.log by the logging pipeline
+interaction_log = logging.getLogger('interactions')
+
 def handle_ollama_error(error: Exception) -> tuple:
     """
     Handle Ollama-related errors with consistent formatting
@@ -42,14 +45,10 @@ def log_user_interaction(question: str, ip_address: str) -> None:
     """
     logger.info(f"User interaction - IP: {ip_address}, Question: {question[:100]}...")
     
-    # Simple file logging for Phase 1
+    # Simple CSV tracking for Phase 1, queued like any other log record
     # Future phases will use more sophisticated tracking
-    try:
-        with open('logs/interactions.log', 'a') as f:
-            timestamp = datetime.now().isoformat()
-            f.write(f"{timestamp},{ip_address},{question[:200]}\n")
-    except Exception as e:
-        logger.warning(f"Failed to log interaction: {str(e)}")
+    timestamp = datetime.now().isoformat()
+    interaction_log.info(f"{timestamp},{ip_address},{question[:200]}")
 
 def validate_question(question: str) -> tuple:
     """
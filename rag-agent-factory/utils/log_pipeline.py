@@ -0,0 +1,269 @@
+"""
+Log Pipeline - Queue-backed structured logging
+Request threads only put records on an in-memory queue; one background
+writer formats them as JSON lines and writes them to a size-rotated file,
+so disk flushes never land on the request path. High-volume INFO lines
+can be sampled per route, and records are dropped rather than blocking
+if the writer falls behind. Under gevent workers the writer is a real OS
+thread, so a slow disk does not stall the worker's event loop either
+
+This is a copy of claude-chat/log_pipeline.py: each app is built from its
+own directory, so the two cannot import a shared file. Change both
+together; claude-chat's tests/test_log_pipeline.py fails if they drift
+"""
+
+import atexit
+import json
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, RotatingFileHandler
+from typing import Dict, Iterable, Optional
+
+from flask import has_request_context, request
+
+try:
+    from gevent.monkey import get_original
+except ImportError:
+    def get_original(module, name):
+        return getattr(__import__(module), name)
+
+# Unpatched primitives: a greenlet writer would still block the event loop
+_start_native_thread = get_original('_thread', 'start_new_thread')
+_native_lock = get_original('_thread', 'allocate_lock')
+_NativeQueue = get_original('queue', 'SimpleQueue')
+
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came from `extra=` and is kept
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'route'}
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """
+    Parse "endpoint=rate,..." (e.g. "health_check=0.01,index=0.1")
+    
+    Returns:
+        dict: Flask endpoint -> fraction of INFO records kept
+    """
+    rates = {}
+    for part in spec.split(','):
+        endpoint, _, rate = part.strip().partition('=')
+        if endpoint and rate:
+            rates[endpoint] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class RouteSampler(logging.Filter):
+    """
+    Tags records with the Flask endpoint and samples INFO-and-below per route
+    Runs on the request thread, before the record is queued
+    """
+    
+    def __init__(self, rates: Dict[str, float], exempt: Iterable[str] = ()):
+        super().__init__()
+        self.rates = rates
+        self.exempt = set(exempt)
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.route = request.endpoint if has_request_context() else None
+        if (record.levelno > logging.INFO or record.route not in self.rates
+                or record.name in self.exempt):
+            return True
+        return random.random() < self.rates[record.route]
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'route': getattr(record, 'route', None),
+            'pid': record.process,
+            'thread': record.threadName
+        }
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Queues records without waiting; counts what a full queue had to drop"""
+    
+    def __init__(self, log_queue, max_size: int):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback here, where the arguments are
+        # still valid, but leave JSON formatting to the writer thread
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+        else:
+            self.queue.put(record)
+
+
+class LogWriter:
+    """
+    Background thread draining the queue into the real handlers
+    """
+    
+    def __init__(self, log_queue, source: _NonBlockingQueueHandler, handlers):
+        """
+        Initialize writer
+        
+        Args:
+            log_queue: Queue filled by the request-side handler
+            source: That handler, read for its drop count
+            handlers: Handlers that format and write each record
+        """
+        self.queue = log_queue
+        self.source = source
+        self.handlers = handlers
+        self._reported = 0
+        self._finished = None
+    
+    def start(self):
+        """Start the writer thread"""
+        self._finished = _native_lock()
+        self._finished.acquire()
+        _start_native_thread(self._run, ())
+    
+    def stop(self, timeout: float = 5):
+        """Write out everything already queued, then stop"""
+        if self._finished is None:
+            return
+        self.queue.put(None)
+        self._finished.acquire(timeout=timeout)
+        self._finished = None
+    
+    def _run(self):
+        try:
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    return
+                self._report_drops()
+                self._emit(record)
+        finally:
+            self._finished.release()
+    
+    def _report_drops(self):
+        dropped = self.source.dropped
+        if dropped > self._reported:
+            self._emit(logging.LogRecord(
+                __name__, logging.WARNING, __file__, 0,
+                f"Log queue full; dropped {dropped - self._reported} records", None, None
+            ))
+            self._reported = dropped
+    
+    def _emit(self, record: logging.LogRecord):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def _only(names):
+    return lambda record: record.name in names
+
+
+def _except(names):
+    return lambda record: record.name not in names
+
+
+def configure_logging(
+    log_file: str,
+    level: int = logging.INFO,
+    side_files: Optional[Dict[str, str]] = None
+) -> Optional[LogWriter]:
+    """
+    Install the logging pipeline on the root logger
+    
+    Settings come from the environment:
+        LOG_PIPELINE: "queue" (default) or "sync" for the old blocking handlers
+        LOG_MAX_BYTES / LOG_BACKUP_COUNT: Rotation size and files kept
+        LOG_QUEUE_SIZE: Records buffered before new ones are dropped
+        LOG_SAMPLE_RATES: "endpoint=rate,..." share of INFO lines kept per route
+    
+    Args:
+        log_file: JSON log path
+        level: Root log level
+        side_files: Logger name -> path for records written verbatim to their
+            own file, kept out of the main log and never sampled (e.g. CSV
+            audit lines)
+    
+    Returns:
+        LogWriter: The running writer, or None in sync mode
+    """
+    side_files = side_files or {}
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+    
+    if os.getenv('LOG_PIPELINE', 'queue') == 'sync':
+        logging.basicConfig(
+            level=level,
+            format=CONSOLE_FORMAT,
+            handlers=[logging.FileHandler(log_file), logging.StreamHandler()]
+        )
+        for name, path in side_files.items():
+            side_handler = logging.FileHandler(path)
+            side_handler.setFormatter(logging.Formatter('%(message)s'))
+            side_logger = logging.getLogger(name)
+            side_logger.addHandler(side_handler)
+            side_logger.propagate = False
+        return None
+    
+    max_bytes = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    backup_count = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.setFormatter(JSONFormatter())
+    file_handler.addFilter(_except(side_files))
+    
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    console_handler.addFilter(_except(side_files))
+    
+    handlers = [file_handler, console_handler]
+    for name, path in side_files.items():
+        side_handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        side_handler.setFormatter(logging.Formatter('%(message)s'))
+        side_handler.addFilter(_only({name}))
+        handlers.append(side_handler)
+    
+    log_queue = _NativeQueue()
+    queue_handler = _NonBlockingQueueHandler(log_queue, int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    queue_handler.addFilter(
+        RouteSampler(parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', '')), exempt=side_files)
+    )
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    
+    writer = LogWriter(log_queue, queue_handler, handlers)
+    writer.start()
+    atexit.register(writer.stop)  # Flush what is still queued on shutdown
+    return writer